@@ -0,0 +1,84 @@
+"""
+Benchmark for the audio front end.
+Reports the CPU time the DSP stage costs per second of captured audio.
+
+Usage:
+    python benchmarks/bench_front_end.py [--seconds 30]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from k_on_k.audio_capture.dsp import AudioFrontEnd
+from k_on_k.config.settings import get_default_config
+
+# (capture rate, channels, high-pass, gain normalization)
+SCENARIOS = [
+    (16000, 1, False, False),
+    (16000, 1, True, False),
+    (44100, 1, True, False),
+    (48000, 2, True, False),
+    (48000, 2, True, True),
+    (48000, 4, True, True),
+]
+
+
+def bench(rate: int, channels: int, highpass: bool, gain: bool, seconds: float, block_ms: float = 64.0):
+    """
+    Run one scenario and return CPU seconds per audio second for both sides of the stage.
+
+    Args:
+        rate: Capture sample rate
+        channels: Capture channel count
+        highpass: Enable the high-pass filter
+        gain: Enable gain normalization
+        seconds: Seconds of synthetic audio to push through
+        block_ms: Callback block duration
+
+    Returns:
+        Tuple of (callback-side cost, consumer-side cost)
+    """
+    config = get_default_config()
+    config["audio"]["front_end"]["highpass_hz"] = 80.0 if highpass else 0
+    config["audio"]["front_end"]["normalize_gain"] = gain
+    front_end = AudioFrontEnd(config, rate, channels)
+
+    block = int(rate * block_ms / 1000)
+    rng = np.random.default_rng(0)
+    blocks = [(0.1 * rng.standard_normal((block, channels))).astype(np.float32) for _ in range(16)]
+    mix_buffer = np.zeros(block, dtype=np.float32)
+    n_blocks = int(seconds * 1000 / block_ms)
+
+    downmix_time = 0.0
+    process_time = 0.0
+    for i in range(n_blocks):
+        start = time.process_time()
+        mono = front_end.downmix(blocks[i % len(blocks)], mix_buffer)
+        mid = time.process_time()
+        front_end.process(mono)
+        downmix_time += mid - start
+        process_time += time.process_time() - mid
+
+    audio_seconds = n_blocks * block / rate
+    return downmix_time / audio_seconds, process_time / audio_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0, help="Seconds of audio per scenario")
+    args = parser.parse_args()
+
+    print(f"{'capture':>14} {'hpf':>4} {'agc':>4} {'callback ms/s':>14} {'consumer ms/s':>14} {'% core':>7}")
+    for rate, channels, highpass, gain in SCENARIOS:
+        callback_cost, consumer_cost = bench(rate, channels, highpass, gain, args.seconds)
+        total = callback_cost + consumer_cost
+        print(
+            f"{rate:>8} Hz x{channels} {'on' if highpass else 'off':>4} {'on' if gain else 'off':>4} "
+            f"{callback_cost * 1000:>14.3f} {consumer_cost * 1000:>14.3f} {total * 100:>6.2f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark for the text insertion backends.
+Types sample sentences into a local Tk text window, which stands in for the
+target application, and reports throughput and end-to-end latency per backend.
+Needs a graphical session (an Xvfb display works for the X11 backends).
+
+Usage:
+    python benchmarks/bench_insertion.py [--backends xdotool,pynput] [--repeats 5]
+"""
+
+import argparse
+import threading
+import time
+import tkinter as tk
+
+from k_on_k.config.settings import get_default_config
+from k_on_k.text_insertion.backends import AUTO_ORDER, BackendSelector
+
+SENTENCE = "The quick brown fox jumps over the lazy dog, again and again. "
+LENGTHS = (20, 100, 400)
+
+# Longest wait for text to arrive in the target window
+ARRIVAL_TIMEOUT_S = 30.0
+
+
+class Target:
+    """Focused Tk text window that records when typed text has fully arrived."""
+
+    def __init__(self):
+        self.root = tk.Tk()
+        self.root.title("kitten-on-keys insertion benchmark")
+        self.text = tk.Text(self.root, width=100, height=20)
+        self.text.pack()
+        self.root.update()
+        self.root.focus_force()
+        self.text.focus_set()
+        self.root.update()
+
+    def content(self) -> str:
+        return self.text.get("1.0", "end-1c")
+
+    def clear(self):
+        self.text.delete("1.0", "end")
+        self.root.update()
+
+    def wait_for(self, expected: str, timeout: float) -> float:
+        """
+        Process window events until the expected text is shown.
+
+        Returns:
+            time.perf_counter() when the text arrived, or None on timeout
+        """
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            self.root.update()
+            if len(self.content()) >= len(expected):
+                return time.perf_counter()
+            time.sleep(0.0005)
+        return None
+
+
+def bench(backend, target: Target, text: str, repeats: int):
+    """
+    Type text repeatedly and measure it.
+
+    Returns:
+        Tuple of (median call time, median end-to-end latency, failed repeats)
+    """
+    call_times, latencies = [], []
+    failures = 0
+    for _ in range(repeats):
+        target.clear()
+        returned = []
+
+        def insert():
+            backend.type_text(text)
+            returned.append(time.perf_counter())
+
+        start = time.perf_counter()
+        worker = threading.Thread(target=insert)
+        worker.start()
+        arrived = target.wait_for(text, ARRIVAL_TIMEOUT_S)
+        worker.join()
+        # Let late or extra key events land before comparing
+        target.root.after(50)
+        target.root.update()
+
+        if arrived is None or target.content() != text:
+            failures += 1
+            continue
+        call_times.append(returned[0] - start)
+        latencies.append(arrived - start)
+
+    def median(values):
+        return sorted(values)[len(values) // 2] if values else float("nan")
+
+    return median(call_times), median(latencies), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(AUTO_ORDER + ("clipboard",)), help="Backends to compare")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per text length")
+    args = parser.parse_args()
+
+    selector = BackendSelector(get_default_config())
+    target = Target()
+
+    print(f"{'backend':>10} {'chars':>6} {'call ms':>9} {'end-to-end ms':>14} {'chars/s':>9} {'failed':>7}")
+    for name in args.backends.split(","):
+        backend = selector.create(name)
+        if backend is None:
+            print(f"{name:>10}  unavailable")
+            continue
+        for length in LENGTHS:
+            text = (SENTENCE * (length // len(SENTENCE) + 1))[:length]
+            call_time, latency, failures = bench(backend, target, text, args.repeats)
+            print(
+                f"{name:>10} {length:>6} {call_time * 1000:>9.1f} {latency * 1000:>14.1f} "
+                f"{length / latency:>9.0f} {failures:>4}/{args.repeats}"
+            )
+
+    selector.close()
+    target.root.destroy()
+
+
+if __name__ == "__main__":
+    main()
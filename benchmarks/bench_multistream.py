@@ -0,0 +1,156 @@
+"""
+Load test for the model server with several concurrent audio streams.
+Loads the configured model once, serves it on a temporary socket, and replays a
+recording from several clients at once, each as its own streaming session at
+its own offset. Every session first dictates a lead-in and commits it, so the
+measured passes prompt with their own committed text, as in a running daemon.
+Reports per-stream request latency against the server's SLO, the spread
+between streams, throughput and the windows per decoder call the server reached.
+
+Usage:
+    python benchmarks/bench_multistream.py dictation.wav [--streams 1,2,4,8] [--seconds 30] [--lead-in 5] [--fast]
+"""
+
+import argparse
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from k_on_k.config.settings import load_config
+from k_on_k.metrics import LatencyStats
+from k_on_k.speech_recognition.model_server import ModelServer, ModelServerClient
+from k_on_k.speech_recognition.service import create_engine
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE
+from k_on_k.speech_recognition.tuner import load_clip
+
+
+def replay(
+    config,
+    audio: np.ndarray,
+    lead_in_s: float,
+    offset_s: float,
+    realtime: bool,
+    stats: LatencyStats,
+    started: threading.Barrier,
+):
+    """
+    Dictate the clip through one client the way the recognizer would.
+
+    The lead-in is committed first, unmeasured; the clip is dictated once all
+    streams are past their lead-in. A pass is requested for every
+    scheduler.min_interval_s of audio, and the session is flushed at the end.
+    In real time, passes are paced by the audio clock, so a slow reply delays
+    the next pass as it would in the daemon.
+    """
+    client = ModelServerClient(config)
+    client.connect()
+    block = int(config["speech_recognition"]["scheduler"]["min_interval_s"] * SAMPLE_RATE)
+    # Each stream starts at a different point of the clip, so speech doesn't line up
+    audio = np.roll(audio, -int(offset_s * SAMPLE_RATE))
+    # The lead-in is what the stream dictated just before, i.e. the end of its loop
+    lead_in = audio[len(audio) - int(lead_in_s * SAMPLE_RATE):]
+
+    try:
+        client.insert_audio(lead_in)
+        client.flush()
+        started.wait()
+        start_at = time.perf_counter()
+        for index, offset in enumerate(range(0, len(audio), block)):
+            if realtime:
+                delay = start_at + (index + 1) * block / SAMPLE_RATE - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            client.insert_audio(audio[offset:offset + block])
+            start_time = time.perf_counter()
+            client.process_iter()
+            stats.add(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        client.flush()
+        stats.add(time.perf_counter() - start_time)
+    finally:
+        client.stop()
+
+
+def run(config, engine, audio: np.ndarray, lead_in_s: float, streams: int, realtime: bool):
+    """Serve one model to `streams` concurrent clients and report the latencies they saw."""
+    server = ModelServer(config, engine=engine)
+    server.start()
+    stats = [LatencyStats(f"Stream {index}") for index in range(streams)]
+    measured_from = []
+
+    def start_measuring():
+        """Forget what the lead-ins cost (runs once every stream has committed its lead-in)."""
+        server.latency_stats.reset()
+        server.slo_misses = server.decoded_windows = server.decodes = 0
+        measured_from.append(time.perf_counter())
+
+    started = threading.Barrier(streams, action=start_measuring)
+    threads = [
+        threading.Thread(
+            target=replay,
+            args=(config, audio, lead_in_s, index * len(audio) / SAMPLE_RATE / streams, realtime, stats[index], started),
+        )
+        for index in range(streams)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - measured_from[0]
+    server.stop()
+
+    slo_ms = config["speech_recognition"]["server"]["latency_slo_ms"]
+    for stream in stats:
+        summary = stream.summary()
+        late = sum(latency * 1000 > slo_ms for latency in stream.recent)
+        print(
+            f"  {stream.name:<10} p50 {summary['p50_ms']:>7.0f} ms  p95 {summary['p95_ms']:>7.0f} ms  "
+            f"max {summary['max_ms']:>7.0f} ms  over SLO {late}/{summary['count']}"
+        )
+
+    # Jain's fairness index over the streams' mean latencies: 1.0 when all streams wait equally
+    means = np.array([stream.summary()["mean_ms"] for stream in stats])
+    fairness = means.sum() ** 2 / (len(means) * (means ** 2).sum()) if means.any() else 1.0
+    audio_s = streams * len(audio) / SAMPLE_RATE
+    print(
+        f"  {streams} streams: {audio_s / elapsed:.1f}x real time over {elapsed:.1f}s, "
+        f"{server.slo_misses} requests over the {slo_ms:.0f} ms SLO, fairness {fairness:.2f}, "
+        f"{server.decoded_windows / max(server.decodes, 1):.1f} windows per decoder call"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="WAV recording of dictation to replay on every stream")
+    parser.add_argument("--streams", default="1,2,4", help="comma-separated stream counts to test")
+    parser.add_argument("--seconds", type=float, default=30.0, help="audio per stream; the clip is looped or cut")
+    parser.add_argument(
+        "--lead-in", type=float, default=5.0, help="seconds each stream commits before measuring, to set its prompt"
+    )
+    parser.add_argument("--fast", action="store_true", help="send audio as fast as replies come instead of in real time")
+    parser.add_argument("--batch-wait-ms", type=float, help="override speech_recognition.server.batch_wait_ms")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    config = load_config()
+    server_config = config["speech_recognition"]["server"]
+    server_config["socket_path"] = str(Path(tempfile.mkdtemp()) / "stt.sock")
+    if args.batch_wait_ms is not None:
+        server_config["batch_wait_ms"] = args.batch_wait_ms
+
+    clip = load_clip(args.clip)
+    audio = np.resize(clip, int(args.seconds * SAMPLE_RATE)).astype(np.float32)
+    print(f"Loading the configured model ({config['speech_recognition']['engine']})")
+    engine = create_engine(config)
+
+    for streams in [int(count) for count in args.streams.split(",")]:
+        print(f"{streams} streams of {args.seconds:.0f}s, {'as fast as possible' if args.fast else 'in real time'}:")
+        run(config, engine, audio, min(args.lead_in, args.seconds), streams, realtime=not args.fast)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark for text post-processing.
+Compares the compiled single-pass post-processor with the chained regex
+pipeline it replaced, extended the obvious way with one substitution per
+dictionary entry, at growing custom vocabulary sizes.
+
+Usage:
+    python benchmarks/bench_postprocess.py [--fragments 2000]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from k_on_k.config.settings import get_default_config
+from k_on_k.text_insertion.postprocess import TextPostProcessor
+
+DICTIONARY_SIZES = (0, 1000, 10000, 100000)
+
+SENTENCES = [
+    "so the next step is to open the config file comma then restart the daemon period",
+    "we measured three point one four milliseconds e.g. on the laptop",
+    "new line the quick brown fox jumps over the lazy dog",
+    "call the kubernetes operator open parenthesis version two close parenthesis",
+    "is the latency really that bad question mark",
+]
+
+
+class LegacyPipeline:
+    """The previous chained regex pipeline plus one substitution per phrase."""
+
+    def __init__(self, config, replacements):
+        punctuation = config["speech_recognition"]["punctuation_commands"]
+        phrases = {**replacements, **punctuation}
+        self.patterns = [
+            (re.compile(r"\b" + re.escape(spoken) + r"\b", re.IGNORECASE), written)
+            for spoken, written in phrases.items()
+        ]
+
+    def process(self, text: str) -> str:
+        for pattern, written in self.patterns:
+            text = pattern.sub(lambda _: written, text)
+        text = text[0].upper() + text[1:] if text else ""
+        text = re.sub(r"([.!?:;,])([^\s\d])", r"\1 \2", text)
+        text = re.sub(r"\s+([.!?:;,])", r"\1", text)
+        text = re.sub(r"\s{2,}", " ", text)
+        return text
+
+
+def make_dictionary(size: int, rng: random.Random):
+    """Return `size` random one to three word phrases mapped to written forms."""
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    dictionary = {}
+    while len(dictionary) < size:
+        words = ["".join(rng.choices(alphabet, k=rng.randint(3, 9))) for _ in range(rng.randint(1, 3))]
+        dictionary[" ".join(words)] = "-".join(words).upper()
+    return dictionary
+
+
+def bench(processor, fragments):
+    """Return mean microseconds per fragment."""
+    start = time.perf_counter()
+    for fragment in fragments:
+        processor.process(fragment)
+    return (time.perf_counter() - start) / len(fragments) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fragments", type=int, default=2000, help="Fragments processed per measurement")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    fragments = [SENTENCES[i % len(SENTENCES)] for i in range(args.fragments)]
+
+    print(f"{'entries':>8} {'build ms':>9} {'compiled us':>12} {'legacy us':>10} {'speedup':>8}")
+    for size in DICTIONARY_SIZES:
+        config = get_default_config()
+        config["text_insertion"]["replacements"] = make_dictionary(size, rng)
+
+        start = time.perf_counter()
+        compiled = TextPostProcessor(config)
+        build_time = time.perf_counter() - start
+        legacy = LegacyPipeline(config, config["text_insertion"]["replacements"])
+
+        compiled_us = bench(compiled, fragments)
+        # The legacy pipeline is slow enough at large sizes to sample fewer fragments
+        legacy_us = bench(legacy, fragments[: max(len(fragments) * 1000 // max(size, 1000), 20)])
+        print(
+            f"{size:>8} {build_time * 1000:>9.1f} {compiled_us:>12.1f} {legacy_us:>10.1f} "
+            f"{legacy_us / compiled_us:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for the wake-word spotter.
+Enrolls templates from recordings of the wake word, replays audio through the
+spotter as the capture service would deliver it, and reports its CPU cost,
+false triggers on audio without the wake word and hits on audio with it.
+
+Usage:
+    python benchmarks/bench_wake_word.py --templates take1.wav,take2.wav --negatives dictation.wav [--positives wake.wav]
+"""
+
+import argparse
+import time
+
+from k_on_k.audio_capture.sources import read_wav
+from k_on_k.config.settings import get_default_config
+from k_on_k.speech_recognition.wake_word import WakeWordSpotter, record_template
+
+# Capture block, as configured by default (audio.chunk_size at 16 kHz)
+BLOCK_MS = 64
+
+
+def replay(config, templates, path: str):
+    """
+    Run one file through a fresh spotter.
+
+    Returns:
+        Tuple of (audio seconds, CPU seconds, detections)
+    """
+    samples, rate = read_wav(path)
+    mono = samples.mean(axis=1).astype("float32")
+    spotter = WakeWordSpotter(config, rate)
+    spotter.set_templates(templates)
+
+    block = rate * BLOCK_MS // 1000
+    start = time.process_time()
+    for offset in range(0, len(mono), block):
+        spotter.front_end.process(mono[offset:offset + block])
+    return len(mono) / rate, time.process_time() - start, spotter.detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--templates", required=True, help="Comma-separated recordings of the wake word to enroll")
+    parser.add_argument("--negatives", required=True, help="Comma-separated recordings without the wake word")
+    parser.add_argument("--positives", default="", help="Comma-separated recordings that each contain the wake word once")
+    parser.add_argument("--threshold", type=float, help="Detection threshold (default from the configuration)")
+    args = parser.parse_args()
+
+    config = get_default_config()
+    spotter_config = config["speech_recognition"]["wake_word_spotter"]
+    if args.threshold is not None:
+        spotter_config["threshold"] = args.threshold
+
+    templates = [record_template(path, spotter_config["silence_rms"]) for path in args.templates.split(",")]
+    print(f"{len(templates)} templates, threshold {spotter_config['threshold']}")
+
+    print(f"{'file':>30} {'audio s':>8} {'ms/s':>7} {'% core':>7} {'detections':>11}")
+    total_audio = total_cpu = false_triggers = 0.0
+    for path in args.negatives.split(","):
+        audio_s, cpu_s, detections = replay(config, templates, path)
+        total_audio += audio_s
+        total_cpu += cpu_s
+        false_triggers += detections
+        print(f"{path[-30:]:>30} {audio_s:>8.1f} {cpu_s / audio_s * 1000:>7.2f} {cpu_s / audio_s:>7.2%} {detections:>11}")
+    negative_hours = total_audio / 3600
+
+    hits = 0
+    positives = [path for path in args.positives.split(",") if path]
+    for path in positives:
+        audio_s, cpu_s, detections = replay(config, templates, path)
+        total_audio += audio_s
+        total_cpu += cpu_s
+        hits += detections > 0
+        print(f"{path[-30:]:>30} {audio_s:>8.1f} {cpu_s / audio_s * 1000:>7.2f} {cpu_s / audio_s:>7.2%} {detections:>11}")
+
+    print(f"CPU: {total_cpu / total_audio:.2%} of a core")
+    print(f"False triggers: {false_triggers:.0f} ({false_triggers / max(negative_hours, 1e-9):.1f} per hour of audio)")
+    if positives:
+        print(f"Detected: {hits}/{len(positives)}")
+
+
+if __name__ == "__main__":
+    main()
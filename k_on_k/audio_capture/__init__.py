@@ -1,5 +1,6 @@
 """Audio capture package for Kitten on Keys."""
 
 from k_on_k.audio_capture.service import AudioCaptureService
+from k_on_k.audio_capture.vad import VoiceActivityDetector
 
-__all__ = ["AudioCaptureService"]
+__all__ = ["AudioCaptureService", "VoiceActivityDetector"]
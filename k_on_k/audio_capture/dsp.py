@@ -0,0 +1,271 @@
+"""
+Audio front-end DSP for Kitten on Keys.
+Downmixes native-format capture and converts it to the recognizer's 16 kHz mono stream.
+"""
+
+import logging
+import math
+from typing import Callable, Dict, Any, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Block length for the vectorized one-pole filter; keeps the scaled cumulative sum well conditioned
+IIR_BLOCK = 256
+
+
+class PolyphaseResampler:
+    """
+    Rational-ratio polyphase FIR resampler that keeps its state across blocks.
+    All output samples of a block are computed with one vectorized gather.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, half_width: int = 16):
+        """
+        Initialize the resampler.
+
+        Args:
+            src_rate: Input sample rate in Hz
+            dst_rate: Output sample rate in Hz
+            half_width: Zero crossings of the windowed-sinc prototype on each side
+        """
+        g = math.gcd(int(src_rate), int(dst_rate))
+        self.up = int(dst_rate) // g
+        self.down = int(src_rate) // g
+        self.passthrough = self.up == self.down
+
+        # Windowed-sinc low-pass prototype at the upsampled rate, cut below both Nyquist limits
+        stretch = max(self.up, self.down)
+        length = 2 * half_width * stretch + 1
+        cutoff = 0.9 / (2 * stretch)
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0) * self.up
+
+        # Split into polyphase branches: phases[p, k] = prototype[p + k * up]
+        self.taps = -(-length // self.up)
+        padded = np.zeros(self.taps * self.up)
+        padded[:length] = prototype
+        self.phases = padded.reshape(self.taps, self.up).T.astype(np.float32)
+        self.tap_offsets = np.arange(self.taps)
+
+        self.reset()
+
+    def reset(self):
+        """Forget the filter history."""
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.time = 0  # Upsampled-rate position of the next output, relative to the next block
+
+    def process(self, audio_data: np.ndarray) -> np.ndarray:
+        """
+        Resample a block of mono audio.
+
+        Args:
+            audio_data: Input samples at the source rate
+
+        Returns:
+            Output samples at the destination rate
+        """
+        if self.passthrough:
+            return audio_data
+
+        extended = np.concatenate((self.history, audio_data))
+        span = self.up * len(audio_data)
+        n_out = max(0, -(-(span - self.time) // self.down))
+
+        positions = self.time + self.down * np.arange(n_out)
+        newest = positions // self.up + (self.taps - 1)
+        gathered = extended[newest[:, None] - self.tap_offsets]
+        output = np.einsum("ij,ij->i", gathered, self.phases[positions % self.up])
+
+        self.time += self.down * n_out - span
+        self.history = extended[len(extended) - (self.taps - 1):]
+        return output.astype(np.float32, copy=False)
+
+
+class HighPassFilter:
+    """
+    First-order high-pass filter.
+    The recursion is evaluated per block with a scaled cumulative sum instead of a Python loop.
+    """
+
+    def __init__(self, sample_rate: int, cutoff_hz: float):
+        """
+        Initialize the filter.
+
+        Args:
+            sample_rate: Sample rate in Hz
+            cutoff_hz: -3 dB cutoff frequency in Hz
+        """
+        rc = 1.0 / (2 * math.pi * cutoff_hz)
+        self.alpha = rc / (rc + 1.0 / sample_rate)
+        # Unrolled y[n] = alpha * (y[n-1] + x[n] - x[n-1]) within a block:
+        # y[n] = alpha^(n+1) * (y[-1] + sum_{k<=n} alpha^-k * (x[k] - x[k-1]))
+        self.inverse_powers = self.alpha ** -np.arange(IIR_BLOCK, dtype=np.float64)
+        self.powers = self.alpha ** np.arange(1, IIR_BLOCK + 1, dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        """Forget the filter state."""
+        self.last_input = 0.0
+        self.last_output = 0.0
+
+    def process(self, audio_data: np.ndarray) -> np.ndarray:
+        """
+        Filter a block of audio.
+
+        Args:
+            audio_data: Input samples
+
+        Returns:
+            Filtered samples
+        """
+        output = np.empty(len(audio_data), dtype=np.float32)
+        for start in range(0, len(audio_data), IIR_BLOCK):
+            block = audio_data[start:start + IIR_BLOCK].astype(np.float64)
+            n = len(block)
+            delta = np.diff(block, prepend=self.last_input)
+            scaled = np.cumsum(delta * self.inverse_powers[:n])
+            result = self.powers[:n] * (self.last_output + scaled)
+            output[start:start + n] = result
+            self.last_input = block[-1]
+            self.last_output = result[-1]
+        return output
+
+
+class GainNormalizer:
+    """
+    Slow automatic gain control towards a target RMS level.
+    Gain changes are ramped across each block to avoid zipper noise.
+    """
+
+    def __init__(self, target_rms_db: float = -25.0, max_gain_db: float = 20.0, smoothing: float = 0.05):
+        """
+        Initialize the gain normalizer.
+
+        Args:
+            target_rms_db: Target RMS level in dBFS
+            max_gain_db: Largest gain applied, so silence isn't blown up into noise
+            smoothing: Fraction of the way the level estimate moves per block
+        """
+        self.target_rms = 10 ** (target_rms_db / 20)
+        self.max_gain = 10 ** (max_gain_db / 20)
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        """Forget the level estimate."""
+        self.level = self.target_rms
+        self.gain = 1.0
+
+    def process(self, audio_data: np.ndarray) -> np.ndarray:
+        """
+        Apply gain to a block of audio.
+
+        Args:
+            audio_data: Input samples
+
+        Returns:
+            Gain-adjusted samples
+        """
+        if not len(audio_data):
+            return audio_data
+
+        rms = float(np.sqrt(np.mean(audio_data * audio_data)))
+        self.level += self.smoothing * (rms - self.level)
+        gain = min(self.target_rms / max(self.level, 1e-6), self.max_gain)
+
+        ramp = np.linspace(self.gain, gain, len(audio_data), dtype=np.float32)
+        self.gain = gain
+        return np.clip(audio_data * ramp, -1.0, 1.0)
+
+
+class AudioFrontEnd:
+    """
+    DSP stage between native-format capture and the recognizer.
+    Downmixes in the capture callback, then resamples, filters and normalizes on the consumer side.
+    """
+
+    def __init__(self, config: Dict[str, Any], capture_rate: int, capture_channels: int):
+        """
+        Initialize the front end.
+
+        Args:
+            config: Application configuration dict
+            capture_rate: Sample rate the device is opened at
+            capture_channels: Channel count the device is opened with
+        """
+        self.output_rate = config["audio"]["sample_rate"]
+        front_end_config = config["audio"].get("front_end", {})
+        self.capture_rate = capture_rate
+        self.capture_channels = capture_channels
+
+        self.downmix_weights = self._downmix_weights(front_end_config.get("downmix_weights"))
+        self.resampler = PolyphaseResampler(
+            capture_rate, self.output_rate, front_end_config.get("resampler_half_width", 16)
+        )
+
+        highpass_hz = front_end_config.get("highpass_hz", 80.0)
+        self.highpass = HighPassFilter(self.output_rate, highpass_hz) if highpass_hz else None
+        self.gain = None
+        if front_end_config.get("normalize_gain", False):
+            self.gain = GainNormalizer(
+                front_end_config.get("target_rms_db", -25.0),
+                front_end_config.get("max_gain_db", 20.0),
+            )
+
+        # Callback receiving the processed 16 kHz mono audio
+        self.on_audio: Optional[Callable[[np.ndarray], None]] = None
+
+    def _downmix_weights(self, weights: Optional[List[float]]) -> np.ndarray:
+        """Validate configured downmix weights, defaulting to an equal average."""
+        if weights is not None and len(weights) != self.capture_channels:
+            logger.warning(
+                f"Expected {self.capture_channels} downmix weights, got {len(weights)}; averaging channels"
+            )
+            weights = None
+        if weights is None:
+            weights = [1.0 / self.capture_channels] * self.capture_channels
+        return np.asarray(weights, dtype=np.float32)
+
+    def downmix(self, indata: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """
+        Mix a multichannel block down to mono without allocating.
+
+        Args:
+            indata: Block of shape (frames, channels) from the capture callback
+            out: Preallocated float32 buffer of at least `frames` samples
+
+        Returns:
+            View of `out` holding the mono block
+        """
+        mono = out[:len(indata)]
+        if self.capture_channels == 1:
+            mono[:] = indata[:, 0]
+        else:
+            np.dot(indata, self.downmix_weights, out=mono)
+        return mono
+
+    def reset(self):
+        """Reset all filter state, e.g. when dictation starts."""
+        self.resampler.reset()
+        if self.highpass:
+            self.highpass.reset()
+        if self.gain:
+            self.gain.reset()
+
+    def process(self, audio_data: np.ndarray):
+        """
+        Convert a block of capture-rate mono audio and pass it on.
+
+        Args:
+            audio_data: Mono samples at the capture rate
+        """
+        audio = self.resampler.process(audio_data)
+        if self.highpass:
+            audio = self.highpass.process(audio)
+        if self.gain:
+            audio = self.gain.process(audio)
+
+        if len(audio) and self.on_audio:
+            self.on_audio(audio)
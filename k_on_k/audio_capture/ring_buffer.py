@@ -0,0 +1,192 @@
+"""
+Lock-free audio ring buffer for Kitten on Keys.
+Carries audio from the PortAudio callback to the recognizer thread without per-block allocations.
+"""
+
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AudioRingBuffer:
+    """
+    Preallocated single-producer/single-consumer float32 ring buffer.
+
+    The producer (audio callback) only advances the write index and the consumer
+    (recognizer) only advances the read index, so no lock is needed. Indices
+    grow monotonically; the buffer position is the index modulo the capacity.
+
+    Samples and indices can live in caller-provided storage, e.g. a shared memory
+    segment, so the consumer may run in another process.
+    """
+
+    def __init__(self, capacity: int, buffer: Optional[np.ndarray] = None, indices: Optional[np.ndarray] = None):
+        """
+        Initialize the ring buffer.
+
+        Args:
+            capacity: Number of samples the buffer can hold
+            buffer: Optional float32 storage of `capacity` samples
+            indices: Optional int64 storage for the [write, read] indices
+        """
+        self.capacity = capacity
+        self.buffer = buffer if buffer is not None else np.zeros(capacity, dtype=np.float32)
+        self.indices = indices if indices is not None else np.zeros(2, dtype=np.int64)
+        self.overruns = 0  # Samples dropped because the consumer fell behind
+
+    @property
+    def write_index(self) -> int:
+        """Total number of samples ever written."""
+        return int(self.indices[0])
+
+    @write_index.setter
+    def write_index(self, value: int):
+        self.indices[0] = value
+
+    @property
+    def read_index(self) -> int:
+        """Total number of samples ever consumed."""
+        return int(self.indices[1])
+
+    @read_index.setter
+    def read_index(self, value: int):
+        self.indices[1] = value
+
+    def write(self, data: np.ndarray) -> int:
+        """
+        Copy samples into the buffer (producer side).
+
+        Samples that don't fit are dropped and counted in `overruns`.
+
+        Args:
+            data: Samples to write; may be a strided view such as indata[:, 0]
+
+        Returns:
+            Number of samples written
+        """
+        write_index = self.write_index
+        count = min(len(data), self.capacity - (write_index - self.read_index))
+        if count < len(data):
+            self.overruns += len(data) - count
+
+        start = write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        self.buffer[:count - first] = data[first:count]
+
+        # Publish only after the samples are in place
+        self.write_index = write_index + count
+        return count
+
+    def available(self) -> int:
+        """
+        Return the number of samples waiting to be read.
+
+        Returns:
+            Readable sample count
+        """
+        return self.write_index - self.read_index
+
+    def free(self) -> int:
+        """
+        Return the number of samples that can be written without dropping any.
+
+        Returns:
+            Writable sample count
+        """
+        return self.capacity - (self.write_index - self.read_index)
+
+    def read_views(self, max_count: Optional[int] = None) -> List[np.ndarray]:
+        """
+        Return zero-copy views of the readable samples (consumer side).
+
+        The views stay valid until `advance` is called; at most two views are
+        returned when the readable region wraps around the end of the buffer.
+
+        Args:
+            max_count: Return at most this many samples; all readable samples if None
+
+        Returns:
+            List of contiguous views in stream order
+        """
+        read_index = self.read_index
+        count = self.write_index - read_index
+        if max_count is not None:
+            count = max(0, min(count, max_count))
+        if not count:
+            return []
+
+        start = read_index % self.capacity
+        first = min(count, self.capacity - start)
+        views = [self.buffer[start:start + first]]
+        if count > first:
+            views.append(self.buffer[:count - first])
+        return views
+
+    def advance(self, count: int):
+        """
+        Release samples that the consumer has finished with.
+
+        Args:
+            count: Number of samples consumed
+        """
+        self.read_index += min(count, self.available())
+
+    def clear(self):
+        """Drop all readable samples (consumer side)."""
+        self.read_index = self.write_index
+
+
+class PreRollBuffer:
+    """
+    Preallocated circular buffer that always holds the most recent audio.
+    Only the audio callback touches it, so it needs no synchronization.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Initialize the pre-roll buffer.
+
+        Args:
+            capacity: Number of most recent samples to keep
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.write_index = 0
+        self.count = 0
+
+    def write(self, data: np.ndarray):
+        """
+        Append samples, overwriting the oldest ones.
+
+        Args:
+            data: Samples to write; may be a strided view
+        """
+        if len(data) >= self.capacity:
+            self.buffer[:] = data[len(data) - self.capacity:]
+            self.write_index = 0
+            self.count = self.capacity
+            return
+
+        start = self.write_index
+        first = min(len(data), self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        self.buffer[:len(data) - first] = data[first:]
+        self.write_index = (start + len(data)) % self.capacity
+        self.count = min(self.count + len(data), self.capacity)
+
+    def drain_into(self, ring_buffer: AudioRingBuffer):
+        """
+        Move the buffered samples, oldest first, into a ring buffer and empty this one.
+
+        Args:
+            ring_buffer: Destination ring buffer
+        """
+        start = (self.write_index - self.count) % self.capacity
+        first = min(self.count, self.capacity - start)
+        ring_buffer.write(self.buffer[start:start + first])
+        ring_buffer.write(self.buffer[:self.count - first])
+        self.count = 0
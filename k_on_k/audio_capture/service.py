@@ -4,20 +4,21 @@ Handles microphone input and provides audio data to the speech recognition servi
 """
 
 import logging
-import queue
-import threading
 import time
 from typing import Callable, Dict, Any, Optional
 
 import numpy as np
-import sounddevice as sd
+
+from k_on_k.audio_capture.dsp import AudioFrontEnd
+from k_on_k.audio_capture.ring_buffer import AudioRingBuffer, PreRollBuffer
+from k_on_k.audio_capture.sources import PortAudioSource, create_audio_source
 
 logger = logging.getLogger(__name__)
 
 
 class AudioCaptureService:
     """
-    Service for capturing audio from the microphone.
+    Service for capturing audio from the microphone or another audio source.
     """
     
     def __init__(self, config: Dict[str, Any]):
@@ -37,14 +38,37 @@ class AudioCaptureService:
         self.device_index = self.audio_config["device_index"]
         
         # State
-        self.stream = None
+        self.stream_open = False
         self.is_running = False
         self.is_recording = False
-        self.audio_queue = queue.Queue()
-        self.processing_thread = None
         
-        # Callback for processing audio data
-        self.on_audio_data: Optional[Callable[[np.ndarray], None]] = None
+        # Capture at the source's own format and let the front end convert to sample_rate
+        self.source = create_audio_source(config)
+        self.capture_rate = self.source.sample_rate
+        self.capture_channels = self.source.channels
+        self.block_size = self.chunk_size * self.capture_rate // self.sample_rate
+        self.front_end = AudioFrontEnd(config, self.capture_rate, self.capture_channels)
+        self.mix_buffer = np.zeros(self.block_size, dtype=np.float32)
+        
+        # Preallocated buffer shared with the speech recognizer
+        ring_seconds = self.audio_config.get("ring_buffer_s", 30.0)
+        self.ring_buffer = AudioRingBuffer(int(self.capture_rate * ring_seconds))
+        
+        # Called from the audio callback with the capture time after audio lands in the ring
+        self.on_audio_ready: Optional[Callable[[float], None]] = None
+        
+        # Warm-stream mode keeps the input stream open and the latest audio in a pre-roll
+        warm_config = self.audio_config.get("warm_stream", {})
+        self.warm_stream = warm_config.get("enabled", False)
+        self.pre_roll = None
+        self.release_pre_roll = False
+        if self.warm_stream:
+            pre_roll_ms = warm_config.get("pre_roll_ms", 400)
+            self.pre_roll = PreRollBuffer(int(self.capture_rate * pre_roll_ms / 1000))
+        
+        # Called from the audio callback with mono capture-rate audio while not
+        # recording, e.g. for the wake-word spotter; keeps the stream open
+        self.on_idle_audio: Optional[Callable[[np.ndarray], None]] = None
     
     def start(self):
         """Start the audio capture service."""
@@ -53,8 +77,10 @@ class AudioCaptureService:
             
         logger.info("Starting audio capture service")
         self.is_running = True
-        self.processing_thread = threading.Thread(target=self._process_queue, daemon=True)
-        self.processing_thread.start()
+        
+        # Open the stream up front so toggling dictation doesn't have to
+        if self.warm_stream or self.on_idle_audio:
+            self._open_stream()
     
     def stop(self):
         """Stop the audio capture service."""
@@ -64,31 +90,23 @@ class AudioCaptureService:
         logger.info("Stopping audio capture service")
         self.stop_recording()
         self.is_running = False
-        
-        # Wait for processing thread to end
-        if self.processing_thread and self.processing_thread.is_alive():
-            self.processing_thread.join(timeout=2.0)
+        self._close_stream()
     
     def start_recording(self):
-        """Start recording audio from microphone."""
+        """Start recording audio from the audio source."""
         if self.is_recording or not self.is_running:
             return
             
         logger.info("Starting audio recording")
-        self.is_recording = True
         
-        try:
-            self.stream = sd.InputStream(
-                samplerate=self.sample_rate,
-                blocksize=self.chunk_size,
-                channels=self.channels,
-                dtype="float32",
-                device=self.device_index,
-                callback=self._audio_callback,
-            )
-            self.stream.start()
-        except Exception as e:
-            logger.error(f"Error starting audio stream: {str(e)}")
+        if self.stream_open:
+            # The stream is already running: just hand the pre-roll, if any, to the recognizer
+            self.release_pre_roll = self.pre_roll is not None
+            self.is_recording = True
+            return
+        
+        self.is_recording = True
+        if not self._open_stream():
             self.is_recording = False
     
     def stop_recording(self):
@@ -99,14 +117,38 @@ class AudioCaptureService:
         logger.info("Stopping audio recording")
         self.is_recording = False
         
-        if self.stream:
-            self.stream.stop()
-            self.stream.close()
-            self.stream = None
+        # A warm stream keeps running and goes back to filling the pre-roll
+        if not self.warm_stream and not self.on_idle_audio:
+            self._close_stream()
+    
+    def _open_stream(self) -> bool:
+        """
+        Start delivery from the audio source.
+        
+        Returns:
+            True if the source is running, False otherwise
+        """
+        try:
+            self.source.open(self._audio_callback, self.block_size, has_room=self._has_room)
+            self.stream_open = True
+            return True
+        except Exception as e:
+            logger.error(f"Error starting audio stream: {str(e)}")
+            return False
+    
+    def _close_stream(self):
+        """Stop delivery from the audio source, if running."""
+        if self.stream_open:
+            self.source.close()
+            self.stream_open = False
+    
+    def _has_room(self, frames: int) -> bool:
+        """Backpressure check for sources that can wait, such as file replay."""
+        return not self.is_recording or self.ring_buffer.free() >= frames
     
     def _audio_callback(self, indata, frames, time_info, status):
         """
-        Callback function for audio data from sounddevice.
+        Callback function for audio data from the audio source.
         
         Args:
             indata: Input audio data
@@ -117,31 +159,26 @@ class AudioCaptureService:
         if status:
             logger.warning(f"Audio callback status: {status}")
         
-        # Add audio data to queue
+        if not self.is_recording and self.pre_roll is None and not self.on_idle_audio:
+            return
+        
+        # Downmix into a preallocated buffer, then copy into the ring buffer
+        if frames > len(self.mix_buffer):
+            self.mix_buffer = np.zeros(frames, dtype=np.float32)
+        mono = self.front_end.downmix(indata, self.mix_buffer)
+        
         if self.is_recording:
-            audio_data = np.copy(indata[:, 0])  # Use first channel if stereo
-            self.audio_queue.put(audio_data)
-    
-    def _process_queue(self):
-        """Process audio data from the queue."""
-        while self.is_running:
-            try:
-                # Get audio data from queue with timeout
-                try:
-                    audio_data = self.audio_queue.get(timeout=0.1)
-                except queue.Empty:
-                    continue
-                
-                # Process audio data if callback is set
-                if self.on_audio_data and self.is_recording:
-                    self.on_audio_data(audio_data)
-                
-                # Mark task as done
-                self.audio_queue.task_done()
-                
-            except Exception as e:
-                logger.error(f"Error processing audio data: {str(e)}")
-                time.sleep(0.1)
+            if self.release_pre_roll:
+                self.release_pre_roll = False
+                self.pre_roll.drain_into(self.ring_buffer)
+            self.ring_buffer.write(mono)
+            if self.on_audio_ready:
+                self.on_audio_ready(time.perf_counter())
+        else:
+            if self.pre_roll is not None:
+                self.pre_roll.write(mono)
+            if self.on_idle_audio:
+                self.on_idle_audio(mono)
     
     def list_audio_devices(self):
         """
@@ -150,6 +187,7 @@ class AudioCaptureService:
         Returns:
             List of available audio input devices
         """
-        devices = sd.query_devices()
-        input_devices = [d for d in devices if d["max_input_channels"] > 0]
-        return input_devices 
\ No newline at end of file
+        source = self.source
+        if not isinstance(source, PortAudioSource):
+            source = PortAudioSource(None, self.sample_rate, self.channels, native_format=False)
+        return source.list_devices()
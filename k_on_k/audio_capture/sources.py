@@ -0,0 +1,342 @@
+"""
+Audio sources for Kitten on Keys.
+Lets the capture service read from a live device, a WAV file or raw PCM on stdin.
+"""
+
+import abc
+import logging
+import sys
+import threading
+import time
+import wave
+from typing import Callable, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Callback signature shared with sounddevice: (indata, frames, time_info, status)
+AudioCallback = Callable[[np.ndarray, int, Any, Any], None]
+
+# Raw PCM sample formats accepted by the stdin source
+PCM_FORMATS = {
+    "s16le": np.dtype("<i2"),
+    "s32le": np.dtype("<i4"),
+    "f32le": np.dtype("<f4"),
+}
+
+
+class AudioSource(abc.ABC):
+    """
+    Interface for audio sources consumed by AudioCaptureService.
+    Sources deliver float32 blocks of shape (frames, channels) to a callback.
+    """
+
+    sample_rate: int
+    channels: int
+
+    @abc.abstractmethod
+    def open(self, callback: AudioCallback, block_size: int, has_room: Optional[Callable[[int], bool]] = None):
+        """
+        Start delivering audio blocks.
+
+        Args:
+            callback: Called with (indata, frames, time_info, status) for every block
+            block_size: Frames per block
+            has_room: Optional backpressure check; sources that can wait (files, pipes)
+                hold a block back until it returns True for the block's frame count
+        """
+
+    @abc.abstractmethod
+    def close(self):
+        """Stop delivering audio and release the source."""
+
+    def wait_finished(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until a finite source has delivered all of its audio.
+
+        Args:
+            timeout: Maximum time to wait, in seconds
+
+        Returns:
+            True if the source is finished, False for live sources or on timeout
+        """
+        return False
+
+
+class PortAudioSource(AudioSource):
+    """Live capture from a PortAudio input device through sounddevice."""
+
+    def __init__(self, device_index: Optional[int], sample_rate: int, channels: int, native_format: bool = True):
+        """
+        Initialize the PortAudio source.
+
+        Args:
+            device_index: Input device index, None for the default device
+            sample_rate: Sample rate to use if the native one can't be determined
+            channels: Channel count to use if the native one can't be determined
+            native_format: Open the device at its own sample rate and channel count
+        """
+        # Imported here so headless machines without PortAudio can use the other sources
+        import sounddevice as sd
+
+        self.sd = sd
+        self.device_index = device_index
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.stream = None
+
+        if native_format:
+            try:
+                info = sd.query_devices(device_index, "input")
+                self.sample_rate = int(info["default_samplerate"])
+                self.channels = int(info["max_input_channels"])
+                logger.info(f"Capturing at native format: {self.sample_rate} Hz, {self.channels} channel(s)")
+            except Exception as e:
+                logger.warning(f"Could not query input device format, using configured one: {str(e)}")
+
+    def open(self, callback: AudioCallback, block_size: int, has_room: Optional[Callable[[int], bool]] = None):
+        """Open and start the input stream."""
+        self.stream = self.sd.InputStream(
+            samplerate=self.sample_rate,
+            blocksize=block_size,
+            channels=self.channels,
+            dtype="float32",
+            device=self.device_index,
+            callback=callback,
+        )
+        self.stream.start()
+
+    def close(self):
+        """Stop and close the input stream, if open."""
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def list_devices(self):
+        """
+        List available audio input devices.
+
+        Returns:
+            List of available audio input devices
+        """
+        devices = self.sd.query_devices()
+        return [d for d in devices if d["max_input_channels"] > 0]
+
+
+class _ThreadedSource(AudioSource):
+    """Base for sources read on a background thread, paced in real time or as fast as possible."""
+
+    def __init__(self, realtime: bool = True):
+        """
+        Initialize the threaded source.
+
+        Args:
+            realtime: Deliver blocks at the audio's own pace instead of as fast as possible
+        """
+        self.realtime = realtime
+        self.thread = None
+        self.running = False
+        self.finished = threading.Event()
+
+    def open(self, callback: AudioCallback, block_size: int, has_room: Optional[Callable[[int], bool]] = None):
+        """Start the reader thread."""
+        self.running = True
+        self.finished.clear()
+        self.thread = threading.Thread(
+            target=self._run, args=(callback, block_size, has_room), daemon=True
+        )
+        self.thread.start()
+
+    def close(self):
+        """Stop the reader thread."""
+        self.running = False
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.thread = None
+
+    def wait_finished(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all audio has been delivered."""
+        return self.finished.wait(timeout)
+
+    @abc.abstractmethod
+    def _read_block(self, frames: int) -> Optional[np.ndarray]:
+        """
+        Read the next block.
+
+        Args:
+            frames: Frames to read
+
+        Returns:
+            Float32 array of shape (n, channels) with n <= frames, or None at the end
+        """
+
+    def _run(self, callback: AudioCallback, block_size: int, has_room: Optional[Callable[[int], bool]]):
+        """Deliver blocks until the source is exhausted or closed."""
+        start_time = time.monotonic()
+        delivered = 0
+
+        try:
+            while self.running:
+                block = self._read_block(block_size)
+                if block is None or not len(block):
+                    break
+
+                if self.realtime:
+                    # Sleep until the block's due time, without accumulating drift
+                    delay = start_time + delivered / self.sample_rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                elif has_room:
+                    # Lossless fast replay: wait for the consumer instead of overrunning it
+                    while self.running and not has_room(len(block)):
+                        time.sleep(0.001)
+
+                callback(block, len(block), None, None)
+                delivered += len(block)
+        except Exception as e:
+            logger.error(f"Error reading audio source: {str(e)}")
+        finally:
+            self.running = False
+            self.finished.set()
+
+
+class WavFileSource(_ThreadedSource):
+    """Replays a PCM WAV file."""
+
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False):
+        """
+        Initialize the WAV file source.
+
+        Args:
+            path: Path to a PCM WAV file
+            realtime: Replay at the file's own pace instead of as fast as possible
+            loop: Start over at the end of the file instead of finishing
+        """
+        super().__init__(realtime)
+        self.path = path
+        self.loop = loop
+        self.wav = wave.open(str(path), "rb")
+        self.sample_rate = self.wav.getframerate()
+        self.channels = self.wav.getnchannels()
+        self.sample_width = self.wav.getsampwidth()
+        if self.sample_width not in (1, 2, 4):
+            raise ValueError(f"Unsupported WAV sample width: {self.sample_width} bytes")
+
+    def _read_block(self, frames: int) -> Optional[np.ndarray]:
+        """Read and convert the next block of frames."""
+        data = self.wav.readframes(frames)
+        if not data and self.loop:
+            self.wav.rewind()
+            data = self.wav.readframes(frames)
+        if not data:
+            return None
+
+        if self.sample_width == 1:
+            # 8-bit WAV is unsigned
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        else:
+            dtype = np.dtype("<i2") if self.sample_width == 2 else np.dtype("<i4")
+            samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / float(2 ** (8 * self.sample_width - 1))
+        return samples.reshape(-1, self.channels)
+
+
+class StdinSource(_ThreadedSource):
+    """Reads raw interleaved PCM from standard input, e.g. piped from arecord or ffmpeg."""
+
+    def __init__(self, sample_rate: int, channels: int, sample_format: str = "s16le", realtime: bool = False):
+        """
+        Initialize the stdin source.
+
+        Args:
+            sample_rate: Sample rate of the incoming PCM
+            channels: Interleaved channel count of the incoming PCM
+            sample_format: One of s16le, s32le or f32le
+            realtime: Pace delivery to the audio clock; leave off when the writer already does
+        """
+        super().__init__(realtime)
+        if sample_format not in PCM_FORMATS:
+            raise ValueError(f"Unsupported PCM format: {sample_format}")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.dtype = PCM_FORMATS[sample_format]
+        self.stream = sys.stdin.buffer
+        self.partial = b""  # Start of a frame split across reads
+
+    def _read_block(self, frames: int) -> Optional[np.ndarray]:
+        """Read and convert the next block of frames."""
+        frame_bytes = self.dtype.itemsize * self.channels
+        data = self.partial
+        while len(data) < frame_bytes:
+            chunk = self.stream.read(frames * frame_bytes - len(data))
+            if not chunk:
+                break
+            data += chunk
+        usable = len(data) - len(data) % frame_bytes
+        self.partial = data[usable:]
+        if not usable:
+            return None  # End of input; a trailing partial frame is dropped
+
+        samples = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32)
+        if self.dtype.kind == "i":
+            samples /= float(2 ** (8 * self.dtype.itemsize - 1))
+        return samples.reshape(-1, self.channels)
+
+
+def read_wav(path: str) -> Tuple[np.ndarray, int]:
+    """
+    Read a whole PCM WAV file.
+
+    Args:
+        path: Path to a PCM WAV file
+
+    Returns:
+        Tuple of (float32 samples of shape (frames, channels), sample rate)
+    """
+    source = WavFileSource(path, realtime=False)
+    try:
+        samples = source._read_block(source.wav.getnframes())
+    finally:
+        source.wav.close()
+    if samples is None:
+        samples = np.zeros((0, source.channels), dtype=np.float32)
+    return samples, source.sample_rate
+
+
+def create_audio_source(config: Dict[str, Any]) -> AudioSource:
+    """
+    Create the audio source selected in the configuration.
+
+    Args:
+        config: Application configuration dict
+
+    Returns:
+        AudioSource instance
+    """
+    audio_config = config["audio"]
+    source_config = audio_config.get("source", {})
+    source_type = source_config.get("type", "portaudio").lower()
+
+    if source_type == "file":
+        return WavFileSource(
+            source_config["path"],
+            realtime=source_config.get("realtime") is not False,
+            loop=source_config.get("loop", False),
+        )
+    if source_type == "stdin":
+        return StdinSource(
+            source_config.get("sample_rate", audio_config["sample_rate"]),
+            source_config.get("channels", 1),
+            source_config.get("format", "s16le"),
+            realtime=bool(source_config.get("realtime")),
+        )
+    if source_type != "portaudio":
+        logger.warning(f"Unsupported audio source: {source_type}, falling back to PortAudio")
+
+    return PortAudioSource(
+        audio_config["device_index"],
+        audio_config["sample_rate"],
+        audio_config["channels"],
+        native_format=audio_config.get("front_end", {}).get("native_format", True),
+    )
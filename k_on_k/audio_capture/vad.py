@@ -0,0 +1,233 @@
+"""
+Voice activity detection for Kitten on Keys.
+Gates audio in front of the speech recognizer and splits it into utterances.
+"""
+
+import logging
+from typing import Callable, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Small constant to keep logarithms finite on digital silence
+EPSILON = 1e-10
+
+
+class VoiceActivityDetector:
+    """
+    Energy / zero-crossing / spectral-flatness voice activity detector.
+    Forwards speech frames, skips silence and signals the end of each utterance.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the voice activity detector.
+
+        Args:
+            config: Application configuration dict
+        """
+        self.sample_rate = config["audio"]["sample_rate"]
+        vad_config = config["audio"].get("vad", {})
+
+        # Detection settings
+        self.enabled = vad_config.get("enabled", True)
+        self.frame_len = int(self.sample_rate * vad_config.get("frame_ms", 30) / 1000)
+        self.threshold_db = vad_config.get("threshold_db", 9.0)
+        self.max_flatness = vad_config.get("max_flatness", 0.5)
+        self.fricative_zcr = vad_config.get("fricative_zcr", 0.25)
+        self.noise_adapt_rate = vad_config.get("noise_adapt_rate", 0.05)
+
+        # Segmentation settings, in frames
+        frame_ms = 1000 * self.frame_len / self.sample_rate
+        self.pre_speech_frames = int(vad_config.get("pre_speech_ms", 200) / frame_ms)
+        self.min_speech_frames = max(1, int(vad_config.get("min_speech_ms", 90) / frame_ms))
+        self.silence_frames = max(1, int(vad_config.get("silence_ms", 700) / frame_ms))
+
+        self.window = np.hanning(self.frame_len).astype(np.float32)
+
+        # Preallocated buffers: input may be a view that is reused after process() returns
+        self.carry = np.zeros(self.frame_len, dtype=np.float32)
+        self.padding = np.zeros((max(self.pre_speech_frames, self.min_speech_frames), self.frame_len), dtype=np.float32)
+
+        # Callbacks
+        self.on_speech: Optional[Callable[[np.ndarray], None]] = None
+        self.on_utterance_end: Optional[Callable[[], None]] = None
+
+        self.reset()
+
+    def reset(self):
+        """Reset segmentation state and counters, e.g. when dictation starts."""
+        self.carry_len = 0
+        self.padding_count = 0  # Frames written to the padding ring since the last onset
+        self.noise_floor_db: Optional[float] = None
+        self.in_utterance = False
+        self.speech_run = 0
+        self.silence_run = 0
+
+        # Counters
+        self.frames_total = 0
+        self.frames_skipped = 0
+        self.utterances = 0
+
+    def process(self, audio_data: np.ndarray):
+        """
+        Process a block of audio, forwarding speech and skipping silence.
+
+        Args:
+            audio_data: Mono float32 audio samples
+        """
+        if not self.enabled:
+            if self.on_speech:
+                self.on_speech(audio_data)
+            return
+
+        offset = 0
+        if self.carry_len:
+            # Complete the partial frame left over from the previous block
+            offset = min(self.frame_len - self.carry_len, len(audio_data))
+            self.carry[self.carry_len:self.carry_len + offset] = audio_data[:offset]
+            self.carry_len += offset
+            if self.carry_len < self.frame_len:
+                return
+            self.carry_len = 0
+            self._process_frames(self.carry.reshape(1, -1))
+
+        n_frames = (len(audio_data) - offset) // self.frame_len
+        end = offset + n_frames * self.frame_len
+        if n_frames:
+            self._process_frames(audio_data[offset:end].reshape(n_frames, self.frame_len))
+
+        self.carry_len = len(audio_data) - end
+        self.carry[:self.carry_len] = audio_data[end:]
+
+    def flush(self):
+        """End the current utterance, if any, e.g. when dictation stops."""
+        if self.in_utterance:
+            self._end_utterance()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return counters describing how much audio was skipped.
+
+        Returns:
+            Dict with processed and skipped seconds, skipped ratio and utterance count
+        """
+        frame_s = self.frame_len / self.sample_rate
+        return {
+            "seconds_total": self.frames_total * frame_s,
+            "seconds_skipped": self.frames_skipped * frame_s,
+            "skipped_ratio": self.frames_skipped / self.frames_total if self.frames_total else 0.0,
+            "utterances": self.utterances,
+        }
+
+    def _process_frames(self, frames: np.ndarray):
+        """
+        Classify a block of frames and forward the ones that belong to utterances.
+
+        Args:
+            frames: Contiguous array of shape (n_frames, frame_len)
+        """
+        energy_db, zcr, flatness = self._frame_features(frames)
+
+        run_start = None  # First frame of the run currently being forwarded
+        for i in range(len(frames)):
+            is_speech = self._classify(energy_db[i], zcr[i], flatness[i])
+            self.frames_total += 1
+
+            if self.in_utterance:
+                if run_start is None:
+                    run_start = i
+                self.silence_run = 0 if is_speech else self.silence_run + 1
+                if self.silence_run >= self.silence_frames:
+                    # Trailing silence reached: finalize the utterance
+                    self._emit(frames[run_start:i + 1])
+                    run_start = None
+                    self._end_utterance()
+                continue
+
+            # Outside an utterance, frames wait in the pre-speech padding
+            self.speech_run = self.speech_run + 1 if is_speech else 0
+            if self.padding_count >= len(self.padding):
+                self.frames_skipped += 1
+            self.padding[self.padding_count % len(self.padding)] = frames[i]
+            self.padding_count += 1
+
+            if self.speech_run >= self.min_speech_frames:
+                self.in_utterance = True
+                self.silence_run = 0
+                self.utterances += 1
+                self._emit_padding()
+
+        if run_start is not None:
+            self._emit(frames[run_start:])
+
+    def _frame_features(self, frames: np.ndarray):
+        """
+        Compute per-frame features for a block of frames at once.
+
+        Args:
+            frames: Array of shape (n_frames, frame_len)
+
+        Returns:
+            Tuple of (energy in dB, zero-crossing rate, spectral flatness) arrays
+        """
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + EPSILON)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_len - 1)
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2 + EPSILON
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        return energy_db, zcr, flatness
+
+    def _classify(self, energy_db: float, zcr: float, flatness: float) -> bool:
+        """
+        Decide whether a frame is speech and adapt the noise floor on non-speech.
+
+        Args:
+            energy_db: Frame energy in dB
+            zcr: Frame zero-crossing rate
+            flatness: Frame spectral flatness (0 = tonal, 1 = noise-like)
+
+        Returns:
+            True if the frame is speech
+        """
+        if self.noise_floor_db is None:
+            self.noise_floor_db = energy_db
+
+        # Loud enough above the noise floor, and either voiced (tonal) or a fricative
+        is_speech = (
+            energy_db > self.noise_floor_db + self.threshold_db
+            and (flatness < self.max_flatness or zcr > self.fricative_zcr)
+        )
+
+        if not is_speech:
+            if energy_db < self.noise_floor_db:
+                self.noise_floor_db = energy_db
+            else:
+                self.noise_floor_db += self.noise_adapt_rate * (energy_db - self.noise_floor_db)
+
+        return is_speech
+
+    def _emit(self, frames: np.ndarray):
+        """Forward a contiguous run of frames as one block."""
+        if len(frames) and self.on_speech:
+            self.on_speech(frames.reshape(-1))
+
+    def _emit_padding(self):
+        """Forward the buffered pre-speech frames in order and empty the padding."""
+        size = len(self.padding)
+        count = min(self.padding_count, size)
+        start = (self.padding_count - count) % size
+        self.padding_count = 0
+
+        # The padding ring wraps at most once
+        self._emit(self.padding[start:start + count])
+        self._emit(self.padding[:max(0, start + count - size)])
+
+    def _end_utterance(self):
+        """Close the current utterance and notify the recognizer."""
+        self.in_utterance = False
+        self.speech_run = 0
+        self.silence_run = 0
+        if self.on_utterance_end:
+            self.on_utterance_end()
@@ -5,7 +5,7 @@ Configuration settings for Kitten on Keys
 import logging
 import os
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 import yaml
 
@@ -37,18 +37,124 @@ def get_default_config() -> Dict[str, Any]:
             "chunk_size": 1024,
             "channels": 1,
             "device_index": None,  # None means default device
+            # Where audio comes from: portaudio (microphone), file (WAV replay) or stdin (raw PCM)
+            "source": {
+                "type": "portaudio",
+                "path": None,  # WAV file for the file source
+                # Pace delivery to the audio clock; None paces files but not stdin, whose writer does
+                "realtime": None,
+                "loop": False,
+                "format": "s16le",  # Raw PCM format for stdin: s16le, s32le or f32le
+            },
+            "ring_buffer_s": 30.0,  # Audio buffered between the capture callback and the recognizer
+            # Keep the input stream open so dictation starts without reopening the device
+            "warm_stream": {
+                "enabled": False,
+                "pre_roll_ms": 400,  # Audio from just before the toggle included in the first utterance
+            },
+            # DSP between native-format capture and the 16 kHz mono recognizer input
+            "front_end": {
+                "native_format": True,  # Open the device at its own sample rate and channel count
+                "downmix_weights": None,  # Per-channel weights; None averages all channels
+                "resampler_half_width": 16,  # Filter zero crossings per side; higher is sharper but slower
+                "highpass_hz": 80.0,  # High-pass cutoff; 0 disables the filter
+                "normalize_gain": False,
+                "target_rms_db": -25.0,
+                "max_gain_db": 20.0,
+            },
+            # Voice activity detection in front of the speech recognizer
+            "vad": {
+                "enabled": True,
+                "frame_ms": 30,
+                "threshold_db": 9.0,  # Energy above the adaptive noise floor that counts as speech
+                "max_flatness": 0.5,  # Spectral flatness below this is voiced speech
+                "fricative_zcr": 0.25,  # Zero-crossing rate above this is an unvoiced fricative
+                "noise_adapt_rate": 0.05,  # How quickly the noise floor follows non-speech frames
+                "pre_speech_ms": 200,  # Audio kept before speech onset so the first syllable isn't clipped
+                "min_speech_ms": 90,  # Speech needed to open an utterance
+                "silence_ms": 700,  # Trailing silence that finalizes an utterance
+            },
         },
         "speech_recognition": {
             # Choose the STT engine: whisper or faster-whisper
             "engine": "faster-whisper",
             "model": "turbo",  # Options for whisper: tiny, base, small, medium, large, turbo
+            # Settings for the openai-whisper engine
+            "whisper": {
+                "model_size": "turbo",  # Official model name, or a name in the model store
+                "beam_size": None,  # None decodes greedily
+                "device": "cuda" if os.environ.get("CUDA_VISIBLE_DEVICES") else "cpu",
+                "threads": 0,  # torch intra-op threads; 0 keeps torch's default
+            },
             # Settings for faster-whisper engine
             "faster_whisper": {
                 "model_name": "openai/whisper-large-v3-turbo",
                 "device": "cuda" if os.environ.get("CUDA_VISIBLE_DEVICES") else "cpu",
-                "compute_type": "int8_float16",  # Options: int8, int16, int8_float16, default
+                # Options: int8, int8_float32, int8_float16, int16, float16, float32, default.
+                # float16 variants need a GPU.
+                "compute_type": "int8_float16" if os.environ.get("CUDA_VISIBLE_DEVICES") else "int8",
                 "chunk_length_s": 1.0,
-                "beam_size": 5
+                "beam_size": 5,
+                "cpu_threads": 0,  # CTranslate2 threads per decode; 0 lets CTranslate2 choose
+                "num_workers": 1,  # Decodes that may run in parallel
+            },
+            # CPUs the model's threads may run on, e.g. [1, 2, 3] to keep core 0 free for
+            # the audio callback; None uses all of them. `kitten-on-keys tune --pin` sets it.
+            "inference_cpus": None,
+            # Local copies of model files, managed with `kitten-on-keys models`
+            "model_store": {
+                "path": "~/.kitten_on_keys/models",
+                "local_files_only": True,  # Never contact the Hugging Face hub or download checkpoints
+            },
+            # Sliding-window streaming: words are committed once they stay stable across
+            # passes, their audio is dropped from the window, and committed text is fed
+            # back as context.
+            "streaming": {
+                "window_s": 15.0,  # Maximum seconds of uncommitted audio kept in the window
+                "prompt_chars": 200,  # Trailing committed characters passed as the decoding prompt
+                "agreement": 2,  # Successive hypotheses that must agree before words are committed
+                "partial_results": False,  # Type the uncommitted hypothesis right away and revise it as it changes
+            },
+            # Two-pass recognition: a small model streams drafts with greedy decoding, and
+            # the configured model re-decodes each finished utterance to replace the draft
+            "cascade": {
+                "enabled": False,
+                "draft_model": "base",  # Model name for the configured engine, e.g. tiny or base
+            },
+            # When to run transcription passes, and what to give up when decoding falls behind
+            "scheduler": {
+                "min_interval_s": 0.5,  # Least new audio per pass
+                "max_interval_s": 2.0,  # Most new audio a pass waits for on a slow machine
+                "target_rtf": 0.5,  # Pass duration per second of new audio to aim for
+                "backpressure": True,
+                "max_lag_s": 3.0,  # Lag that raises the backpressure level
+                "recover_lag_s": 1.0,  # Lag that lowers it again
+                "silence_rms": 0.01,  # Blocks quieter than this are dropped under backpressure
+                "fallback_model": None,  # Smaller model to switch to as a last resort, e.g. "base"
+            },
+            # Run the model in a separate process, fed through shared memory, so decoding
+            # doesn't starve audio callbacks and hotkeys of the GIL
+            "worker": {
+                "enabled": False,
+                "max_restarts": 3,  # Consecutive crashes before the worker is given up on
+                "ready_timeout_s": 300.0,  # Time allowed for the model to load
+            },
+            # Release the model after a stretch without dictation. The next dictation reloads
+            # it while its audio waits in the ring buffer (audio.ring_buffer_s).
+            "idle_unload": {
+                "enabled": False,
+                "timeout_s": 1800.0,  # Time without dictation before the model is released
+            },
+            "warmup": True,  # Run one throwaway decode after each load, so the first real pass isn't slow
+            # Share a model loaded by `kitten-on-keys --serve`, which outlives daemon restarts
+            "server": {
+                "enabled": False,  # Use the server; falls back to a local model if it isn't running
+                "socket_path": "~/.kitten_on_keys/stt.sock",
+                "timeout_s": 60.0,  # Longest wait for a transcription reply
+                # Passes of different clients are decoded together where the engine supports it
+                "max_batch": 8,  # Most sessions decoded in one call
+                "batch_wait_ms": 20.0,  # How long a pass waits for other clients' passes to join it
+                "latency_slo_ms": 1500.0,  # Request latency (queueing plus decoding) to stay under; batches shrink to keep it
             },
             # Mapping of voice commands to punctuation or formatting
             "punctuation_commands": {
@@ -75,38 +181,99 @@ def get_default_config() -> Dict[str, Any]:
                 "k.o.k. pause",
                 "k.o.k. resume",
             ],
+            # Other ways the recognizer writes a trigger word. Dotted abbreviations
+            # also match letter by letter ("K. O. K."), and case and punctuation are ignored.
+            # Real words the recognizer hears for a trigger word are left to your own config:
+            # as aliases they would fire commands from ordinary speech.
+            "command_aliases": {
+                "kok": ["kay oh kay"],
+            },
+            # Listens for general.wake_word while dictation is off, without running Whisper.
+            # Enroll a few recordings first: kitten-on-keys wake-word enroll take1.wav take2.wav ...
+            "wake_word_spotter": {
+                "enabled": False,
+                "templates_dir": "~/.kitten_on_keys/wake_word",
+                "threshold": 0.12,  # Highest mean frame distance (0-2) that counts as a detection
+                "refractory_s": 2.0,  # Ignore the audio after a detection for this long
+                "silence_rms": 0.01,  # Frames below this level count as silence
+            },
+            # Short utterances that match an enrolled recording of a punctuation command are
+            # typed at once instead of waiting for the model's final decode.
+            # Enroll takes first: kitten-on-keys punctuation enroll comma take1.wav take2.wav ...
+            "punctuation_fast_path": {
+                "enabled": False,
+                "templates_dir": "~/.kitten_on_keys/punctuation",
+                "max_utterance_s": 1.0,  # Longer utterances always go to the model
+                "threshold": 0.15,  # Highest mean frame distance that counts as a match
+                "margin": 0.03,  # Lead required over the next best command
+                "silence_rms": 0.01,
+            },
         },
         "text_insertion": {
             "capitalize_sentences": True,
             "add_punctuation": True,
             "auto_spacing": True,
+            # How text reaches the focused window: auto, pynput, xdotool, ydotool, uinput or clipboard.
+            # auto picks the first available of xdotool, uinput, ydotool and pynput.
+            "backend": "auto",
+            # Backends for specific window classes (WM_CLASS), e.g. {"code": "clipboard"}
+            "window_backends": {},
+            "window_lookup_s": 0.5,  # How long the focused window is remembered between insertions
+            "type_delay_ms": 2,  # Delay between keystrokes for xdotool, ydotool and uinput
+            "queue_capacity": 64,  # Queued operations past which partial revisions are dropped
+            # Custom vocabulary: spoken phrase -> written form, typed as given
+            "replacements": {},
+            # Optional dictionary file with one "spoken<TAB>written" entry per line
+            "replacements_path": None,
+            "clipboard": {
+                "paste_keys": "ctrl+v",
+                "paste_keys_by_class": {
+                    "gnome-terminal": "ctrl+shift+v",
+                    "xfce4-terminal": "ctrl+shift+v",
+                    "tilix": "ctrl+shift+v",
+                    "terminator": "ctrl+shift+v",
+                    "kitty": "ctrl+shift+v",
+                    "alacritty": "ctrl+shift+v",
+                    "konsole": "ctrl+shift+v",
+                },
+                "restore_delay_s": 0.3,  # Wait before the previous clipboard text is put back
+            },
         },
         "daemon": {
             "autostart": False,
             "notifications": True,
+            # Give each instance its own files when several daemons run with --config
+            "log_file": "~/.kitten_on_keys/kok.log",
+            "pid_file": "~/.kitten_on_keys/kok.pid",
         },
     }
 
 
-def load_config() -> Dict[str, Any]:
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
     """
     Load configuration from file or create default if it doesn't exist.
     
+    Args:
+        path: Configuration file to use instead of the default one, e.g. one per
+            daemon instance
+    
     Returns:
         Dict containing configuration values
     """
+    config_file = Path(path).expanduser() if path else CONFIG_FILE
+    
     # Create config directory if it doesn't exist
-    CONFIG_DIR.mkdir(exist_ok=True)
+    config_file.parent.mkdir(parents=True, exist_ok=True)
     
     # If config file doesn't exist, create it with defaults
-    if not CONFIG_FILE.exists():
+    if not config_file.exists():
         default_config = get_default_config()
-        save_config(default_config)
+        save_config(default_config, path)
         return default_config
     
     # Load existing config
     try:
-        with open(CONFIG_FILE, "r") as f:
+        with open(config_file, "r") as f:
             config = yaml.safe_load(f)
         
         # Update with any missing default values
@@ -120,18 +287,20 @@ def load_config() -> Dict[str, Any]:
         return get_default_config()
 
 
-def save_config(config: Dict[str, Any]) -> bool:
+def save_config(config: Dict[str, Any], path: Optional[str] = None) -> bool:
     """
     Save configuration to file.
     
     Args:
         config: Configuration dict to save
+        path: Configuration file to write instead of the default one
         
     Returns:
         True if successful, False otherwise
     """
+    config_file = Path(path).expanduser() if path else CONFIG_FILE
     try:
-        with open(CONFIG_FILE, "w") as f:
+        with open(config_file, "w") as f:
             yaml.dump(config, f, default_flow_style=False)
         return True
     except Exception as e:
@@ -14,6 +14,8 @@ from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PID_FILE = "~/.kitten_on_keys/kok.pid"
+
 
 class DaemonService:
     """
@@ -37,7 +39,7 @@ class DaemonService:
         
         # State
         self.is_running = False
-        self.pid_file = Path.home() / ".kitten_on_keys" / "kok.pid"
+        self.pid_file = Path(self.daemon_config.get("pid_file") or DEFAULT_PID_FILE).expanduser()
     
     def start(self):
         """Start the daemon service."""
@@ -162,14 +164,17 @@ X-GNOME-Autostart-enabled=true
             return False
     
     @staticmethod
-    def is_daemon_running() -> Optional[int]:
+    def is_daemon_running(pid_file: Optional[str] = None) -> Optional[int]:
         """
         Check if the daemon is already running.
         
+        Args:
+            pid_file: PID file of the instance to check; the default instance's if None
+        
         Returns:
             PID of running daemon if found, None otherwise
         """
-        pid_file = Path.home() / ".kitten_on_keys" / "kok.pid"
+        pid_file = Path(pid_file or DEFAULT_PID_FILE).expanduser()
         
         if not pid_file.exists():
             return None
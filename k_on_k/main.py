@@ -4,38 +4,66 @@ Kitten on Keys (KoK) - Main Entry Point
 A speech-to-text dictation application for Linux Mint/Cinnamon
 """
 
+import argparse
+import asyncio
 import logging
 import signal
 import sys
 import threading
+import time
 from pathlib import Path
+from typing import Dict, Any, Optional
 
 from k_on_k.audio_capture.service import AudioCaptureService
+from k_on_k.audio_capture.vad import VoiceActivityDetector
 from k_on_k.config.settings import load_config
 from k_on_k.daemon.service import DaemonService
-from k_on_k.hotkey_service.service import HotkeyService
+from k_on_k.speech_recognition.batch import run_cli as run_transcribe_command
+from k_on_k.speech_recognition.model_store import BACKENDS, run_cli as run_models_command
+from k_on_k.speech_recognition.fast_path import run_cli as run_punctuation_command
 from k_on_k.speech_recognition.service import SpeechRecognitionService
+from k_on_k.speech_recognition.tuner import run_cli as run_tune_command
+from k_on_k.speech_recognition.wake_word import WakeWordSpotter, run_cli as run_wake_word_command
+from k_on_k.text_insertion.backends import BufferBackend
 from k_on_k.text_insertion.service import TextInsertionService
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(Path.home() / ".kitten_on_keys" / "kok.log"),
-    ],
-)
 logger = logging.getLogger("kitten_on_keys")
 
 
+def setup_logging(config: Dict[str, Any]):
+    """
+    Log to stdout and to the instance's log file.
+    
+    Args:
+        config: Application configuration; daemon.log_file names the log file
+    """
+    # The log directory must exist before the file handler opens it
+    log_file = Path(config["daemon"].get("log_file") or "~/.kitten_on_keys/kok.log").expanduser()
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(log_file),
+        ],
+    )
+
+
 class KittenOnKeys:
     """Main application class that coordinates all services."""
 
-    def __init__(self):
-        """Initialize application components."""
+    def __init__(self, config: Optional[Dict[str, Any]] = None, replay: bool = False):
+        """
+        Initialize application components.
+        
+        Args:
+            config: Configuration to use instead of the one loaded from disk
+            replay: Set up for replaying a finite source: no hotkeys, and text is
+                kept in a buffer instead of typed into the focused window
+        """
         self.running = False
-        self.config = load_config()
+        self.config = config or load_config()
         # If debug mode, set both root and our logger to DEBUG so handlers will emit debug records
         if self.config.get("general", {}).get("debug", False):
             logging.root.setLevel(logging.DEBUG)
@@ -43,60 +71,148 @@ class KittenOnKeys:
         
         # Initialize all services
         self.audio_service = AudioCaptureService(self.config)
+        self.vad = VoiceActivityDetector(self.config)
         self.stt_service = SpeechRecognitionService(self.config)
-        self.text_service = TextInsertionService(self.config)
-        self.hotkey_service = HotkeyService(self.config)
+        self.text_service = TextInsertionService(self.config, backend=BufferBackend() if replay else None)
+        self.hotkey_service = None
+        if not replay:
+            # pynput needs a display; imported here so headless replay and the
+            # offline subcommands don't depend on it
+            from k_on_k.hotkey_service.service import HotkeyService
+            
+            self.hotkey_service = HotkeyService(self.config)
         self.daemon_service = DaemonService(self.config)
         
         # Set up event handlers
-        self.hotkey_service.on_dictation_hotkey = self.toggle_dictation
-        # Wrap transcription callback to log and then insert text
+        # Wrap transcription callback to log and then insert text. The text replaces
+        # any partial result on screen, with as few keystrokes as possible.
         def _handle_transcription(text):
-            key = text.strip().lower()
-            punct_map = self.config.get("speech_recognition", {}).get("punctuation_commands", {})
-            if key in punct_map:
-                symbol = punct_map[key]
-                logger.info(f"Punctuation command detected: {key} -> {symbol}")
-                # Handle newline separately
-                if symbol == "\n":
-                    self.text_service.type_command('new_line')
-                else:
-                    self.text_service.insert_text(symbol)
-            else:
-                logger.info(f"Transcribed text: {text}")
-                self.text_service.insert_text(text)
+            # Spoken punctuation ("comma", "new line") is expanded by the text
+            # post-processor wherever it occurs in the utterance
+            logger.info(f"Transcribed text: {text}")
+            self.text_service.commit_text(text)
         self.stt_service.on_transcription = _handle_transcription
-        self.audio_service.on_audio_data = self.stt_service.process_audio
+        # Trigger phrases never reach the text service
+        self.stt_service.on_command = self._handle_command
+        # Partial results (cascade drafts or the uncommitted hypothesis) are typed
+        # right away and revised in place until the transcript replaces them
+        self.stt_service.on_partial = self.text_service.revise_text
+        # Audio flows from the capture callback through a shared ring buffer, then
+        # through the DSP front end (resampling to 16 kHz) and the VAD gate, which
+        # skips silence and splits utterances
+        self.stt_service.attach_ring_buffer(self.audio_service.ring_buffer)
+        self.stt_service.audio_filter = self.audio_service.front_end.process
+        self.audio_service.front_end.on_audio = self.vad.process
+        self.vad.on_speech = self.stt_service.process_audio
+        self.vad.on_utterance_end = self.stt_service.end_utterance
         
-        # Handle signals
-        signal.signal(signal.SIGINT, self.stop)
-        signal.signal(signal.SIGTERM, self.stop)
+        # The capture callback wakes the recognizer on the event loop, and session
+        # boundaries reset and flush the stages in order with the audio
+        self.audio_service.on_audio_ready = self.stt_service.notify_audio
+        self.stt_service.on_listening_start = self._reset_stages
+        self.stt_service.on_listening_stop = self._flush_stages
+        
+        # While dictation is off, a lightweight spotter listens for the wake word
+        self.wake_spotter: Optional[WakeWordSpotter] = None
+        if self.config["speech_recognition"].get("wake_word_spotter", {}).get("enabled", False):
+            self.wake_spotter = WakeWordSpotter(self.config, self.audio_service.capture_rate)
+            self.wake_spotter.load_templates()
+        
+        # Event loop state, set up when the loop starts
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stop_event: Optional[asyncio.Event] = None
 
     def start(self):
-        """Start all services and enter the main loop."""
+        """Start all services and run the event loop until stopped."""
+        try:
+            asyncio.run(self._run())
+        except Exception as e:
+            logger.error(f"Error in main loop: {str(e)}")
+
+    async def _run(self):
+        """Start all services, then sleep until a signal asks to stop."""
+        logger.info("Starting Kitten on Keys")
+        self._attach_loop()
+        
         try:
-            logger.info("Starting Kitten on Keys")
-            self.running = True
-            
             # Start services in correct order
             self.daemon_service.start()
             self.text_service.start()
-            self.stt_service.start()
+            # Capture starts first so audio recorded while the model loads is kept
+            if self.wake_spotter:
+                self.wake_spotter.start()
+                # Without templates the spotter doesn't run, and the microphone
+                # shouldn't stay open for it between dictations
+                if self.wake_spotter.is_running:
+                    self.audio_service.on_idle_audio = self.wake_spotter.feed
             self.audio_service.start()
+            self.stt_service.start()
             
             # Start hotkey service last as it may block
             self.hotkey_service.start()
             
-            # Enter main loop
+            # Nothing runs on the loop until an event (audio, hotkey, signal) arrives
             logger.info("Kitten on Keys started successfully")
-            while self.running:
-                signal.pause()
-                
-        except Exception as e:
-            logger.error(f"Error in main loop: {str(e)}")
-            self.stop()
+            await self.stop_event.wait()
+        finally:
+            await self._shutdown()
+
+    def replay(self):
+        """
+        Dictate a finite audio source (file or stdin) end to end, report throughput and exit.
+        Runs capture, recognition and insertion without the hotkey and daemon services.
+        Needs an instance created with replay=True; the transcript is printed to stdout.
+        """
+        asyncio.run(self._replay())
+
+    async def _replay(self):
+        """Replay the configured audio source through the pipeline."""
+        logger.info("Replaying audio through Kitten on Keys")
+        self._attach_loop()
+        self.text_service.start()
+        self.audio_service.start()
+        self.stt_service.start()
+        
+        start_time = time.monotonic()
+        self.toggle_dictation()
+        # Wait for the source in a helper thread; the recognizer keeps running on the loop
+        await self.loop.run_in_executor(None, self.audio_service.source.wait_finished)
+        self.toggle_dictation()
+        await self.stt_service.wait_until_flushed()
+        # The insertion worker may still be typing the last transcript
+        await self.loop.run_in_executor(None, self.text_service.wait_idle)
+        elapsed = time.monotonic() - start_time
+        
+        print(self.text_service.backends.fixed.text)
+        audio_seconds = self.audio_service.ring_buffer.write_index / self.audio_service.capture_rate
+        logger.info(
+            f"Replayed {audio_seconds:.1f}s of audio in {elapsed:.1f}s "
+            f"(real-time factor {elapsed / max(audio_seconds, 1e-9):.2f})"
+        )
+        await self._shutdown()
+
+    def _attach_loop(self):
+        """Bind signals and thread callbacks to the running event loop."""
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.running = True
+        
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.stop)
+        
+        # pynput calls the handler on its listener thread; toggle on the loop instead
+        if self.hotkey_service:
+            self.hotkey_service.on_dictation_hotkey = lambda: self.loop.call_soon_threadsafe(self.toggle_dictation)
+        if self.wake_spotter:
+            self.wake_spotter.on_detect = lambda: self.loop.call_soon_threadsafe(self._handle_wake_word)
 
     def stop(self, signum=None, frame=None):
+        """Ask the event loop to stop all services; safe to call from any thread."""
+        if not self.running or self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    async def _shutdown(self):
         """Stop all services gracefully."""
         if not self.running:
             return
@@ -105,36 +221,198 @@ class KittenOnKeys:
         self.running = False
         
         # Stop services in reverse order
-        self.hotkey_service.stop()
+        if self.hotkey_service:
+            self.hotkey_service.stop()
         self.audio_service.stop()
+        if self.wake_spotter:
+            self.wake_spotter.stop()
         self.stt_service.stop()
+        await self.stt_service.wait_stopped()
         self.text_service.stop()
         self.daemon_service.stop()
         
         logger.info("Kitten on Keys stopped")
 
     def toggle_dictation(self):
-        """Toggle dictation mode on/off."""
+        """Toggle dictation mode on/off (event loop thread)."""
         if self.audio_service.is_recording:
             logger.info("Stopping dictation")
-            # Stop capturing audio and transcription
+            # Stop capturing audio; the recognizer flushes the VAD and commits the tail
             self.audio_service.stop_recording()
             self.stt_service.stop_listening()
         else:
             logger.info("Starting dictation")
-            # Begin capturing audio and processing transcription
+            # The recognizer resets the front end, VAD and model before taking in audio
             self.stt_service.start_listening()
             self.audio_service.start_recording()
 
+    def _handle_wake_word(self):
+        """Start dictation when the spotter hears the wake word (event loop thread)."""
+        if not self.audio_service.is_recording:
+            self.toggle_dictation()
+
+    def _handle_command(self, phrase: str):
+        """Act on a spoken trigger phrase (event loop thread)."""
+        action = phrase.split()[-1].lower()
+        if action in ("stop", "pause") and self.audio_service.is_recording:
+            self.toggle_dictation()
+        elif action in ("start", "resume") and not self.audio_service.is_recording:
+            self.toggle_dictation()
+
+    def _reset_stages(self):
+        """Reset the front end and VAD for a new session (recognizer executor)."""
+        self.audio_service.front_end.reset()
+        self.vad.reset()
+
+    def _flush_stages(self):
+        """End the VAD's open utterance and log its statistics (recognizer executor)."""
+        self.vad.flush()
+        stats = self.vad.get_stats()
+        logger.info(
+            f"VAD skipped {stats['seconds_skipped']:.1f}s of {stats['seconds_total']:.1f}s "
+            f"({stats['skipped_ratio']:.0%}) across {stats['utterances']} utterances"
+        )
+
 
 def main():
     """Application entry point."""
+    parser = argparse.ArgumentParser(prog="kitten-on-keys", description="Speech-to-text dictation daemon.")
+    parser.add_argument(
+        "--config",
+        metavar="PATH",
+        help="configuration file to use instead of ~/.kitten_on_keys/config.yaml, e.g. one per input device",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="dictate a WAV file ('-' for raw PCM on stdin) through the full pipeline, then exit",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="with --replay, feed audio as fast as the recognizer takes it instead of in real time",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="run a model server that keeps the model loaded for the daemon and other local clients",
+    )
+    parser.add_argument(
+        "--import-time",
+        action="store_true",
+        help="report how long importing the application takes, module by module, then exit",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    wake_word_parser = subparsers.add_parser("wake-word", help="manage the recordings the wake-word spotter matches")
+    wake_word_commands = wake_word_parser.add_subparsers(dest="wake_word_command", required=True)
+    enroll_parser = wake_word_commands.add_parser("enroll", help="add WAV recordings of the wake word as templates")
+    enroll_parser.add_argument("paths", nargs="+", metavar="WAV", help="one recording of the wake word per file")
+    wake_word_commands.add_parser("list", help="list the enrolled templates")
+    wake_word_commands.add_parser("clear", help="remove all templates of the configured wake word")
+    punctuation_parser = subparsers.add_parser(
+        "punctuation", help="manage the recordings the punctuation fast path matches"
+    )
+    punctuation_commands = punctuation_parser.add_subparsers(dest="punctuation_command", required=True)
+    punctuation_enroll_parser = punctuation_commands.add_parser(
+        "enroll", help="add WAV recordings of a spoken punctuation command as templates"
+    )
+    punctuation_enroll_parser.add_argument("spoken", help="the command as listed in punctuation_commands, e.g. 'new line'")
+    punctuation_enroll_parser.add_argument("paths", nargs="+", metavar="WAV", help="one take of the command per file")
+    punctuation_commands.add_parser("list", help="list the enrolled templates per command")
+    punctuation_commands.add_parser("clear", help="remove all punctuation command templates")
+    tune_parser = subparsers.add_parser(
+        "tune", help="benchmark engine, compute type, beam size and threads on a clip and save the best setup"
+    )
+    tune_parser.add_argument("clip", help="WAV recording of typical dictation, ideally 20 seconds or more")
+    tune_parser.add_argument("--engines", help="comma-separated engines to try (default: every installed one)")
+    tune_parser.add_argument("--beam-sizes", default="1,5", help="comma-separated beam sizes to try (default: 1,5)")
+    tune_parser.add_argument("--threads", help="comma-separated inference thread counts to try (default: from the CPU count)")
+    tune_parser.add_argument(
+        "--reference", metavar="TXT", help="what the clip says; by default the configured setup's transcript is used"
+    )
+    tune_parser.add_argument(
+        "--max-wer", type=float, default=0.1, help="highest word error rate a setup may have (default: 0.1)"
+    )
+    tune_parser.add_argument(
+        "--pin", action="store_true", help="keep inference threads off the first CPU, leaving it to the audio callback"
+    )
+    tune_parser.add_argument("--dry-run", action="store_true", help="report the best setup without saving it")
+    transcribe_parser = subparsers.add_parser(
+        "transcribe", help="transcribe recorded dictation offline, one model per worker process"
+    )
+    transcribe_parser.add_argument("paths", nargs="+", metavar="PATH", help="WAV files or directories of them")
+    transcribe_parser.add_argument("-o", "--output", help="write transcripts to this file instead of stdout")
+    transcribe_parser.add_argument(
+        "--format", choices=["jsonl", "text"], default="jsonl", help="one JSON record or one line per utterance"
+    )
+    transcribe_parser.add_argument(
+        "--jobs", type=int, help="worker processes, each loading its own model (default: half the CPUs)"
+    )
+    transcribe_parser.add_argument(
+        "--resume", action="store_true", help="skip utterances already in the --output file from an interrupted run"
+    )
+    models_parser = subparsers.add_parser("models", help="manage the local model store")
+    models_commands = models_parser.add_subparsers(dest="models_command", required=True)
+    models_commands.add_parser("list", help="list stored models")
+    prefetch_parser = models_commands.add_parser("prefetch", help="copy a model from a local path into the store")
+    prefetch_parser.add_argument("name", help="name the engine will ask for, e.g. turbo or openai/whisper-large-v3-turbo")
+    prefetch_parser.add_argument("path", help="CTranslate2 model directory or openai-whisper .pt checkpoint")
+    prefetch_parser.add_argument("--backend", choices=BACKENDS, help="detected from the path if omitted")
+    verify_parser = models_commands.add_parser("verify", help="check stored files against their checksums")
+    verify_parser.add_argument("name", nargs="?", help="only verify this model")
+    time_parser = models_commands.add_parser("time", help="measure how long a stored model takes to load")
+    time_parser.add_argument("name")
+    time_parser.add_argument("--backend", choices=BACKENDS, default=BACKENDS[0])
+    args = parser.parse_args()
+    
+    if args.import_time and args.command is None:
+        from k_on_k.startup import profile_imports, format_report
+        
+        print(format_report(profile_imports()))
+        return
+    
+    config = load_config(args.config)
+    setup_logging(config)
+    
+    if args.command == "models":
+        sys.exit(run_models_command(args, config))
+    if args.command == "wake-word":
+        sys.exit(run_wake_word_command(args, config))
+    if args.command == "punctuation":
+        sys.exit(run_punctuation_command(args, config))
+    if args.command == "tune":
+        sys.exit(run_tune_command(args, config))
+    if args.command == "transcribe":
+        sys.exit(run_transcribe_command(args, config))
+    
     # Create config directory if it doesn't exist
     config_dir = Path.home() / ".kitten_on_keys"
     config_dir.mkdir(exist_ok=True)
     
+    if args.serve:
+        from k_on_k.speech_recognition.model_server import ModelServer
+        
+        server = ModelServer(config)
+        signal.signal(signal.SIGINT, lambda signum, frame: server.stop())
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        server.serve_forever()
+        return
+    
+    if args.replay:
+        source_config = config["audio"].setdefault("source", {})
+        if args.replay == "-":
+            source_config["type"] = "stdin"
+        else:
+            # Raw PCM on stdin keeps audio.source.realtime (off by default): the writer paces it
+            source_config.update(type="file", path=args.replay, realtime=not args.fast)
+        if args.fast:
+            # Lag is meaningless when audio arrives faster than real time; measure the configured setup
+            config["speech_recognition"].setdefault("scheduler", {})["backpressure"] = False
+        KittenOnKeys(config, replay=True).replay()
+        return
+    
     # Start the application
-    app = KittenOnKeys()
+    app = KittenOnKeys(config)
     app.start()
 
 
@@ -0,0 +1,97 @@
+"""
+Latency metrics for Kitten on Keys.
+Lightweight counters for timing the handoffs between pipeline stages.
+"""
+
+import os
+import resource
+from collections import deque
+from typing import Deque, Dict
+
+import numpy as np
+
+
+class LatencyStats:
+    """
+    Running latency statistics with percentiles over the most recent samples.
+    Recording is O(1) and allocation-free, so it is cheap enough for every handoff.
+    """
+
+    def __init__(self, name: str, window: int = 1000):
+        """
+        Initialize the statistics.
+
+        Args:
+            name: Label used in summaries
+            window: Number of recent samples kept for percentiles
+        """
+        self.name = name
+        self.recent: Deque[float] = deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        """Forget all samples."""
+        self.recent.clear()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        """
+        Record one latency sample.
+
+        Args:
+            seconds: Measured latency in seconds
+        """
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Return the statistics in milliseconds.
+
+        Returns:
+            Dict with count, mean, p50, p95 and max
+        """
+        if not self.count:
+            return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+
+        p50, p95 = np.percentile(np.fromiter(self.recent, dtype=np.float64), [50, 95])
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count,
+            "p50_ms": 1000 * p50,
+            "p95_ms": 1000 * p95,
+            "max_ms": 1000 * self.max,
+        }
+
+    def format(self) -> str:
+        """
+        Format the statistics for the log.
+
+        Returns:
+            One-line summary
+        """
+        stats = self.summary()
+        return (
+            f"{self.name}: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+            f"max {stats['max_ms']:.1f} ms over {stats['count']}"
+        )
+
+
+def rss_mb() -> float:
+    """
+    Return the resident memory of this process.
+
+    Returns:
+        Resident set size in MB
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        # No procfs; the peak is the best available approximation
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
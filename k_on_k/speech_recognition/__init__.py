@@ -1,6 +1,13 @@
 """Speech recognition package for Kitten on Keys."""
 
 from k_on_k.speech_recognition.service import SpeechRecognitionService
-from k_on_k.speech_recognition.faster_whisper_service import FasterWhisperService
 
 __all__ = ["SpeechRecognitionService", "FasterWhisperService"]
+
+
+def __getattr__(name):
+    # Engines pull in ctranslate2 or torch, so they are only imported when used
+    if name == "FasterWhisperService":
+        from k_on_k.speech_recognition.faster_whisper_service import FasterWhisperService
+        return FasterWhisperService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,362 @@
+"""
+Offline transcription for Kitten on Keys.
+Splits recorded dictation into utterances with the live front end and voice
+activity detector, decodes them on a pool of worker processes with one model
+each, and writes the transcripts in order as JSONL or text.
+"""
+
+import copy
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Any, Deque, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+from k_on_k.audio_capture.dsp import AudioFrontEnd
+from k_on_k.audio_capture.sources import read_wav
+from k_on_k.audio_capture.vad import VoiceActivityDetector
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE
+from k_on_k.text_insertion.postprocess import SENTENCE_END, TextPostProcessor
+
+logger = logging.getLogger(__name__)
+
+# Seconds of audio fed to the front end at a time
+BLOCK_S = 1.0
+
+# Chunks queued per worker before the oldest result is waited for
+QUEUE_PER_WORKER = 4
+
+# Engine of this worker process, created by _init_worker
+_engine = None
+
+
+def find_audio_files(paths: List[str]) -> List[Path]:
+    """
+    Expand the paths given on the command line into WAV files.
+
+    Args:
+        paths: Files and directories; directories are searched recursively
+
+    Returns:
+        Files in command-line order, each directory's files sorted by path
+    """
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(file for file in path.rglob("*") if file.suffix.lower() == ".wav"))
+        else:
+            files.append(path)
+    return files
+
+
+def split_utterances(
+    config: Dict[str, Any], samples: np.ndarray, sample_rate: int
+) -> List[Tuple[float, float, np.ndarray]]:
+    """
+    Cut a recording into utterances the way the live pipeline does.
+
+    The audio goes through the same front end (downmix, resampling, high-pass)
+    and voice activity detector as captured audio, so each chunk is what the
+    recognizer would have seen for one utterance.
+
+    Args:
+        config: Application configuration
+        samples: Float32 samples of shape (frames, channels)
+        sample_rate: Sample rate of the recording
+
+    Returns:
+        List of (start, end, audio) with times in seconds and 16 kHz mono audio
+    """
+    front_end = AudioFrontEnd(config, sample_rate, samples.shape[1])
+    vad = VoiceActivityDetector(config)
+    rate = vad.sample_rate
+    utterances = []
+    current: List[np.ndarray] = []
+    fed = 0  # Samples passed to the detector
+
+    def on_speech(audio: np.ndarray):
+        # The detector reuses its frame buffers after the callback returns
+        current.append(audio.copy())
+
+    def on_utterance_end():
+        if current:
+            audio = np.concatenate(current)
+            # An utterance ends at the last frame the detector classified
+            end = vad.frames_total * vad.frame_len if vad.enabled else fed
+            utterances.append((round((end - len(audio)) / rate, 2), round(end / rate, 2), audio))
+            current.clear()
+
+    def on_audio(audio: np.ndarray):
+        nonlocal fed
+        fed += len(audio)
+        vad.process(audio)
+
+    front_end.on_audio = on_audio
+    vad.on_speech = on_speech
+    vad.on_utterance_end = on_utterance_end
+
+    block = max(1, int(BLOCK_S * sample_rate))
+    mono = np.empty(block, dtype=np.float32)
+    for offset in range(0, len(samples), block):
+        front_end.process(front_end.downmix(samples[offset:offset + block], mono))
+    vad.flush()
+    # Without voice activity detection the whole recording is one utterance
+    on_utterance_end()
+    return utterances
+
+
+def read_records(path: str) -> Dict[Tuple[str, float], str]:
+    """
+    Read the transcripts an earlier run wrote, so they aren't decoded again.
+
+    A last record cut off by an interrupted run is removed from the file.
+
+    Args:
+        path: JSONL output of an earlier run
+
+    Returns:
+        Transcript text by (file, start)
+    """
+    records = {}
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return records
+
+    with f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+                records[(record["file"], record["start"])] = record["text"]
+            except (ValueError, KeyError, TypeError):
+                continue
+    return records
+
+
+class TranscriptWriter:
+    """
+    Writes transcripts in order and post-processes them like typed text.
+    Each file's utterances continue one text, so capitalization carries over.
+    """
+
+    def __init__(self, config: Dict[str, Any], out: TextIO, output_format: str, several_files: bool):
+        """
+        Initialize the writer.
+
+        Args:
+            config: Application configuration
+            out: Stream to write to
+            output_format: "jsonl" for one record per utterance, "text" for plain lines
+            several_files: Whether text output needs a header per file
+        """
+        self.post_processor = TextPostProcessor(config)
+        self.out = out
+        self.output_format = output_format
+        self.several_files = several_files
+        self.file: Optional[str] = None
+        self.sentence_start = True
+
+    def write(self, file: str, start: float, end: float, text: Optional[str], recorded: bool = False):
+        """
+        Write the transcript of one utterance.
+
+        Args:
+            file: Recording the utterance is from
+            start: Start of the utterance in seconds
+            end: End of the utterance in seconds
+            text: Recognized text; already processed if recorded
+            recorded: True for a transcript from an earlier run, which is only
+                used to continue the text
+        """
+        if file != self.file:
+            self.file = file
+            self.sentence_start = True
+            if self.output_format == "text" and self.several_files and not recorded:
+                self.out.write(f"==> {file} <==\n")
+
+        if not recorded:
+            text = self.post_processor.process(text, sentence_start=self.sentence_start) if text else ""
+            if self.output_format == "jsonl":
+                self.out.write(json.dumps({"file": file, "start": start, "end": end, "text": text}) + "\n")
+            elif text:
+                self.out.write(text + "\n")
+            self.out.flush()
+        if text:
+            self.sentence_start = text.rstrip()[-1:] in SENTENCE_END
+
+
+def _log_to_stderr():
+    """Move console logging off stdout, which carries the transcripts."""
+    for handler in logging.getLogger().handlers:
+        if type(handler) is logging.StreamHandler and handler.stream is sys.stdout:
+            handler.setStream(sys.stderr)
+
+
+def _init_worker(config: Dict[str, Any]):
+    """
+    Load this worker process's engine.
+
+    Args:
+        config: Application configuration with the worker's thread count applied
+    """
+    global _engine
+    _log_to_stderr()
+    # Imported here to avoid a circular import with the service module
+    from k_on_k.speech_recognition.service import create_engine
+
+    _engine = create_engine(config)
+
+
+def _transcribe_chunk(audio: np.ndarray) -> str:
+    """
+    Decode one utterance in a worker process.
+
+    The utterance goes through the engine's streaming path and is flushed, as
+    at the end of a live utterance, but without the passes in between.
+
+    Args:
+        audio: 16 kHz mono utterance
+
+    Returns:
+        Recognized text, possibly empty
+    """
+    if not _engine.is_available():
+        raise RuntimeError("the model didn't load, see the log for details")
+    _engine.reset()
+    _engine.insert_audio(audio)
+    return _engine.flush() or ""
+
+
+def _set_threads(config: Dict[str, Any], threads: int):
+    """Set the inference thread count of both engines."""
+    stt_config = config["speech_recognition"]
+    stt_config.setdefault("faster_whisper", {})["cpu_threads"] = threads
+    stt_config.setdefault("whisper", {})["threads"] = threads
+
+
+def _write_ready(window: Deque[Tuple[str, float, float, Any]], writer: TranscriptWriter, limit: int) -> int:
+    """
+    Write finished utterances from the head of the queue, in order.
+
+    An utterance whose decode raised is reported and left out of the
+    transcript, so a later --resume run decodes it again.
+
+    Args:
+        window: Queued (file, start, end, future or recorded text) entries
+        writer: Transcript writer
+        limit: Queue length above which the oldest result is waited for
+
+    Returns:
+        Number of utterances that failed to transcribe
+    """
+    failed = 0
+    while window:
+        file, start, end, result = window[0]
+        if isinstance(result, Future):
+            if not result.done() and len(window) <= limit:
+                return failed
+            try:
+                text = result.result()
+            except Exception as e:
+                print(f"Could not transcribe {file} at {start:.2f}s: {e}", file=sys.stderr)
+                failed += 1
+            else:
+                writer.write(file, start, end, text)
+        else:
+            writer.write(file, start, end, result, recorded=True)
+        window.popleft()
+    return failed
+
+
+def run_cli(args, config: Dict[str, Any]) -> int:
+    """
+    Run `kitten-on-keys transcribe`.
+
+    Args:
+        args: Parsed arguments: paths, output, format, jobs and resume
+        config: Application configuration
+
+    Returns:
+        Process exit code
+    """
+    # Imported here so the daemon's startup doesn't touch multiprocessing
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if args.resume and not (args.output and args.format == "jsonl"):
+        print("--resume needs JSONL output to a file (--output)", file=sys.stderr)
+        return 1
+    files = find_audio_files(args.paths)
+    if not files:
+        print("No WAV files found", file=sys.stderr)
+        return 1
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    jobs = args.jobs or max(1, cpus // 2)
+    worker_config = copy.deepcopy(config)
+    _set_threads(worker_config, max(1, cpus // jobs))
+
+    done = read_records(args.output) if args.resume else {}
+    if args.output:
+        out = open(args.output, "a" if args.resume else "w")
+    else:
+        _log_to_stderr()
+        out = sys.stdout
+    writer = TranscriptWriter(config, out, args.format, len(files) > 1)
+    print(f"Transcribing {len(files)} files with {jobs} workers", file=sys.stderr)
+
+    start_time = time.monotonic()
+    audio_s = speech_s = 0.0
+    skipped = failed = failed_chunks = 0
+    window: Deque[Tuple[str, float, float, Any]] = deque()
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(jobs, mp_context=context, initializer=_init_worker, initargs=(worker_config,))
+    try:
+        for path in files:
+            try:
+                samples, sample_rate = read_wav(str(path))
+            except (OSError, EOFError, ValueError) as e:
+                print(f"Could not read {path}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            audio_s += len(samples) / sample_rate
+
+            for start, end, audio in split_utterances(config, samples, sample_rate):
+                key = (str(path), start)
+                if key in done:
+                    window.append((str(path), start, end, done[key]))
+                    skipped += 1
+                    continue
+                window.append((str(path), start, end, pool.submit(_transcribe_chunk, audio)))
+                speech_s += len(audio) / SAMPLE_RATE
+                failed_chunks += _write_ready(window, writer, jobs * QUEUE_PER_WORKER)
+        failed_chunks += _write_ready(window, writer, 0)
+    except Exception as e:
+        print(f"Transcription failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.monotonic() - start_time
+    print(
+        f"{len(files) - failed} files, {audio_s / 60:.1f} min of audio ({speech_s / 60:.1f} min of speech decoded) "
+        f"in {elapsed:.1f}s: {audio_s / max(elapsed, 1e-9):.1f}x real time",
+        file=sys.stderr,
+    )
+    if skipped:
+        print(f"{skipped} utterances were already transcribed", file=sys.stderr)
+    if failed_chunks:
+        print(f"{failed_chunks} utterances could not be transcribed", file=sys.stderr)
+    return 1 if failed or failed_chunks else 0
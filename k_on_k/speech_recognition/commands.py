@@ -0,0 +1,177 @@
+"""
+Voice command matching for Kitten on Keys.
+Spots trigger phrases in the stream of committed words as it is produced.
+"""
+
+import itertools
+import logging
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+from k_on_k.speech_recognition.streaming import _normalize
+
+logger = logging.getLogger(__name__)
+
+# Kinds of matcher output
+EVENT_TEXT = "text"  # Words that are not part of a command
+EVENT_COMMAND = "command"  # A matched command
+
+# Key of the trie node that holds a phrase
+_END = ""
+
+
+class CommandMatch(NamedTuple):
+    """
+    A matched command and the words it covered, as positions in the word stream.
+
+    Positions rather than times: the matcher holds the words back itself, so
+    they never reach the inserted text, and engines in a worker process or
+    behind the model server hand over committed text without timestamps.
+    """
+    phrase: str
+    start: int
+    end: int
+
+
+class CommandMatcher:
+    """
+    Streaming matcher for trigger phrases.
+
+    All phrases, with the spelling variants Whisper produces for them, are
+    compiled into one word-level trie. Each committed word advances the partial
+    matches in flight (at most one per word of the longest phrase), so the cost
+    per word doesn't grow with the number of phrases. Words that might still
+    turn out to be part of a command are held back until the match completes or
+    fails; matched words never reach the output text.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the matcher.
+
+        Args:
+            config: Application configuration
+        """
+        stt_config = config["speech_recognition"]
+        aliases = {
+            _normalize(word): [alias.split() for alias in variants]
+            for word, variants in stt_config.get("command_aliases", {}).items()
+        }
+
+        self.root: Dict[str, Any] = {}
+        for phrase in stt_config.get("trigger_phrases", []):
+            for words in self._variants(phrase, aliases):
+                self._add(words, phrase)
+
+        self.reset()
+
+    @staticmethod
+    def _variants(phrase: str, aliases: Dict[str, List[List[str]]]) -> List[List[str]]:
+        """Expand a phrase into the normalized word sequences it may be recognized as."""
+        choices = []
+        for word in phrase.split():
+            key = _normalize(word)
+            if not key:
+                continue
+            options = [[key]] + [[_normalize(alias) for alias in variant] for variant in aliases.get(key, [])]
+            # A dotted abbreviation ("k.o.k.") may also come out letter by letter
+            if "." in word.strip(".") and len(key) > 1:
+                options.append(list(key))
+            choices.append(options)
+        return [sum(combination, []) for combination in itertools.product(*choices)]
+
+    def _add(self, words: List[str], phrase: str):
+        """Add a normalized word sequence to the trie."""
+        node = self.root
+        for word in words:
+            node = node.setdefault(word, {})
+        node[_END] = phrase
+
+    def reset(self):
+        """Drop held words and partial matches, e.g. when a session starts."""
+        self.held: List[str] = []  # Words not yet released, as recognized
+        self.base = 0  # Stream position of the first held word
+        self.states: List[Tuple[Dict[str, Any], int]] = []  # (trie node, start position) of partial matches
+        self.best: Dict[int, Tuple[int, str]] = {}  # Longest complete match per start: (end, phrase)
+
+    def feed(self, text: Optional[str]) -> List[Tuple[str, Any]]:
+        """
+        Consume newly committed text.
+
+        Args:
+            text: Committed text
+
+        Returns:
+            Events in order: (EVENT_TEXT, text) for released words and
+            (EVENT_COMMAND, CommandMatch) for commands
+        """
+        events: List[Tuple[str, Any]] = []
+        for word in (text or "").split():
+            position = self.base + len(self.held)
+            self.held.append(word)
+            key = _normalize(word)
+            if not key:
+                # Punctuation on its own ("K.o.K. - stop") doesn't break a match
+                continue
+
+            states = []
+            for node, start in self.states + [(self.root, position)]:
+                child = node.get(key)
+                if child is None:
+                    continue
+                if _END in child:
+                    self.best[start] = (position + 1, child[_END])
+                if len(child) > (_END in child):
+                    states.append((child, start))
+            self.states = states
+            self._resolve(events)
+        return events
+
+    def flush(self) -> List[Tuple[str, Any]]:
+        """
+        Release everything held back, e.g. at the end of an utterance.
+
+        Returns:
+            Events in order, as returned by feed()
+        """
+        events: List[Tuple[str, Any]] = []
+        self.states = []
+        self._resolve(events)
+        return events
+
+    def _resolve(self, events: List[Tuple[str, Any]]):
+        """Emit held words and commands that no partial match can change any more."""
+        released: List[str] = []
+        while self.held:
+            first = self.base
+            if any(start == first for _, start in self.states):
+                # A longer match from here is still possible
+                break
+
+            match = self.best.pop(first, None)
+            if match is None:
+                released.append(self.held.pop(0))
+                self.base += 1
+                continue
+
+            end, phrase = match
+            self._emit_text(released, events)
+            released = []
+            logger.info(f"Voice command: {phrase} ({' '.join(self.held[:end - first])})")
+            events.append((EVENT_COMMAND, CommandMatch(phrase, first, end)))
+            # Matches overlapping this one lose (leftmost-longest)
+            del self.held[:end - first]
+            self.base = end
+            self.states = [(node, start) for node, start in self.states if start >= end]
+            self.best = {start: value for start, value in self.best.items() if start >= end}
+
+        self._emit_text(released, events)
+
+    @staticmethod
+    def _emit_text(words: List[str], events: List[Tuple[str, Any]]):
+        """Append released words to the events, merged with text released just before."""
+        if not words:
+            return
+        if events and events[-1][0] == EVENT_TEXT:
+            events[-1] = (EVENT_TEXT, events[-1][1] + " " + " ".join(words))
+        else:
+            events.append((EVENT_TEXT, " ".join(words)))
@@ -0,0 +1,184 @@
+"""
+Punctuation fast path for Kitten on Keys.
+Recognizes short spoken punctuation commands ("comma", "new line") from
+enrolled recordings, so they don't wait for a full model decode.
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE
+from k_on_k.speech_recognition.wake_word import (
+    FRAMES_PER_SECOND,
+    LogMelFeatures,
+    TemplateMatcher,
+    enroll,
+    keyword_slug,
+    load_templates,
+    print_templates,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def commands_dir(config: Dict[str, Any]) -> Path:
+    """
+    Return the directory holding the punctuation command templates.
+
+    Args:
+        config: Application configuration
+
+    Returns:
+        Template root, with one subdirectory per spoken command
+    """
+    fast_path_config = config["speech_recognition"].get("punctuation_fast_path", {})
+    return Path(fast_path_config.get("templates_dir", "~/.kitten_on_keys/punctuation")).expanduser()
+
+
+class PunctuationFastPath:
+    """
+    Classifier for short utterances against the punctuation commands.
+
+    The recognizer hands it the audio of each utterance. If the speech in it
+    is short, the voiced part is aligned end to end with every command template
+    at once (see TemplateMatcher). A command is accepted only if it beats the
+    threshold and the runner-up command by a margin; anything else is left to
+    the model.
+
+    While an utterance is short enough to be a command, the recognizer holds
+    back its model passes (see is_candidate()), so a command isn't committed
+    as text before the utterance ends.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the fast path.
+
+        Args:
+            config: Application configuration
+        """
+        fast_path_config = config["speech_recognition"].get("punctuation_fast_path", {})
+        max_utterance_s = fast_path_config.get("max_utterance_s", 1.0)
+        self.max_frames = int(max_utterance_s * FRAMES_PER_SECOND)
+        # The VAD pads speech with pre-roll before it and silence after it
+        vad_config = config["audio"].get("vad", {})
+        pre_speech_s = vad_config.get("pre_speech_ms", 200) / 1000
+        silence_s = vad_config.get("silence_ms", 700) / 1000
+        self.candidate_samples = int((max_utterance_s + pre_speech_s) * SAMPLE_RATE)
+        self.max_samples = int((max_utterance_s + pre_speech_s + silence_s) * SAMPLE_RATE)
+        self.threshold = fast_path_config.get("threshold", 0.15)
+        self.margin = fast_path_config.get("margin", 0.03)
+        self.features = LogMelFeatures(fast_path_config.get("silence_rms", 0.01))
+
+        # One label per template: the spoken command it is a take of
+        root = commands_dir(config)
+        templates = []
+        self.labels: List[str] = []
+        for spoken in config["speech_recognition"].get("punctuation_commands", {}):
+            for template in load_templates(root / keyword_slug(spoken)):
+                templates.append(template)
+                self.labels.append(spoken)
+        self.matcher = TemplateMatcher(templates)
+        if templates:
+            logger.info(f"Punctuation fast path: {len(templates)} templates for {len(set(self.labels))} commands")
+        else:
+            logger.warning("Punctuation fast path has no templates; run 'kitten-on-keys punctuation enroll'")
+
+        self.reset()
+
+    def reset(self):
+        """Drop the buffered utterance."""
+        self.audio: List[np.ndarray] = []
+        self.samples = 0
+
+    def is_candidate(self) -> bool:
+        """
+        Check whether the utterance so far may still be a command.
+
+        Returns:
+            True while the utterance is short enough for the fast path
+        """
+        return bool(self.labels) and 0 < self.samples <= self.candidate_samples
+
+    def add_audio(self, audio_data: np.ndarray):
+        """
+        Buffer utterance audio, as long as the utterance is still short enough.
+
+        Args:
+            audio_data: 16 kHz mono samples; copied
+        """
+        if self.samples <= self.max_samples and self.labels:
+            self.audio.append(audio_data.copy())
+        self.samples += len(audio_data)
+
+    def classify(self) -> Optional[str]:
+        """
+        Classify the buffered utterance and start a new one.
+
+        Returns:
+            The spoken command the utterance is confidently a take of, or None
+        """
+        audio, samples = self.audio, self.samples
+        self.reset()
+        if not self.labels or not samples or samples > self.max_samples:
+            return None
+
+        self.features.reset()
+        features, voiced = self.features.process(np.concatenate(audio))
+        indices = np.flatnonzero(voiced)
+        if not len(indices) or indices[-1] - indices[0] + 1 > self.max_frames:
+            return None
+
+        self.matcher.reset()
+        scores = None
+        for index in range(indices[0], indices[-1] + 1):
+            scores = self.matcher.advance(features[index], voiced[index], start=index == indices[0])
+
+        best: Dict[str, float] = {}
+        for label, score in zip(self.labels, scores):
+            best[label] = min(score, best.get(label, np.inf))
+        ranked = sorted(best.items(), key=lambda item: item[1])
+        command, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else np.inf
+        if score < self.threshold and runner_up - score >= self.margin:
+            logger.debug(f"Fast path: '{command}' (distance {score:.3f}, runner-up {runner_up:.3f})")
+            return command
+        return None
+
+
+def run_cli(args, config: Dict[str, Any]) -> int:
+    """
+    Run a `kitten-on-keys punctuation` subcommand.
+
+    Args:
+        args: Parsed arguments with `punctuation_command` and its options
+        config: Application configuration
+
+    Returns:
+        Process exit code
+    """
+    root = commands_dir(config)
+    commands = config["speech_recognition"].get("punctuation_commands", {})
+
+    if args.punctuation_command == "list":
+        for spoken in commands:
+            print_templates(root / keyword_slug(spoken), spoken)
+        return 0
+
+    if args.punctuation_command == "enroll":
+        if args.spoken not in commands:
+            print(f"'{args.spoken}' is not in speech_recognition.punctuation_commands")
+            return 1
+        silence_rms = config["speech_recognition"].get("punctuation_fast_path", {}).get("silence_rms", 0.01)
+        return 1 if enroll(root / keyword_slug(args.spoken), args.paths, silence_rms) else 0
+
+    if args.punctuation_command == "clear":
+        for path in root.glob("*/*.npy"):
+            path.unlink()
+        print(f"Removed the templates in {root}")
+        return 0
+
+    return 1
@@ -4,13 +4,24 @@ Uses the faster-whisper package (whisper.cpp port) for low-latency streaming tra
 """
 
 import logging
-from typing import Dict, Any, List, Optional, Callable
+import time
+from typing import Dict, Any, List, Optional, Tuple
 
 import numpy as np
 from faster_whisper import WhisperModel
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_suppressed_tokens
+
+from k_on_k.speech_recognition.model_store import BACKEND_CTRANSLATE2, ModelStore
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE, StreamingTranscriber, Word
 
 logger = logging.getLogger(__name__)
 
+# faster-whisper's defaults for attaching punctuation to the neighbouring word
+PREPEND_PUNCTUATIONS = "\"'“¿([{-"
+APPEND_PUNCTUATIONS = "\"'.。,，!！?？:：”)]}、"
+
 
 class FasterWhisperService:
     """
@@ -31,26 +42,41 @@ class FasterWhisperService:
         self.compute_type = fw_config.get("compute_type", "default")
         self.chunk_length_s = fw_config.get("chunk_length_s", 1.0)
         self.beam_size = fw_config.get("beam_size", None)
+        self.cpu_threads = fw_config.get("cpu_threads", 0)
+        self.num_workers = fw_config.get("num_workers", 1)
+        self.fast_decode = False  # Greedy decoding while the recognizer is falling behind
 
         self.language = config.get("general", {}).get("language", "en-US")[:2]
         
-        # Load the faster-whisper model
-        logger.info(f"Loading faster-whisper model: {self.model_name} on {self.device} (compute_type={self.compute_type})")
+        # Load the faster-whisper model, from the local model store if it has a copy.
+        # Otherwise only the Hugging Face cache is used unless local_files_only is off.
+        local_files_only = config.get("speech_recognition", {}).get("model_store", {}).get("local_files_only", True)
+        model_path = ModelStore.from_config(config).resolve(self.model_name, BACKEND_CTRANSLATE2)
+        logger.info(
+            f"Loading faster-whisper model: {model_path or self.model_name} on {self.device} "
+            f"(compute_type={self.compute_type}, cpu_threads={self.cpu_threads or 'auto'})"
+        )
+        start_time = time.time()
         self.model = WhisperModel(
-            self.model_name,
+            str(model_path) if model_path else self.model_name,
             device=self.device,
             compute_type=self.compute_type,
+            cpu_threads=self.cpu_threads,
+            num_workers=self.num_workers,
+            local_files_only=local_files_only,
         )
+        self.load_time_s = time.time() - start_time
+        logger.info(f"faster-whisper model loaded in {self.load_time_s:.2f} seconds")
         self.is_loaded = True
-        self.last_transcript = ""
+        self.tokenizer: Optional[Tokenizer] = None  # Created on the first batched decode
+        self.decoder_calls = 0  # Decodes run, single or batched
 
-        # Callback for on_transcription
-        self.on_transcription: Optional[Callable[[str], None]] = None
-        self.on_command: Optional[Callable[[str], None]] = None
+        # Sliding-window streaming state
+        self.streamer = StreamingTranscriber(self.transcribe_words, config)
 
     def process_audio(self, audio_data: np.ndarray) -> Optional[str]:
         """
-        Process a chunk of audio data and return any new transcription text.
+        Process a chunk of audio data and return any newly committed text.
 
         Args:
             audio_data: NumPy array of audio samples (mono)
@@ -59,39 +85,180 @@ class FasterWhisperService:
             New transcription text, or None if no new text
         """
         try:
-            # Run streaming transcription on the chunk
-            segments, info = self.model.transcribe(
-                audio_data,
-                beam_size=self.beam_size or 5,
-                language=self.language,
-                step=self.chunk_length_s,
-            )
-            combined = "".join([seg.text for seg in segments]).strip()
-            if combined and combined != self.last_transcript:
-                # Extract new part
-                new_text = combined[len(self.last_transcript):].strip()
-                self.last_transcript = combined
-                return new_text
+            return self.streamer.process_audio(audio_data)
+        except Exception as e:
+            logger.error(f"Error in faster-whisper transcription: {e}")
             return None
+
+    def insert_audio(self, audio_data: np.ndarray):
+        """
+        Append audio to the streaming window without running inference.
+
+        Args:
+            audio_data: NumPy array of audio samples (mono)
+        """
+        self.streamer.insert_audio(audio_data)
+
+    def process_iter(self) -> Optional[str]:
+        """
+        Run one transcription pass over the audio inserted so far.
+
+        Returns:
+            New transcription text, or None if no new text
+        """
+        try:
+            return self.streamer.process_iter()
         except Exception as e:
             logger.error(f"Error in faster-whisper transcription: {e}")
             return None
 
+    def flush(self) -> Optional[str]:
+        """
+        Commit whatever is left in the window, e.g. when dictation stops.
+
+        Returns:
+            Remaining transcription text, or None if nothing was left
+        """
+        try:
+            return self.streamer.finish()
+        except Exception as e:
+            logger.error(f"Error flushing faster-whisper transcription: {e}")
+            return None
+
+    def transcribe_words(self, audio: np.ndarray, prompt: Optional[str] = None) -> List[Word]:
+        """
+        Transcribe a window of audio into words with timestamps.
+
+        Args:
+            audio: Audio window (16 kHz mono float32)
+            prompt: Previously committed text used as decoding context
+
+        Returns:
+            Recognized words, timed relative to the window start
+        """
+        self.decoder_calls += 1
+        segments, info = self.model.transcribe(
+            audio,
+            beam_size=1 if self.fast_decode else self.beam_size or 5,
+            language=self.language,
+            initial_prompt=prompt,
+            condition_on_previous_text=False,
+            word_timestamps=True,
+        )
+        return [
+            Word(word.start, word.end, word.word)
+            for segment in segments
+            for word in (segment.words or [])
+        ]
+
+    def transcribe_batch(self, windows: List[Tuple[np.ndarray, Optional[str]]]) -> List[List[Word]]:
+        """
+        Transcribe the windows of several streaming sessions in one batched decode.
+
+        Each window is its own batch item, padded to Whisper's 30-second input and
+        decoded with its own session's prompt, so the encoder and decoder run once
+        per batch instead of once per window. Windows longer than 30 seconds don't
+        fit a batch item and are decoded on their own.
+
+        Args:
+            windows: (audio, prompt) per session
+
+        Returns:
+            Recognized words per window, timed relative to that window's start
+        """
+        max_samples = self.model.feature_extractor.chunk_length * SAMPLE_RATE
+        batch = [index for index, (audio, _) in enumerate(windows) if len(audio) <= max_samples]
+
+        results: List[List[Word]] = [[] for _ in windows]
+        for index, (audio, prompt) in enumerate(windows):
+            if len(audio) > max_samples:
+                results[index] = self.transcribe_words(audio, prompt)
+        if batch:
+            decoded = self._decode_batch([windows[index][0] for index in batch], [windows[index][1] for index in batch])
+            for index, words in zip(batch, decoded):
+                results[index] = words
+        return results
+
+    def _decode_batch(self, clips: List[np.ndarray], prompts: List[Optional[str]]) -> List[List[Word]]:
+        """
+        Decode windows of at most 30 seconds as the items of one batch.
+
+        Mirrors faster-whisper's batched pipeline, except that every item gets its
+        own prompt: one encoder call, one generate call with a prompt per item, and
+        one alignment call for the word timestamps.
+
+        Args:
+            clips: Audio windows
+            prompts: Prompt per window, or None
+
+        Returns:
+            Recognized words per window, timed relative to that window's start
+        """
+        tokenizer = self._tokenizer()
+        # Mel frames with audio in them, before padding to the encoder's input length
+        features = [self.model.feature_extractor(audio)[..., :-1] for audio in clips]
+        num_frames = [feature.shape[-1] for feature in features]
+        encoder_output = self.model.encode(np.stack([pad_or_trim(feature) for feature in features]))
+
+        prompt_tokens = [
+            self.model.get_prompt(
+                tokenizer,
+                previous_tokens=tokenizer.encode(" " + prompt.strip()) if prompt else [],
+                without_timestamps=True,
+            )
+            for prompt in prompts
+        ]
+        self.decoder_calls += 1
+        results = self.model.model.generate(
+            encoder_output,
+            prompt_tokens,
+            beam_size=1 if self.fast_decode else self.beam_size or 5,
+            max_length=self.model.max_length,
+            suppress_blank=True,
+            suppress_tokens=list(get_suppressed_tokens(tokenizer, [-1])),
+        )
+
+        # One segment per window, spanning all of it; alignment times its words
+        segments = [
+            [{"tokens": result.sequences_ids[0], "start": 0.0, "end": len(audio) / SAMPLE_RATE, "seek": 0}]
+            for audio, result in zip(clips, results)
+        ]
+        self.model.add_word_timestamps(
+            segments, tokenizer, encoder_output, num_frames, PREPEND_PUNCTUATIONS, APPEND_PUNCTUATIONS, 0.0
+        )
+        return [
+            [Word(word["start"], word["end"], word["word"]) for word in segment[0].get("words", [])]
+            for segment in segments
+        ]
+
+    def _tokenizer(self) -> Tokenizer:
+        """Return the tokenizer for the configured language, created on first use."""
+        if self.tokenizer is None:
+            multilingual = self.model.model.is_multilingual
+            self.tokenizer = Tokenizer(
+                self.model.hf_tokenizer,
+                multilingual,
+                task="transcribe",
+                language=self.language if multilingual else None,
+            )
+        return self.tokenizer
+
     def reset(self):
         """Reset transcription state to start fresh."""
-        self.last_transcript = ""
+        self.streamer.reset()
+
+    def drop_utterance(self):
+        """Drop the current utterance without decoding it, keeping the context."""
+        self.streamer.drop_utterance()
 
-    def detect_commands(self, text: str, trigger_phrases: List[str]) -> Optional[str]:
+    def set_fast_decode(self, enabled: bool):
         """
-        Detect trigger phrases in the text, identical to WhisperService.
+        Switch between the configured beam size and greedy decoding.
+
+        Args:
+            enabled: True to decode greedily
         """
-        if not text:
-            return None
-        lower = text.lower()
-        for phrase in trigger_phrases:
-            if phrase.lower() in lower:
-                return phrase
-        return None
+        self.fast_decode = enabled
 
     def is_available(self) -> bool:
         """
@@ -0,0 +1,600 @@
+"""
+Local model server for Kitten on Keys.
+Keeps one speech-to-text model loaded behind a Unix domain socket, so daemon restarts
+and other local tools can share it instead of loading their own copy.
+"""
+
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from k_on_k.metrics import LatencyStats
+from k_on_k.speech_recognition.streaming import StreamingTranscriber, Word
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "~/.kitten_on_keys/stt.sock"
+
+# Every message is a header of (opcode or status, payload length) followed by the payload.
+# Requests carry little-endian float32 audio at 16 kHz; replies carry UTF-8 text.
+HEADER = struct.Struct("<BI")
+
+OP_PROCESS = 1  # Append the audio and run a transcription pass
+OP_FLUSH = 2  # Append the audio and commit everything left
+OP_RESET = 3  # Start a new session
+OP_PING = 4
+OP_DROP = 5  # Drop the current utterance, keeping the session's context
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+def _send_message(sock: socket.socket, code: int, payload: bytes = b""):
+    """Send one framed message."""
+    sock.sendall(HEADER.pack(code, len(payload)) + payload)
+
+
+def _recv_message(rfile) -> Optional[tuple]:
+    """
+    Read one framed message.
+
+    Args:
+        rfile: Buffered file wrapping the socket
+
+    Returns:
+        Tuple of (code, payload), or None if the peer closed the connection
+    """
+    header = rfile.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    code, length = HEADER.unpack(header)
+    payload = rfile.read(length)
+    if len(payload) < length:
+        return None
+    return code, payload
+
+
+def get_socket_path(config: Dict[str, Any]) -> Path:
+    """
+    Return the model server's socket path from the configuration.
+
+    Args:
+        config: Application configuration
+
+    Returns:
+        Expanded socket path
+    """
+    server_config = config["speech_recognition"].get("server", {})
+    return Path(server_config.get("socket_path") or DEFAULT_SOCKET_PATH).expanduser()
+
+
+class _Request:
+    """A unit of work queued for the inference thread."""
+
+    def __init__(self, session: StreamingTranscriber, op: int, audio: np.ndarray):
+        self.session = session
+        self.op = op
+        self.audio = audio
+        self.result: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+        self.queued_at = time.perf_counter()
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    """Serves one client connection, which owns one streaming session."""
+
+    def handle(self):
+        model_server = self.server.model_server
+        session = model_server.create_session()
+        model_server.connections.add(self.connection)
+
+        try:
+            self._serve(model_server, session)
+        finally:
+            model_server.connections.discard(self.connection)
+            model_server.close_session(session)
+
+    def _serve(self, model_server: "ModelServer", session: StreamingTranscriber):
+        """Answer requests until the client disconnects."""
+        while True:
+            message = _recv_message(self.rfile)
+            if message is None:
+                break
+
+            op, payload = message
+            if op == OP_PING:
+                _send_message(self.connection, STATUS_OK)
+                continue
+
+            try:
+                audio = np.frombuffer(payload, dtype="<f4")
+                status, reply = STATUS_OK, model_server.submit(session, op, audio) or ""
+            except Exception as e:
+                logger.error(f"Error serving transcription request: {str(e)}")
+                status, reply = STATUS_ERROR, str(e)
+
+            try:
+                _send_message(self.connection, status, reply.encode("utf-8"))
+            except OSError:
+                break  # The client went away
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ModelServer:
+    """
+    Owns a loaded speech-to-text model and serves local clients over a Unix socket.
+    Each connection gets its own streaming session; a single inference thread runs
+    all requests, so the model is never used concurrently.
+
+    Passes from different sessions are batched: after taking the oldest request,
+    the inference thread waits up to batch_wait_ms for other connected sessions
+    to send theirs, and decodes all their windows in one call if the engine has
+    transcribe_batch(). A client waits for each reply before sending its next
+    request, so a session has at most one request in a batch and requests are
+    served oldest first. Each request's queueing plus decoding time is checked
+    against latency_slo_ms and reported per session. When the oldest request of a
+    batch nears the SLO, the batch waits less and takes fewer windows, going by
+    the recent decode time per window.
+    """
+
+    def __init__(self, config: Dict[str, Any], engine=None):
+        """
+        Initialize the model server.
+
+        Args:
+            config: Application configuration
+            engine: Already loaded engine to serve; created from the configuration if None
+        """
+        self.config = config
+        self.socket_path = get_socket_path(config)
+        self.engine = engine
+
+        server_config = config["speech_recognition"].get("server", {})
+        self.max_batch = max(1, server_config.get("max_batch", 8))
+        self.batch_wait_s = server_config.get("batch_wait_ms", 20.0) / 1000
+        self.latency_slo_s = server_config.get("latency_slo_ms", 1500.0) / 1000
+
+        self.requests: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self.backlog: Deque[_Request] = deque()  # Requests held over from a full batch
+        # Request latency (queueing plus decoding) per session, and over all sessions
+        self.session_stats: Dict[StreamingTranscriber, LatencyStats] = {}
+        self.latency_stats = LatencyStats("Request latency")
+        self.slo_misses = 0
+        self.window_decode_s = 0.0  # Smoothed decode time per window of a batch
+        # Windows decoded and the decoder calls that decoded them, batched or not
+        self.decoded_windows = 0
+        self.decodes = 0
+        self.server = None
+        self.server_thread = None
+        self.inference_thread = None
+        self.connections = set()
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Load and warm up the model, then start accepting connections."""
+        if self.engine is None:
+            # Imported here to avoid a circular import with the service module
+            from k_on_k.speech_recognition.service import create_engine
+
+            self.engine = create_engine(self.config)
+        self._warm_up()
+
+        self._remove_stale_socket()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # Only the owning user may send audio; the socket is created with these
+        # permissions, so there's no moment in which others could connect
+        old_umask = os.umask(0o177)
+        try:
+            self.server = _UnixServer(str(self.socket_path), _ConnectionHandler)
+        finally:
+            os.umask(old_umask)
+        self.server.model_server = self
+
+        self.stopped.clear()
+        self.inference_thread = threading.Thread(target=self._run_inference, daemon=True)
+        self.inference_thread.start()
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        logger.info(f"Model server listening on {self.socket_path}")
+
+    def serve_forever(self):
+        """Start the server and block until `stop` is called."""
+        self.start()
+        self.stopped.wait()
+
+    def stop(self):
+        """Stop accepting connections and shut down the inference thread."""
+        server, self.server = self.server, None
+        if server is None:
+            return
+
+        logger.info("Stopping model server")
+        server.shutdown()
+        server.server_close()
+
+        # Disconnect clients so they notice the restart instead of waiting for replies
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        self.requests.put(None)
+        self.inference_thread.join(timeout=5.0)
+        leftover = list(self.backlog)
+        while not self.requests.empty():
+            leftover.append(self.requests.get())
+        for request in leftover:
+            if request is not None:
+                request.error = RuntimeError("model server stopped")
+                request.done.set()
+        if self.latency_stats.count:
+            logger.info(
+                f"{self.latency_stats.format()}, {self.slo_misses} over the "
+                f"{1000 * self.latency_slo_s:.0f} ms SLO; {self.decoded_windows} windows in "
+                f"{self.decodes} decodes ({self.decoded_windows / max(self.decodes, 1):.1f} per decode)"
+            )
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+        self.stopped.set()
+
+    def create_session(self) -> StreamingTranscriber:
+        """
+        Create the streaming state for a new client connection.
+
+        Returns:
+            StreamingTranscriber that decodes with the shared model
+        """
+        session = StreamingTranscriber(self._transcribe_words, self.config)
+        self.session_stats[session] = LatencyStats("Session request latency")
+        return session
+
+    def close_session(self, session: StreamingTranscriber):
+        """
+        Log the latency a session saw and forget it, once its connection closes.
+
+        Args:
+            session: Session returned by create_session()
+        """
+        stats = self.session_stats.pop(session, None)
+        if stats is not None and stats.count:
+            logger.info(stats.format())
+
+    def submit(self, session: StreamingTranscriber, op: int, audio: np.ndarray) -> Optional[str]:
+        """
+        Queue a request for the inference thread and wait for its result.
+
+        Args:
+            session: Streaming session of the requesting connection
+            op: OP_PROCESS, OP_FLUSH, OP_RESET or OP_DROP
+            audio: Audio to append before the request runs
+
+        Returns:
+            Newly committed text, or None
+        """
+        request = _Request(session, op, audio)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.result
+
+    def _run_inference(self):
+        """Run queued requests, batching the passes of different sessions."""
+        while True:
+            request = self.backlog.popleft() if self.backlog else self.requests.get()
+            if request is None:
+                break
+
+            batch = [request]
+            stopping = self._fill_batch(batch)
+            self._run_batch(batch)
+            if stopping:
+                break
+
+    def _fill_batch(self, batch: List[_Request]) -> bool:
+        """
+        Add requests of other sessions to a batch.
+
+        Waits up to batch_wait_ms, but only while other connected sessions might
+        still send a request and the engine can decode them together. Neither the
+        wait nor another window may push the oldest request past the latency SLO,
+        unless it will miss the SLO anyway; then the batch fills up for throughput.
+
+        Args:
+            batch: Batch holding the oldest request; extended in place
+
+        Returns:
+            True if the server is stopping
+        """
+        can_batch = hasattr(self.engine, "transcribe_batch")
+        deadline = time.perf_counter() + self.batch_wait_s
+        slo_deadline = batch[0].queued_at + self.latency_slo_s
+        while len(batch) < self.max_batch:
+            # Latest time at which a batch with one more window can start decoding in time
+            latest_start = slo_deadline - self.window_decode_s * (len(batch) + 1)
+            now = time.perf_counter()
+            if now > latest_start and now + self.window_decode_s * len(batch) <= slo_deadline:
+                return False
+            if self.backlog:
+                request = self.backlog.popleft()
+            else:
+                timeout = min(deadline, latest_start) - now
+                waiting = can_batch and timeout > 0 and len(self.connections) > len(batch)
+                try:
+                    request = self.requests.get(timeout=timeout) if waiting else self.requests.get_nowait()
+                except queue.Empty:
+                    return False
+            if request is None:
+                return True
+            if any(queued.session is request.session for queued in batch):
+                # A session's requests run in order; this one goes into the next batch
+                self.backlog.appendleft(request)
+                return False
+            batch.append(request)
+        return False
+
+    def _run_batch(self, batch: List[_Request]):
+        """Run a batch of requests, decoding all their windows in one call if possible."""
+        passes: List[Tuple[_Request, Tuple[np.ndarray, Optional[str]]]] = []
+        for request in batch:
+            try:
+                session = request.session
+                if request.op == OP_RESET:
+                    session.reset()
+                elif request.op == OP_DROP:
+                    session.drop_utterance()
+                else:
+                    session.insert_audio(request.audio)
+                    window = session.window_input()
+                    if window is not None:
+                        passes.append((request, window))
+                        continue
+                    request.result = session.finish() if request.op == OP_FLUSH else session.process_iter()
+            except Exception as e:
+                request.error = e
+            self._complete(request)
+
+        if not passes:
+            return
+        start_time = time.perf_counter()
+        for (request, _), words in zip(passes, self._decode([window for _, window in passes])):
+            try:
+                session = request.session
+                request.result = session.finish(words) if request.op == OP_FLUSH else session.process_iter(words)
+            except Exception as e:
+                request.error = e
+            self._complete(request)
+        self.window_decode_s += 0.2 * ((time.perf_counter() - start_time) / len(passes) - self.window_decode_s)
+
+    def _decode(self, windows: List[Tuple[np.ndarray, Optional[str]]]) -> List[Optional[List[Word]]]:
+        """
+        Decode the windows of several sessions together.
+
+        Returns:
+            Words per window; None where each session has to decode its own window
+        """
+        if len(windows) > 1 and hasattr(self.engine, "transcribe_batch"):
+            # Engines that count their decoder calls also report windows they had to
+            # decode on their own; otherwise a successful batch is taken as one call
+            decoder_calls = getattr(self.engine, "decoder_calls", None)
+            words = None
+            try:
+                words = self.engine.transcribe_batch(windows)
+                self.decoded_windows += len(windows)
+            except Exception as e:
+                logger.warning(f"Batched decode failed, decoding one window at a time: {str(e)}")
+            if decoder_calls is not None:
+                self.decodes += self.engine.decoder_calls - decoder_calls
+            elif words is not None:
+                self.decodes += 1
+            if words is not None:
+                return words
+        return [None] * len(windows)
+
+    def _transcribe_words(self, audio: np.ndarray, prompt: Optional[str] = None) -> List[Word]:
+        """Decode one session's window on its own (inference thread)."""
+        self.decoded_windows += 1
+        self.decodes += 1
+        return self.engine.transcribe_words(audio, prompt)
+
+    def _complete(self, request: _Request):
+        """Record a request's latency and hand the result to the waiting connection."""
+        latency = time.perf_counter() - request.queued_at
+        self.latency_stats.add(latency)
+        if request.session in self.session_stats:
+            self.session_stats[request.session].add(latency)
+        if latency > self.latency_slo_s:
+            self.slo_misses += 1
+        request.done.set()
+
+    def _warm_up(self):
+        """Run one decode so the first real request doesn't pay for lazy initialization."""
+        # Imported here to avoid a circular import with the service module
+        from k_on_k.speech_recognition.service import warm_up
+
+        logger.info(f"Warm-up decode took {warm_up(self.engine):.2f}s")
+
+    def _remove_stale_socket(self):
+        """Remove a socket file left behind by a server that is no longer running."""
+        if not self.socket_path.exists():
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            self.socket_path.unlink()
+        else:
+            raise RuntimeError(f"A model server is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+
+class ModelServerClient:
+    """
+    Proxy for a model served by ModelServer.
+    Offers the same streaming interface as the in-process engines.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the client.
+
+        Args:
+            config: Application configuration
+        """
+        self.socket_path = get_socket_path(config)
+        self.timeout_s = config["speech_recognition"].get("server", {}).get("timeout_s", 60.0)
+        self.sock = None
+        self.rfile = None
+
+        # Audio is sent along with the next transcription request
+        self.pending_audio: List[np.ndarray] = []
+
+    def connect(self):
+        """
+        Connect to the server.
+
+        Raises:
+            OSError: If no server is listening on the socket
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout_s)
+        try:
+            sock.connect(str(self.socket_path))
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+
+    def stop(self):
+        """Disconnect from the server; the server and its model keep running."""
+        if self.sock is not None:
+            self.rfile.close()
+            self.sock.close()
+            self.sock = None
+            self.rfile = None
+
+    def insert_audio(self, audio_data: np.ndarray):
+        """
+        Queue audio for the next request without contacting the server.
+
+        Args:
+            audio_data: Audio samples (16 kHz mono float32); copied, so may be a view
+        """
+        self.pending_audio.append(np.array(audio_data, dtype=np.float32))
+
+    def process_iter(self) -> Optional[str]:
+        """
+        Send the queued audio and run one transcription pass on the server.
+
+        Returns:
+            Newly committed text, or None if nothing was committed
+        """
+        return self._request(OP_PROCESS)
+
+    def process_audio(self, audio_data: np.ndarray) -> Optional[str]:
+        """
+        Append audio and run one transcription pass on the server.
+
+        Args:
+            audio_data: Audio samples (16 kHz mono float32)
+
+        Returns:
+            Newly committed text, or None if nothing was committed
+        """
+        self.insert_audio(audio_data)
+        return self.process_iter()
+
+    def flush(self) -> Optional[str]:
+        """
+        Send the queued audio and commit everything left in the session.
+
+        Returns:
+            Remaining text, or None if there was nothing left
+        """
+        return self._request(OP_FLUSH)
+
+    def reset(self):
+        """Drop all audio and text to start a new session."""
+        self.pending_audio = []
+        self._request(OP_RESET)
+
+    def drop_utterance(self):
+        """Drop the current utterance without decoding it, keeping the context."""
+        self.pending_audio = []
+        self._request(OP_DROP)
+
+    def is_available(self) -> bool:
+        """
+        Check if the server answers.
+
+        Returns:
+            True if the server is reachable, False otherwise
+        """
+        try:
+            if self.sock is None:
+                self.connect()
+            _send_message(self.sock, OP_PING)
+            return _recv_message(self.rfile) is not None
+        except OSError:
+            self.stop()
+            return False
+
+    def _request(self, op: int) -> Optional[str]:
+        """
+        Send a request with the queued audio and wait for the reply.
+
+        Reconnects once if the server was restarted; the new connection starts a
+        new session, so uncommitted text from the old one is lost.
+
+        Args:
+            op: Request opcode
+
+        Returns:
+            Text from the server, or None
+        """
+        payload = b""
+        if self.pending_audio and op != OP_RESET:
+            payload = np.concatenate(self.pending_audio).astype("<f4", copy=False).tobytes()
+        self.pending_audio = []
+
+        for attempt in range(2):
+            try:
+                if self.sock is None:
+                    self.connect()
+                _send_message(self.sock, op, payload)
+                reply = _recv_message(self.rfile)
+                if reply is None:
+                    raise ConnectionError("model server closed the connection")
+                break
+            except OSError as e:
+                self.stop()
+                if attempt or isinstance(e, TimeoutError):
+                    logger.error(f"Model server request failed: {str(e)}")
+                    return None
+                logger.warning(f"Lost connection to model server, reconnecting: {str(e)}")
+
+        status, data = reply
+        if status != STATUS_OK:
+            logger.error(f"Model server error: {data.decode('utf-8', 'replace')}")
+            return None
+        return data.decode("utf-8") or None
@@ -0,0 +1,313 @@
+"""
+Local model store for Kitten on Keys.
+Keeps pre-converted model files under ~/.kitten_on_keys/models with a manifest of
+checksums, so models load from disk without any Hugging Face hub lookups.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = "~/.kitten_on_keys/models"
+MANIFEST_NAME = "manifest.json"
+
+# Backends, matching the engine that loads the files
+BACKEND_CTRANSLATE2 = "ctranslate2"  # Converted model directory for faster-whisper
+BACKEND_WHISPER = "openai-whisper"  # Single .pt checkpoint for openai-whisper
+BACKENDS = (BACKEND_CTRANSLATE2, BACKEND_WHISPER)
+
+# Files faster-whisper needs locally; without tokenizer.json it asks the hub for one
+CTRANSLATE2_REQUIRED_FILES = ("model.bin", "config.json", "tokenizer.json")
+
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def _sha256(path: Path) -> str:
+    """Return the hex SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """
+    Directory of model files plus a JSON manifest.
+
+    Each entry is identified by backend and name, e.g. ("openai-whisper", "turbo")
+    or ("ctranslate2", "openai/whisper-large-v3-turbo"), and records the size and
+    checksum of every file it contains.
+    """
+
+    def __init__(self, root: Path):
+        """
+        Initialize the model store.
+
+        Args:
+            root: Store directory
+        """
+        self.root = Path(root).expanduser()
+        self.manifest_path = self.root / MANIFEST_NAME
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ModelStore":
+        """
+        Create the store configured in speech_recognition.model_store.
+
+        Args:
+            config: Application configuration
+
+        Returns:
+            ModelStore instance
+        """
+        store_config = config.get("speech_recognition", {}).get("model_store", {})
+        return cls(Path(store_config.get("path") or DEFAULT_STORE_PATH))
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        Return all manifest entries.
+
+        Returns:
+            List of entry dicts, sorted by backend and name
+        """
+        models = self._read_manifest()["models"]
+        return [models[key] for key in sorted(models)]
+
+    def get(self, name: str, backend: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a manifest entry.
+
+        Args:
+            name: Model name
+            backend: One of BACKENDS
+
+        Returns:
+            Entry dict, or None if the store doesn't have the model
+        """
+        return self._read_manifest()["models"].get(f"{backend}/{name}")
+
+    def resolve(self, name: str, backend: str) -> Optional[Path]:
+        """
+        Return the path to load a model from, if the store has an intact copy.
+
+        Only file presence and sizes are checked, so this is cheap enough for
+        startup; `verify` compares checksums.
+
+        Args:
+            name: Model name
+            backend: One of BACKENDS
+
+        Returns:
+            Model directory (ctranslate2) or checkpoint file (openai-whisper), or None
+        """
+        entry = self.get(name, backend)
+        if entry is None:
+            return None
+
+        problems = self._check_entry(entry, checksums=False)
+        if problems:
+            logger.warning(f"Ignoring damaged model store entry {backend}/{name}: {'; '.join(problems)}")
+            return None
+        return self.root / entry["path"]
+
+    def prefetch(self, name: str, source: Path, backend: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Copy a model from a local path into the store and record its checksums.
+
+        Args:
+            name: Name to store the model under, e.g. the engine's model name
+            source: Converted CTranslate2 model directory or openai-whisper .pt checkpoint
+            backend: One of BACKENDS; detected from the source if None
+
+        Returns:
+            The new manifest entry
+
+        Raises:
+            ValueError: If the name can't be stored, or the source doesn't look like
+                a model for the backend
+        """
+        if not name or name.startswith("/") or ".." in name or name.strip("/") in (".", ""):
+            raise ValueError(f"Invalid model name: {name!r}")
+
+        source = Path(source).expanduser()
+        if backend is None:
+            backend = BACKEND_CTRANSLATE2 if source.is_dir() else BACKEND_WHISPER
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+
+        if backend == BACKEND_CTRANSLATE2:
+            missing = [f for f in CTRANSLATE2_REQUIRED_FILES if not (source / f).is_file()]
+            if not source.is_dir() or missing:
+                raise ValueError(f"{source} is not a CTranslate2 model directory (missing {', '.join(missing)})")
+        elif not source.is_file():
+            raise ValueError(f"{source} is not an openai-whisper checkpoint file")
+
+        # Copy next to the final location, then move into place so a partial copy is never used
+        entry_dir = Path(backend) / name.replace("/", "--")
+        target = self.root / entry_dir
+        # Replacing an entry deletes its directory, which must stay the entry's own
+        if target.resolve().parent != (self.root / backend).resolve():
+            raise ValueError(f"Invalid model name: {name!r}")
+        staging = self.root / ".staging" / entry_dir
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.parent.mkdir(parents=True, exist_ok=True)
+        if backend == BACKEND_CTRANSLATE2:
+            shutil.copytree(source, staging)
+        else:
+            staging.mkdir()
+            shutil.copy2(source, staging / source.name)
+
+        files = {}
+        for path in sorted(p for p in staging.rglob("*") if p.is_file()):
+            files[path.relative_to(staging).as_posix()] = {
+                "size": path.stat().st_size,
+                "sha256": _sha256(path),
+            }
+
+        shutil.rmtree(target, ignore_errors=True)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging, target)
+        shutil.rmtree(self.root / ".staging", ignore_errors=True)
+
+        entry = {
+            "name": name,
+            "backend": backend,
+            "path": (entry_dir if backend == BACKEND_CTRANSLATE2 else entry_dir / source.name).as_posix(),
+            "dir": entry_dir.as_posix(),
+            "source": str(source),
+            "added": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "files": files,
+        }
+        manifest = self._read_manifest()
+        manifest["models"][f"{backend}/{name}"] = entry
+        self._write_manifest(manifest)
+        logger.info(f"Added {backend}/{name} to the model store ({len(files)} files)")
+        return entry
+
+    def verify(self, name: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        Compare stored files against the manifest checksums.
+
+        Args:
+            name: Only verify entries with this name; all entries if None
+
+        Returns:
+            Dict mapping "backend/name" to a list of problems (empty if intact)
+        """
+        return {
+            f"{entry['backend']}/{entry['name']}": self._check_entry(entry, checksums=True)
+            for entry in self.entries()
+            if name is None or entry["name"] == name
+        }
+
+    def _check_entry(self, entry: Dict[str, Any], checksums: bool) -> List[str]:
+        """List missing, resized or (optionally) corrupted files of an entry."""
+        problems = []
+        entry_dir = self.root / entry["dir"]
+        for relative, info in entry["files"].items():
+            path = entry_dir / relative
+            if not path.is_file():
+                problems.append(f"{relative} is missing")
+            elif path.stat().st_size != info["size"]:
+                problems.append(f"{relative} has the wrong size")
+            elif checksums and _sha256(path) != info["sha256"]:
+                problems.append(f"{relative} has the wrong checksum")
+        return problems
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        """Load the manifest, or an empty one if the store is new."""
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 1, "models": {}}
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        """Write the manifest atomically."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_path = self.manifest_path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
+
+
+def run_cli(args, config: Dict[str, Any]) -> int:
+    """
+    Run a `kitten-on-keys models` subcommand.
+
+    Args:
+        args: Parsed arguments with `models_command` and its options
+        config: Application configuration
+
+    Returns:
+        Process exit code
+    """
+    store = ModelStore.from_config(config)
+
+    if args.models_command == "list":
+        entries = store.entries()
+        if not entries:
+            print(f"No models in {store.root}")
+        for entry in entries:
+            size_mb = sum(info["size"] for info in entry["files"].values()) / 1e6
+            print(f"{entry['backend']:<15} {entry['name']:<40} {size_mb:10.1f} MB  {entry['added']}")
+        return 0
+
+    if args.models_command == "prefetch":
+        try:
+            entry = store.prefetch(args.name, Path(args.path), args.backend)
+        except (OSError, ValueError) as e:
+            print(f"Prefetch failed: {e}")
+            return 1
+        print(f"Stored {entry['backend']}/{entry['name']} in {store.root / entry['dir']}")
+        return 0
+
+    if args.models_command == "verify":
+        results = store.verify(args.name)
+        if not results:
+            print("No matching models in the store")
+            return 1
+        for key, problems in results.items():
+            print(f"{key}: {'OK' if not problems else '; '.join(problems)}")
+        return 0 if not any(results.values()) else 1
+
+    if args.models_command == "time":
+        return _time_load(args.name, args.backend, config)
+
+    return 1
+
+
+def _time_load(name: str, backend: str, config: Dict[str, Any]) -> int:
+    """Load a model the way the daemon would and report the cold-start load time."""
+    # Imported here to avoid a circular import with the service module
+    from k_on_k.speech_recognition.service import create_engine
+
+    stt_config = config["speech_recognition"]
+    if backend == BACKEND_CTRANSLATE2:
+        stt_config["engine"] = "faster-whisper"
+        stt_config.setdefault("faster_whisper", {})["model_name"] = name
+    else:
+        stt_config["engine"] = "whisper"
+        stt_config.setdefault("whisper", {})["model_size"] = name
+
+    start_time = time.monotonic()
+    try:
+        engine = create_engine(config)
+    except Exception as e:
+        print(f"Loading {backend}/{name} failed: {e}")
+        return 1
+    total = time.monotonic() - start_time
+
+    if not engine.is_available():
+        print(f"Loading {backend}/{name} failed, see the log for details")
+        return 1
+    print(f"{backend}/{name}: model loaded in {engine.load_time_s:.2f}s ({total:.2f}s including imports)")
+    return 0
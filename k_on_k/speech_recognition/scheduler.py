@@ -0,0 +1,148 @@
+"""
+Inference scheduling for Kitten on Keys.
+Decides when the recognizer runs a transcription pass and how much quality it
+gives up when decoding can't keep up with the microphone.
+"""
+
+import logging
+from typing import Dict, Any, Optional
+
+from k_on_k.metrics import LatencyStats
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Backpressure levels; each one includes the measures of the levels below it
+LEVEL_NORMAL = 0
+LEVEL_DROP_SILENCE = 1  # Quiet blocks are not passed to the model
+LEVEL_FAST_DECODE = 2  # The model decodes with a smaller beam
+LEVEL_FALLBACK_MODEL = 3  # A smaller model replaces the configured one
+LEVEL_NAMES = ("normal", "drop silence", "fast decode", "fallback model")
+
+# Weight of the newest pass in the moving averages
+EMA_ALPHA = 0.3
+
+# Successive passes over max_lag_s before backpressure rises; one late pass,
+# e.g. over the backlog left by model loading, is not enough
+BEHIND_PASSES = 2
+
+
+class InferenceScheduler:
+    """
+    Inference cadence and backpressure policy.
+
+    Audio the VAD lets through is coalesced until there is enough new audio for
+    a pass to be worth its cost: the interval between passes follows the
+    measured pass duration, so a fast machine doesn't re-decode the window
+    every few milliseconds and a slow one isn't asked to do the impossible.
+    Utterance ends detected by the VAD bypass the scheduler and flush at once.
+
+    The lag is the age of the oldest audio not yet covered by a finished pass.
+    If it stays above `max_lag_s`, the backpressure level is raised one step
+    per late pass; it is lowered again once the lag falls below `recover_lag_s`.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the scheduler.
+
+        Args:
+            config: Application configuration
+        """
+        scheduler_config = config["speech_recognition"].get("scheduler", {})
+        self.min_interval_s = scheduler_config.get("min_interval_s", 0.5)
+        self.max_interval_s = scheduler_config.get("max_interval_s", 2.0)
+        self.target_rtf = scheduler_config.get("target_rtf", 0.5)
+        self.backpressure = scheduler_config.get("backpressure", True)
+        self.max_lag_s = scheduler_config.get("max_lag_s", 3.0)
+        self.recover_lag_s = scheduler_config.get("recover_lag_s", 1.0)
+        self.max_level = LEVEL_FALLBACK_MODEL if scheduler_config.get("fallback_model") else LEVEL_FAST_DECODE
+
+        # Lag of each finished pass, for the session summary
+        self.lag_stats = LatencyStats("Recognition lag")
+
+        self.reset()
+
+    def reset(self):
+        """Forget pending audio, measurements and backpressure, e.g. when a session starts."""
+        self.pending_samples = 0  # Audio inserted since the last pass
+        self.pending_since: Optional[float] = None  # Capture time of its oldest block
+        self.pass_time_s = 0.0  # Moving average of the pass duration
+        self.rtf = 0.0  # Moving average of pass duration / audio covered
+        self.level = LEVEL_NORMAL
+        self.behind_passes = 0
+        self.lag_stats.reset()
+
+    @property
+    def interval_s(self) -> float:
+        """New audio, in seconds, that the next pass waits for."""
+        if not self.target_rtf:
+            return self.min_interval_s
+        return min(max(self.pass_time_s / self.target_rtf, self.min_interval_s), self.max_interval_s)
+
+    def add_audio(self, samples: int, capture_time: Optional[float]):
+        """
+        Account for audio inserted into the model.
+
+        Args:
+            samples: Number of 16 kHz samples inserted
+            capture_time: time.perf_counter() when the audio was captured, if known
+        """
+        if not samples:
+            return
+        self.pending_samples += samples
+        if self.pending_since is None:
+            self.pending_since = capture_time
+
+    def should_run(self) -> bool:
+        """
+        Check whether enough audio has accumulated for a transcription pass.
+
+        Returns:
+            True if a pass should run now
+        """
+        return self.pending_samples >= self.interval_s * SAMPLE_RATE
+
+    def lag_s(self, now: float) -> float:
+        """
+        Return the current recognition lag.
+
+        Args:
+            now: time.perf_counter()
+
+        Returns:
+            Age of the oldest untranscribed audio in seconds, or 0.0 if there is none
+        """
+        return now - self.pending_since if self.pending_since is not None else 0.0
+
+    def record_pass(self, duration_s: float, now: float):
+        """
+        Record a finished pass over all pending audio and adjust the backpressure level.
+
+        Args:
+            duration_s: Time the pass took, in seconds
+            now: time.perf_counter() when the pass finished
+        """
+        lag = self.lag_s(now)
+        self.lag_stats.add(lag)
+
+        covered_s = self.pending_samples / SAMPLE_RATE
+        self.pending_samples = 0
+        self.pending_since = None
+
+        self.pass_time_s += EMA_ALPHA * (duration_s - self.pass_time_s)
+        if covered_s:
+            self.rtf += EMA_ALPHA * (duration_s / covered_s - self.rtf)
+
+        self.behind_passes = self.behind_passes + 1 if lag > self.max_lag_s else 0
+        if not self.backpressure:
+            return
+        if self.behind_passes >= BEHIND_PASSES and self.level < self.max_level:
+            self.level += 1
+            logger.warning(
+                f"Recognition is {lag:.1f}s behind (real-time factor {self.rtf:.2f}), "
+                f"backpressure: {LEVEL_NAMES[self.level]}"
+            )
+        elif lag < self.recover_lag_s and self.level > LEVEL_NORMAL:
+            self.level -= 1
+            logger.info(f"Recognition caught up, backpressure: {LEVEL_NAMES[self.level]}")
@@ -3,23 +3,153 @@ Speech recognition service for Kitten on Keys.
 This service coordinates speech-to-text functionality and manages the underlying models.
 """
 
+import asyncio
+import copy
+import ctypes
+import gc
 import logging
+import os
 import threading
 import time
-from typing import Dict, Any, List, Optional, Callable, Union
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Dict, Any, Deque, List, Optional, Callable, Tuple, Union
 
 import numpy as np
 
-from k_on_k.speech_recognition.whisper_service import WhisperService
-from k_on_k.speech_recognition.faster_whisper_service import FasterWhisperService
+from k_on_k.metrics import LatencyStats, rss_mb
+from k_on_k.speech_recognition.commands import EVENT_COMMAND, CommandMatcher
+from k_on_k.speech_recognition.fast_path import PunctuationFastPath
+from k_on_k.speech_recognition.scheduler import (
+    InferenceScheduler,
+    LEVEL_DROP_SILENCE,
+    LEVEL_FAST_DECODE,
+    LEVEL_FALLBACK_MODEL,
+)
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE
 
 logger = logging.getLogger(__name__)
 
+# Requests queued for the recognizer
+REQUEST_RESET = "reset"  # A listening session starts
+REQUEST_FLUSH = "flush"  # An utterance ended
+REQUEST_STOP = "stop"  # The listening session ends
+
+# Kinds of recognizer results, delivered on the event loop in order
+RESULT_PARTIAL = "partial"  # Replaceable draft of the current utterance
+RESULT_FINAL = "final"  # Committed text
+RESULT_END = "end"  # The utterance ended; nothing more will be added to it
+
+
+def create_engine(config: Dict[str, Any]):
+    """
+    Create the speech-to-text engine selected in the configuration.
+    
+    Args:
+        config: Application configuration
+        
+    Returns:
+        WhisperService or FasterWhisperService instance
+    """
+    _pin_inference_threads(config)
+    
+    # Engine modules are imported here, not at module load, so startup only pays
+    # for the one stack (torch/openai-whisper or ctranslate2) that is configured
+    engine = config["speech_recognition"].get("engine", "whisper").lower()
+    if engine in ("faster-whisper", "faster_whisper"):  # support both keys
+        logger.info("Initializing Faster-Whisper model")
+        from k_on_k.speech_recognition.faster_whisper_service import FasterWhisperService
+        return FasterWhisperService(config)
+    
+    if engine != "whisper":
+        logger.warning(f"Unsupported engine: {engine}, falling back to Whisper")
+    logger.info("Initializing Whisper model")
+    from k_on_k.speech_recognition.whisper_service import WhisperService
+    return WhisperService(config)
+
+
+def _pin_inference_threads(config: Dict[str, Any]):
+    """
+    Restrict the calling thread to speech_recognition.inference_cpus, if set.
+    
+    Engines start their compute threads while loading the model, and those
+    threads inherit the affinity of the thread that loads it.
+    
+    Args:
+        config: Application configuration
+    """
+    cpus = config["speech_recognition"].get("inference_cpus")
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+        logger.info(f"Inference threads pinned to CPUs {sorted(cpus)}")
+    except (OSError, ValueError) as e:
+        logger.error(f"Error pinning inference threads to CPUs {cpus}: {str(e)}")
+
+
+def warm_up(engine) -> float:
+    """
+    Run one throwaway decode on a second of silence.
+    
+    The first decode after a load pays for lazy initialization (kernel selection,
+    allocator growth, paging in memory-mapped weights). Warming up moves that cost
+    into the load, before anyone is waiting for text.
+    
+    Args:
+        engine: Loaded in-process engine
+        
+    Returns:
+        Duration of the decode in seconds
+    """
+    start_time = time.perf_counter()
+    try:
+        engine.transcribe_words(np.zeros(SAMPLE_RATE, dtype=np.float32), None)
+    except Exception as e:
+        logger.warning(f"Model warm-up failed: {str(e)}")
+    return time.perf_counter() - start_time
+
+
+def _trim_heap():
+    """Hand memory freed by an unloaded model back to the OS; glibc keeps it otherwise."""
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def engine_config(config: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """
+    Copy the configuration with another model selected for the configured engine.
+    
+    Args:
+        config: Application configuration
+        model: Model name, e.g. "base"
+        
+    Returns:
+        Configuration for create_engine
+    """
+    config = copy.deepcopy(config)
+    config["speech_recognition"].setdefault("whisper", {})["model_size"] = model
+    config["speech_recognition"].setdefault("faster_whisper", {})["model_name"] = model
+    return config
+
 
 class SpeechRecognitionService:
     """
     Main service for speech recognition functionality.
     Coordinates the underlying speech-to-text models and handles transcription.
+    
+    Runs as a task on the application's asyncio event loop. The task sleeps until
+    the capture callback or a state change wakes it. All stateful audio work
+    (front end, VAD, model) then runs as one step on a single-thread executor, so
+    stages never race each other and inference never blocks the loop. Each step
+    feeds the model all new audio, but an InferenceScheduler decides whether a
+    transcription pass runs and applies backpressure when passes fall behind.
+    
+    With the cascade enabled, a small draft model does the streaming passes and
+    its text is published as partial results. The configured model only decodes
+    each finished utterance, and its text replaces the draft.
     """
     
     def __init__(self, config: Dict[str, Any]):
@@ -32,131 +162,741 @@ class SpeechRecognitionService:
         self.config = config
         self.stt_config = config["speech_recognition"]
         self.model_type = self.stt_config["model"]
-        self.trigger_phrases = self.stt_config["trigger_phrases"]
+        # Trigger phrases are spotted in the committed words as they stream in
+        self.command_matcher = CommandMatcher(config)
         
         # State
         self.is_running = False
         self.is_listening = False
-        self.processing_thread = None
-        self.audio_buffer = []
-        self.lock = threading.Lock()
+        # State changes as (REQUEST_*, ring buffer write index when requested),
+        # handled in order on the executor
+        self.requests: Deque[Tuple[str, Optional[int]]] = deque()
+        # Set while ring-buffer audio goes through the filter; utterances the VAD
+        # ends meanwhile are committed on the spot and their results kept here
+        self.draining = False
+        self.drain_results: List[Tuple[str, Optional[str]]] = []
         
-        # Model instances
-        self.whisper_service = None
+        # Event loop plumbing, set up in start()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.flushed: Optional[asyncio.Event] = None
+        self.wakeup_pending = False  # Coalesces wakeups posted by the capture callback
+        self.audio_since: Optional[float] = None  # Capture time of the oldest unhandled block
+        
+        # Audio arrives through a ring buffer shared with the capture callback
+        self.ring_buffer = None
+        self.reported_overruns = 0
+        self.audio_filter: Optional[Callable[[np.ndarray], None]] = None
+        
+        # Model instance, or a proxy for one running in a worker process
         self.active_model = None
         
+        # Pass cadence and backpressure
+        self.scheduler = InferenceScheduler(config)
+        self.scheduler_config = self.stt_config.get("scheduler", {})
+        self.applied_level = self.scheduler.level
+        self.capture_time: Optional[float] = None  # Capture time of the audio being drained
+        
+        # Idle unloading: the models are released after a stretch without dictation
+        # and reloaded when the next one starts
+        idle_config = self.stt_config.get("idle_unload", {})
+        self.idle_unload = idle_config.get("enabled", False)
+        self.idle_timeout_s = idle_config.get("timeout_s", 1800.0)
+        self.idle_timer: Optional[asyncio.TimerHandle] = None
+        self.unload_requested = False
+        self.reload_requested = False
+        self.unloaded = False
+        self.first_pass_pending = False  # The next pass is the first since the models loaded
+        
+        # Configured model, and the smaller one swapped in at the last backpressure level.
+        # With the cascade, the fallback replaces the draft model instead.
+        self.primary_model = None
+        self.primary_draft_model = None
+        self.fallback_model = None
+        self.fallback_loading = False
+        
+        # Two-pass cascade: draft model, and the audio and draft text of the current utterance
+        self.cascade_config = self.stt_config.get("cascade", {})
+        self.cascade = self.cascade_config.get("enabled", False)
+        self.draft_model = None
+        self.utterance_audio: List[np.ndarray] = []
+        self.utterance_samples = 0
+        self.utterance_draft = ""
+        self.partial = ""  # Last published draft, replaced by the next result
+        # Utterances are cut at the streaming window length, so the kept audio stays
+        # bounded without the VAD, and the final pass decodes at most one window
+        window_s = self.stt_config.get("streaming", {}).get("window_s", 15.0)
+        self.max_utterance_samples = int(window_s * SAMPLE_RATE)
+        # Without the cascade, the streaming model's uncommitted hypothesis can serve as the draft
+        self.partial_results = self.stt_config.get("streaming", {}).get("partial_results", False)
+        
+        # Short utterances matching a punctuation command skip the model's final decode
+        self.fast_path: Optional[PunctuationFastPath] = None
+        if self.stt_config.get("punctuation_fast_path", {}).get("enabled", False):
+            self.fast_path = PunctuationFastPath(config)
+        self.utterance_committed = False  # The model already committed text of the current utterance
+        self.utterance_end_time: Optional[float] = None  # When the VAD ended the current utterance
+        # Time from the end of an utterance to its text, for commands and for everything else
+        self.command_stats = LatencyStats("Punctuation command")
+        self.utterance_stats = LatencyStats("Utterance end to text")
+        
+        # Latency of the callback-to-recognizer handoff and of each inference pass
+        self.handoff_stats = LatencyStats("Audio handoff")
+        self.inference_stats = LatencyStats("Draft pass" if self.cascade else "Inference pass")
+        self.final_stats = LatencyStats("Final pass")
+        
         # Callback for transcribed text
         self.on_transcription: Optional[Callable[[str], None]] = None
         self.on_command: Optional[Callable[[str], None]] = None
+        
+        # Callback for the draft of the current utterance (cascade only). Each call
+        # replaces the previous draft; the next transcript or command replaces the
+        # last one, and an empty draft retracts it.
+        self.on_partial: Optional[Callable[[str], None]] = None
+        
+        # Called on the executor thread when a listening session starts and ends,
+        # in order with the audio, e.g. to reset or flush the VAD
+        self.on_listening_start: Optional[Callable[[], None]] = None
+        self.on_listening_stop: Optional[Callable[[], None]] = None
     
     def start(self):
-        """Start the speech recognition service."""
+        """Start the speech recognition service on the running event loop."""
         if self.is_running:
             return
             
         logger.info("Starting speech recognition service")
         self.is_running = True
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.flushed = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kok-recognizer")
         
-        # Initialize model based on configuration
-        self._initialize_model()
-        
-        # Start processing thread
-        self.processing_thread = threading.Thread(target=self._process_audio, daemon=True)
-        self.processing_thread.start()
+        # The task loads the model first, while capture already runs
+        self.task = self.loop.create_task(self._process_audio())
     
     def stop(self):
-        """Stop the speech recognition service."""
+        """Stop the speech recognition service; await `wait_stopped` for it to finish."""
         if not self.is_running:
             return
             
         logger.info("Stopping speech recognition service")
         self.is_running = False
         self.is_listening = False
+        if self.idle_timer:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        self._wake()
+    
+    async def wait_stopped(self, timeout: float = 2.0):
+        """
+        Wait for the recognizer task to end and release its resources.
+        
+        Args:
+            timeout: Maximum time to wait for an in-flight pass, in seconds
+        """
+        if self.task is None:
+            return
         
-        # Wait for processing thread to end
-        if self.processing_thread and self.processing_thread.is_alive():
-            self.processing_thread.join(timeout=2.0)
+        try:
+            await asyncio.wait_for(self.task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Speech recognition did not stop in time")
+        except Exception as e:
+            logger.error(f"Error stopping speech recognition: {str(e)}")
+        self.task = None
+        self.executor.shutdown(wait=False)
+        
+        # Shut down the inference worker process or server connection, if one is used
+        if hasattr(self.active_model, "stop"):
+            self.active_model.stop()
     
     def _initialize_model(self):
-        """Initialize the speech-to-text model based on configuration engine."""
-        engine = self.stt_config.get("engine", "whisper").lower()
-        if engine == "whisper":
-            logger.info("Initializing Whisper model")
-            self.whisper_service = WhisperService(self.config)
-            self.active_model = self.whisper_service
-        elif engine in ("faster-whisper", "faster_whisper"):  # support both keys
-            logger.info("Initializing Faster-Whisper model")
-            self.fw_service = FasterWhisperService(self.config)
-            self.active_model = self.fw_service
-        else:
-            logger.warning(f"Unsupported engine: {engine}, falling back to Whisper")
-            self.whisper_service = WhisperService(self.config)
-            self.active_model = self.whisper_service
+        """Initialize the speech-to-text model, in-process, in a worker process or on a model server."""
+        if self.stt_config.get("server", {}).get("enabled", False):
+            from k_on_k.speech_recognition.model_server import ModelServerClient
+            
+            client = ModelServerClient(self.config)
+            try:
+                client.connect()
+                logger.info(f"Using model server at {client.socket_path}")
+                self.active_model = client
+                return
+            except OSError as e:
+                logger.warning(f"Model server unavailable, loading the model locally: {str(e)}")
+        
+        if self.stt_config.get("worker", {}).get("enabled", False):
+            # Imported here so the in-process path doesn't touch multiprocessing
+            from k_on_k.speech_recognition.worker import InferenceWorkerClient
+            
+            logger.info("Starting inference worker process")
+            self.active_model = InferenceWorkerClient(self.config)
+            self.active_model.start()
+            self.active_model.wait_ready()
+            return
+        
+        self.active_model = create_engine(self.config)
+    
+    def _initialize_models(self):
+        """Load the configured model and, for the cascade, the draft model; report what each cost."""
+        self.first_pass_pending = True
+        start_time, rss_before = time.monotonic(), rss_mb()
+        self._initialize_model()
+        # Worker and server proxies have stop(); their model lives in another process
+        remote = hasattr(self.active_model, "stop")
+        if not remote:
+            self._warm_up(self.active_model)
+        self._report_load("Final model" if self.cascade else "Model", start_time, rss_before, remote)
+        if not self.cascade:
+            return
+        
+        model = self.cascade_config.get("draft_model", "base")
+        logger.info(f"Loading draft model {model}")
+        start_time, rss_before = time.monotonic(), rss_mb()
+        draft_model = create_engine(engine_config(self.config, model))
+        if not draft_model.is_available():
+            logger.warning("Draft model unavailable, transcribing in a single pass")
+            return
+        
+        # Drafts favor latency; the final pass brings the accuracy
+        draft_model.set_fast_decode(True)
+        self.draft_model = draft_model
+        self._warm_up(draft_model)
+        self._report_load("Draft model", start_time, rss_before, remote=False)
+    
+    def _warm_up(self, engine):
+        """Warm up a freshly loaded in-process engine, unless disabled."""
+        if self.stt_config.get("warmup", True) and engine.is_available():
+            logger.info(f"Warm-up decode took {warm_up(engine):.2f}s")
+    
+    def _unload_models(self):
+        """Release the models after the idle timeout (executor thread)."""
+        rss_before = rss_mb()
+        remote = hasattr(self.active_model, "stop")
+        for model in (self.active_model, self.primary_model):
+            if hasattr(model, "stop"):
+                # Worker process or server connection
+                model.stop()
+        self.active_model = self.primary_model = self.fallback_model = None
+        self.draft_model = self.primary_draft_model = None
+        self.fallback_loading = False
+        self.unloaded = True
+        
+        gc.collect()
+        _trim_heap()
+        memory = "in another process" if remote else f"-{rss_before - rss_mb():.0f} MB, {rss_mb():.0f} MB resident"
+        logger.info(f"Model unloaded after {self.idle_timeout_s:.0f}s without dictation ({memory})")
+    
+    async def _reload_models(self):
+        """Load the models again for a dictation that started after they were unloaded."""
+        logger.info("Reloading the model; audio waits in the ring buffer meanwhile")
+        start_time = time.monotonic()
+        try:
+            await self.loop.run_in_executor(self.executor, self._initialize_models)
+            if not self.active_model.is_available():
+                raise RuntimeError("the model didn't load, see the log for details")
+        except Exception as e:
+            logger.error(f"Error reloading speech recognition model: {str(e)}")
+            logger.warning("Dropping this dictation; the next one tries to load the model again")
+            # The models stay unloaded, so the recognizer task discards the dictation
+            self.active_model = self.draft_model = None
+            return
+        self.unloaded = False
+        logger.info(f"Model reloaded in {time.monotonic() - start_time:.2f}s")
+        # Dictation may have ended while the model loaded
+        self._schedule_idle_unload()
+    
+    def _drop_dictation(self):
+        """Discard queued requests and audio while no model is loaded (event loop thread)."""
+        self.requests.clear()
+        if self.ring_buffer is not None:
+            self.ring_buffer.clear()
+        self.flushed.set()
+    
+    def _schedule_idle_unload(self):
+        """Restart the idle timer while not listening, or cancel it (event loop thread)."""
+        if self.idle_timer:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        if self.idle_unload and self.is_running and not self.is_listening and not self.unloaded:
+            self.idle_timer = self.loop.call_later(self.idle_timeout_s, self._request_unload)
+    
+    def _request_unload(self):
+        """Ask the recognizer task to release the models (event loop thread)."""
+        self.idle_timer = None
+        self.unload_requested = True
+        self.wakeup.set()
+    
+    def _report_load(self, label: str, start_time: float, rss_before: float, remote: bool):
+        """Log how long a model took to load and how much resident memory it added."""
+        memory = "in another process" if remote else f"+{rss_mb() - rss_before:.0f} MB resident"
+        logger.info(f"{label} ready in {time.monotonic() - start_time:.2f}s ({memory})")
+    
+    def _load_fallback_model(self):
+        """Load the configured fallback model on a background thread."""
+        model = self.scheduler_config["fallback_model"]
+        
+        try:
+            logger.info(f"Loading fallback model {model}")
+            engine = create_engine(engine_config(self.config, model))
+            if self.unloaded or not self.fallback_loading:
+                # The models were released while this one loaded; don't bring it back
+                logger.info(f"Discarding fallback model {model}, the models were unloaded")
+            elif engine.is_available():
+                self.fallback_model = engine
+        except Exception as e:
+            logger.error(f"Error loading fallback model: {str(e)}")
+    
+    def attach_ring_buffer(self, ring_buffer):
+        """
+        Consume audio from a ring buffer filled by the capture callback.
+        
+        Args:
+            ring_buffer: AudioRingBuffer written by the audio capture service
+        """
+        self.ring_buffer = ring_buffer
+        self.reported_overruns = ring_buffer.overruns
+    
+    def notify_audio(self, capture_time: float):
+        """
+        Tell the recognizer that audio is waiting in the ring buffer.
+        
+        Called from the capture callback. Only the first block after each wakeup
+        posts to the event loop, so a busy recognizer isn't flooded.
+        
+        Args:
+            capture_time: time.perf_counter() when the block was captured
+        """
+        if self.wakeup_pending or self.loop is None:
+            return
+        
+        self.wakeup_pending = True
+        self.audio_since = capture_time
+        self.loop.call_soon_threadsafe(self.wakeup.set)
     
     def process_audio(self, audio_data: np.ndarray):
         """
-        Process incoming audio data.
+        Feed audio into the active model's streaming window.
+        
+        Called on the executor thread, either directly for ring-buffer audio
+        or by the audio filter (e.g. the VAD gate) for the audio it lets through.
+        The data is copied, so it may be a view into the ring buffer.
         
         Args:
             audio_data: Audio data as numpy array
         """
-        if not self.is_running:
+        if not self.is_running or not self.active_model:
             return
-            
-        with self.lock:
-            self.audio_buffer.append(audio_data)
+        
+        # Under backpressure, quiet blocks (mostly pauses the VAD keeps) are dropped
+        if self.scheduler.level >= LEVEL_DROP_SILENCE and len(audio_data):
+            rms = np.sqrt(np.dot(audio_data, audio_data) / len(audio_data))
+            if rms < self.scheduler_config.get("silence_rms", 0.01):
+                return
+        
+        if self.fast_path:
+            self.fast_path.add_audio(audio_data)
+        if self.draft_model:
+            # The final pass needs the whole utterance, so keep a copy
+            self.draft_model.insert_audio(audio_data)
+            self.utterance_audio.append(audio_data.copy())
+            self.utterance_samples += len(audio_data)
+        else:
+            self.active_model.insert_audio(audio_data)
+        self.scheduler.add_audio(len(audio_data), self.capture_time)
+        
+        if self.utterance_samples >= self.max_utterance_samples:
+            self.end_utterance()
     
-    def _process_audio(self):
+    async def _process_audio(self):
         """
-        Background thread to process audio data.
-        This runs continuously in the background when the service is running.
+        Recognizer task.
+        Sleeps until woken, without polling, and runs one step per wakeup on the executor.
         """
+        # Initialize model based on configuration. Audio captured meanwhile stays
+        # in the ring buffer and is transcribed once the model is ready.
+        try:
+            await self.loop.run_in_executor(self.executor, self._initialize_models)
+        except Exception as e:
+            logger.error(f"Error initializing speech recognition model: {str(e)}")
+            return
+        self._schedule_idle_unload()
+        
         while self.is_running:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            
+            if self.unload_requested:
+                self.unload_requested = False
+                if self.is_listening or self.requests:
+                    # Dictation started, or its tail is still being committed
+                    self._schedule_idle_unload()
+                else:
+                    await self.loop.run_in_executor(self.executor, self._unload_models)
+                    # Dictation may have started while the models were released
+                    self.reload_requested = self.is_listening
+            if self.reload_requested:
+                self.reload_requested = False
+                await self._reload_models()
+            
+            # Audio arriving from here on posts a new wakeup
+            self.wakeup_pending = False
+            audio_since, self.audio_since = self.audio_since, None
+            if audio_since is not None:
+                self.handoff_stats.add(time.perf_counter() - audio_since)
+                self.capture_time = audio_since
+            
+            if self.unloaded and not self.active_model:
+                # Only a failed reload leaves dictation here; drop it rather than let it pile up
+                self._drop_dictation()
+                continue
+            if self.ring_buffer is None or not self.active_model:
+                continue
+            
             try:
-                # Check if we have audio data to process
-                if not self.is_listening or not self.active_model:
-                    time.sleep(0.1)
-                    continue
-                
-                # Process audio data in chunks
-                with self.lock:
-                    if not self.audio_buffer:
-                        time.sleep(0.1)
-                        continue
-                        
-                    # Get a copy of the buffer and clear it
-                    buffer_copy = self.audio_buffer.copy()
-                    self.audio_buffer = []
-                
-                # Process audio data with active model
-                if buffer_copy:
-                    audio_data = np.concatenate(buffer_copy)
-                    transcript = self.active_model.process_audio(audio_data)
-                    
-                    if transcript:
-                        # Check for trigger commands
-                        command = self.active_model.detect_commands(transcript, self.trigger_phrases)
-                        
-                        if command and self.on_command:
-                            self.on_command(command)
-                        elif self.on_transcription:
-                            self.on_transcription(transcript)
-                
+                results, flushed = await self.loop.run_in_executor(self.executor, self._step)
             except Exception as e:
                 logger.error(f"Error processing audio data: {str(e)}")
-                time.sleep(0.1)
+                continue
+            
+            for kind, text in results:
+                if kind == RESULT_PARTIAL:
+                    if self.on_partial:
+                        self.on_partial(text)
+                elif kind == RESULT_END:
+                    self._dispatch(self.command_matcher.flush())
+                else:
+                    self._handle_transcript(text)
+            if flushed:
+                self.flushed.set()
+    
+    def _step(self) -> Tuple[List[Tuple[str, Optional[str]]], bool]:
+        """
+        Handle pending state changes and audio (executor thread).
+        
+        Returns:
+            Tuple of (results in order as (RESULT_*, text) pairs, whether a requested flush completed)
+        """
+        results = []
+        flushed = False
+        
+        while self.requests:
+            request, ring_index = self.requests.popleft()
+            
+            if request == REQUEST_RESET:
+                self.handoff_stats.reset()
+                self.inference_stats.reset()
+                self.scheduler.reset()
+                if self.primary_model is not None:
+                    # A new session starts with the configured model again
+                    self.active_model, self.primary_model = self.primary_model, None
+                if self.primary_draft_model is not None:
+                    self.draft_model, self.primary_draft_model = self.primary_draft_model, None
+                self._apply_backpressure()
+                if self.on_listening_start:
+                    self.on_listening_start()
+                if hasattr(self.active_model, "reset"):
+                    self.active_model.reset()
+                if self.draft_model:
+                    self._reset_draft()
+                    self.final_stats.reset()
+                if self.fast_path:
+                    self.fast_path.reset()
+                    self.command_stats.reset()
+                    self.utterance_stats.reset()
+                self.utterance_committed = False
+                continue
+            
+            # Commit the tail of an utterance, including audio still in the ring up to
+            # the request; audio behind it may already be the next session's pre-roll
+            results.extend(self._drain_ring_buffer(ring_index))
+            if request == REQUEST_STOP and self.on_listening_stop:
+                self.on_listening_stop()
+            results.extend(self._finish_utterance())
+            results.append((RESULT_END, None))
+            
+            if request == REQUEST_STOP:
+                flushed = True
+                summary = [self.handoff_stats, self.inference_stats, self.scheduler.lag_stats]
+                if self.draft_model:
+                    summary.insert(2, self.final_stats)
+                if self.fast_path:
+                    summary += [self.command_stats, self.utterance_stats]
+                logger.info("; ".join(stats.format() for stats in summary))
+        
+        if not self.is_listening:
+            self.ring_buffer.clear()
+            return results, flushed
+        
+        results.extend(self._drain_ring_buffer())
+        
+        # One pass covers everything that arrived since the last one. Passes wait
+        # while the utterance may still be a punctuation command.
+        if self.scheduler.should_run() and not (self.fast_path and self.fast_path.is_candidate()):
+            if self.draft_model:
+                draft = self._timed(self._draft_pass, self.inference_stats)
+                if draft is not None:
+                    results.append((RESULT_PARTIAL, draft))
+            else:
+                text = self._timed(self.active_model.process_iter, self.inference_stats)
+                self.utterance_committed = self.utterance_committed or bool(text)
+                results.append((RESULT_FINAL, text))
+                if self.partial_results and hasattr(self.active_model, "streamer"):
+                    self._publish_partial(self.active_model.streamer.pending_text(), results)
+        
+        results.extend((RESULT_FINAL, text) for text in self._apply_backpressure())
+        return results, flushed
+    
+    def _timed(self, inference: Callable[[], Optional[str]], stats: LatencyStats) -> Optional[str]:
+        """Run an inference call over all pending audio and record how long it took."""
+        start_time = time.perf_counter()
+        result = inference()
+        end_time = time.perf_counter()
+        stats.add(end_time - start_time)
+        if self.first_pass_pending:
+            self.first_pass_pending = False
+            logger.info(f"First pass after loading took {1000 * (end_time - start_time):.0f} ms")
+        self.scheduler.record_pass(end_time - start_time, end_time)
+        return result
+    
+    def _draft_pass(self) -> Optional[str]:
+        """
+        Run a draft-model pass (executor thread).
+        
+        Returns:
+            Draft of the utterance so far (committed draft text plus the latest
+            hypothesis), or None if it didn't change
+        """
+        committed = self.draft_model.process_iter()
+        if committed:
+            self.utterance_draft = f"{self.utterance_draft} {committed}".strip()
+        
+        draft = f"{self.utterance_draft} {self.draft_model.streamer.pending_text()}".strip()
+        if draft == self.partial:
+            return None
+        self.partial = draft
+        return draft
+    
+    def _publish_partial(self, text: str, results: List[Tuple[str, Optional[str]]]):
+        """Append the streaming model's uncommitted hypothesis as a partial result, if it changed."""
+        if text != self.partial:
+            self.partial = text
+            results.append((RESULT_PARTIAL, text))
+    
+    def _finish_utterance(self) -> List[Tuple[str, Optional[str]]]:
+        """
+        Commit the current utterance (executor thread).
+        
+        Without the cascade this flushes the streaming model. With it, the
+        configured model decodes the whole utterance and replaces the draft.
+        
+        Returns:
+            Results in order as (RESULT_*, text) pairs
+        """
+        end_time, self.utterance_end_time = self.utterance_end_time or time.perf_counter(), None
+        committed, self.utterance_committed = self.utterance_committed, False
+        
+        command = self.fast_path.classify() if self.fast_path else None
+        if command and not committed:
+            # The command is typed as if the model had recognized it; the model's
+            # view of the utterance is dropped instead of decoded
+            if self.draft_model:
+                self._reset_draft()
+            self.active_model.drop_utterance()
+            self.partial = ""
+            self.command_stats.add(time.perf_counter() - end_time)
+            return [(RESULT_FINAL, command)]
+        
+        results = self._decode_utterance()
+        if self.fast_path:
+            self.utterance_stats.add(time.perf_counter() - end_time)
+        return results
+    
+    def _decode_utterance(self) -> List[Tuple[str, Optional[str]]]:
+        """
+        Decode the rest of the current utterance with the model (executor thread).
+        
+        Returns:
+            Results in order as (RESULT_*, text) pairs
+        """
+        if not self.draft_model:
+            # The flushed text replaces the hypothesis published as a partial
+            self.partial = ""
+            return [(RESULT_FINAL, self._timed(self.active_model.flush, self.inference_stats))]
+        
+        audio = np.concatenate(self.utterance_audio) if self.utterance_audio else None
+        had_partial = bool(self.partial)
+        self._reset_draft()
+        
+        def final_pass():
+            if audio is None:
+                return None
+            self.active_model.insert_audio(audio)
+            return self.active_model.flush()
+        
+        text = self._timed(final_pass, self.final_stats)
+        if not text and had_partial:
+            # Nothing survived the final pass; retract the draft
+            return [(RESULT_PARTIAL, "")]
+        return [(RESULT_FINAL, text)]
+    
+    def _reset_draft(self):
+        """Drop the draft model's state and the utterance audio."""
+        self.draft_model.reset()
+        self.utterance_audio = []
+        self.utterance_samples = 0
+        self.utterance_draft = ""
+        self.partial = ""
+    
+    def _apply_backpressure(self) -> List[str]:
+        """
+        Bring the decoding setup in line with the scheduler's backpressure level (executor thread).
+        
+        Returns:
+            Text committed by the configured model before a fallback model replaced it
+        """
+        level = self.scheduler.level
+        transcripts = []
+        
+        if level != self.applied_level and hasattr(self.active_model, "set_fast_decode"):
+            self.active_model.set_fast_decode(level >= LEVEL_FAST_DECODE)
+        self.applied_level = level
+        
+        # With the cascade, the draft model runs on every pass, so it is the one to replace
+        current = self.draft_model or self.active_model
+        if level >= LEVEL_FALLBACK_MODEL and current is not self.fallback_model and not self.unloaded:
+            if self.fallback_model is None:
+                # Loading takes a while; keep decoding with the current model meanwhile
+                if not self.fallback_loading:
+                    self.fallback_loading = True
+                    threading.Thread(target=self._load_fallback_model, name="kok-fallback", daemon=True).start()
+                return transcripts
+            
+            self.fallback_model.reset()
+            self.fallback_model.set_fast_decode(True)
+            if self.draft_model:
+                # The fallback drafts the utterance from its start; the final pass
+                # still uses the configured model
+                self.draft_model, self.primary_draft_model = self.fallback_model, self.draft_model
+                self.utterance_draft = ""
+                if self.utterance_audio:
+                    self.draft_model.insert_audio(np.concatenate(self.utterance_audio))
+                logger.warning("Switched the draft model to the fallback model until dictation restarts")
+                return transcripts
+            
+            # Commit what the current model has, then continue with the smaller one
+            text = self.active_model.flush()
+            if text:
+                transcripts.append(text)
+            self.primary_model, self.active_model = self.active_model, self.fallback_model
+            logger.warning("Switched to the fallback model until dictation restarts")
+        
+        return transcripts
+    
+    def get_lag_s(self) -> float:
+        """
+        Return the current recognition lag.
+        
+        Returns:
+            Age in seconds of the oldest audio fed to the model but not yet transcribed
+        """
+        return self.scheduler.lag_s(time.perf_counter())
+    
+    def _drain_ring_buffer(self, ring_index: Optional[int] = None) -> List[Tuple[str, Optional[str]]]:
+        """
+        Pass readable ring-buffer audio through the filter into the model.
+        
+        Utterances the filter ends along the way are committed right away, so
+        audio after the boundary goes into the next utterance.
+        
+        Args:
+            ring_index: Only drain audio written before this write index; all if None
+        
+        Returns:
+            Results of the utterances committed during the drain
+        """
+        max_count = None if ring_index is None else ring_index - self.ring_buffer.read_index
+        views = self.ring_buffer.read_views(max_count)
+        consumed = 0
+        
+        self.draining = True
+        try:
+            for view in views:
+                (self.audio_filter or self.process_audio)(view)
+                consumed += len(view)
+        finally:
+            self.draining = False
+        
+        self.ring_buffer.advance(consumed)
+        results, self.drain_results = self.drain_results, []
+        
+        # The counter belongs to the producer, so only read it here
+        overruns = self.ring_buffer.overruns
+        if overruns > self.reported_overruns:
+            logger.warning(f"Recognizer fell behind, dropped {overruns - self.reported_overruns} samples")
+            self.reported_overruns = overruns
+        return results
+    
+    def _handle_transcript(self, transcript: Optional[str]):
+        """
+        Feed committed text to the command matcher and dispatch what it releases.
+        
+        Args:
+            transcript: Newly committed text, or None
+        """
+        if not transcript:
+            return
+        
+        self._dispatch(self.command_matcher.feed(transcript))
+    
+    def _dispatch(self, events: List[Tuple[str, Any]]):
+        """
+        Pass command matcher output to the command and transcription callbacks.
+        
+        Args:
+            events: (EVENT_*, value) pairs in order
+        """
+        for kind, value in events:
+            if kind == EVENT_COMMAND:
+                # The command's words may be on screen as a draft; take them back
+                if self.on_partial:
+                    self.on_partial("")
+                if self.on_command:
+                    self.on_command(value.phrase)
+            elif self.on_transcription:
+                self.on_transcription(value)
+    
+    def end_utterance(self):
+        """Commit the current utterance, e.g. after trailing silence."""
+        if self.draining:
+            # Called by the VAD on the executor thread, in the middle of a block:
+            # commit before the filter passes on audio of the next utterance
+            self.utterance_end_time = time.perf_counter()
+            self.drain_results.extend(self._finish_utterance())
+            self.drain_results.append((RESULT_END, None))
+            return
+        if not self.is_listening:
+            return
+        
+        self.utterance_end_time = time.perf_counter()
+        self._request(REQUEST_FLUSH)
+        self._wake()
     
     def start_listening(self):
-        """Start listening for speech."""
-        if not self.is_running or not self.active_model:
+        """Start listening for speech, even if the model is still loading."""
+        if not self.is_running:
             return
             
         logger.info("Starting speech recognition listening")
-        self.is_listening = True
         
-        # Reset model state
-        if hasattr(self.active_model, "reset"):
-            self.active_model.reset()
+        # Reset model state on the executor, after any pending flush
+        self._request(REQUEST_RESET)
+        self.is_listening = True
+        self._schedule_idle_unload()
+        if self.unloaded:
+            self.reload_requested = True
+        self._wake()
     
     def stop_listening(self):
         """Stop listening for speech."""
@@ -166,6 +906,33 @@ class SpeechRecognitionService:
         logger.info("Stopping speech recognition listening")
         self.is_listening = False
         
-        # Clear buffer
-        with self.lock:
-            self.audio_buffer = [] 
\ No newline at end of file
+        # Let the recognizer commit the tail of the utterance
+        self.flushed.clear()
+        self._request(REQUEST_STOP)
+        self._schedule_idle_unload()
+        self._wake()
+    
+    async def wait_until_flushed(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the tail of the last utterance has been transcribed.
+        
+        Args:
+            timeout: Maximum time to wait, in seconds
+            
+        Returns:
+            True if the flush completed, False on timeout
+        """
+        try:
+            await asyncio.wait_for(self.flushed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    def _request(self, request: str):
+        """Queue a state change, marking where in the ring buffer's audio it happened."""
+        self.requests.append((request, self.ring_buffer.write_index if self.ring_buffer is not None else None))
+    
+    def _wake(self):
+        """Wake the recognizer task to handle a state change; safe from any thread."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
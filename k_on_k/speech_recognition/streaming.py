@@ -0,0 +1,345 @@
+"""
+Streaming commit engine for Kitten on Keys.
+Turns repeated transcriptions of a sliding audio window into stable, committed text.
+"""
+
+import logging
+import re
+from collections import deque
+from typing import Dict, Any, Callable, Deque, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Whisper models expect 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# Longest run of words checked when stripping text the model repeats from the committed tail
+MAX_OVERLAP_WORDS = 5
+
+
+class Word(NamedTuple):
+    """A single recognized word with start/end times in seconds."""
+    start: float
+    end: float
+    text: str
+
+
+def _normalize(text: str) -> str:
+    """Normalize a word for comparison, ignoring case and punctuation."""
+    return re.sub(r"[^\w']+", "", text.lower())
+
+
+def join_words(words: List[Word]) -> str:
+    """
+    Join recognized words into text.
+
+    Whisper-style word tokens carry their own leading space.
+
+    Args:
+        words: Words to join
+
+    Returns:
+        Joined text
+    """
+    return "".join(word.text for word in words).strip()
+
+
+class HypothesisBuffer:
+    """
+    LocalAgreement-n commit policy.
+    Keeps the last n hypotheses and commits the longest word prefix they all agree on.
+    """
+
+    def __init__(self, agreement: int = 2):
+        """
+        Initialize the hypothesis buffer.
+
+        Args:
+            agreement: Number of successive hypotheses that must agree before a word is committed
+        """
+        self.agreement = max(1, agreement)
+        self.history: Deque[List[Word]] = deque(maxlen=self.agreement)
+        self.committed_tail: List[Word] = []
+        self.last_committed_end = 0.0
+
+    def insert(self, words: List[Word]):
+        """
+        Add a new hypothesis with absolute word timestamps.
+
+        Args:
+            words: Words of the latest transcription pass
+        """
+        # Ignore words that belong to audio that is already committed
+        new = [word for word in words if word.start > self.last_committed_end - 0.1]
+
+        # The model often repeats the committed tail at the start of the window; strip it
+        if new and self.committed_tail and abs(new[0].start - self.last_committed_end) < 1.0:
+            for n in range(min(len(self.committed_tail), len(new), MAX_OVERLAP_WORDS), 0, -1):
+                tail = [_normalize(word.text) for word in self.committed_tail[-n:]]
+                head = [_normalize(word.text) for word in new[:n]]
+                if tail == head:
+                    new = new[n:]
+                    break
+
+        self.history.append(new)
+
+    def flush(self) -> List[Word]:
+        """
+        Commit the prefix that has stayed stable across the last n hypotheses.
+
+        Returns:
+            Newly committed words, taken from the latest hypothesis
+        """
+        if len(self.history) < self.agreement:
+            return []
+
+        newest = self.history[-1]
+        count = 0
+        for index, word in enumerate(newest):
+            key = _normalize(word.text)
+            if not all(index < len(hyp) and _normalize(hyp[index].text) == key for hyp in self.history):
+                break
+            count += 1
+
+        committed = newest[:count]
+        self._commit(committed)
+        return committed
+
+    def commit_pending(self) -> List[Word]:
+        """
+        Commit the whole latest hypothesis regardless of agreement.
+
+        Returns:
+            Newly committed words
+        """
+        committed = self.pending()
+        self._commit(committed)
+        return committed
+
+    def pending(self) -> List[Word]:
+        """
+        Return the uncommitted part of the latest hypothesis.
+
+        Returns:
+            Uncommitted words, possibly empty
+        """
+        return list(self.history[-1]) if self.history else []
+
+    def reset(self):
+        """Forget all hypotheses and committed words."""
+        self.history.clear()
+        self.committed_tail = []
+        self.last_committed_end = 0.0
+
+    def _commit(self, words: List[Word]):
+        """Record committed words and drop them from the retained hypotheses."""
+        if not words:
+            return
+
+        count = len(words)
+        self.history = deque((hyp[count:] for hyp in self.history), maxlen=self.agreement)
+        self.committed_tail = (self.committed_tail + words)[-MAX_OVERLAP_WORDS:]
+        self.last_committed_end = words[-1].end
+
+
+class StreamingTranscriber:
+    """
+    Streaming transcription over a bounded sliding window.
+    Each pass transcribes the uncommitted window, commits the stable prefix and
+    trims the window at the last committed word boundary.
+    """
+
+    def __init__(self, transcribe: Callable[[np.ndarray, Optional[str]], List[Word]], config: Dict[str, Any]):
+        """
+        Initialize the streaming transcriber.
+
+        Args:
+            transcribe: Function transcribing a window (with an optional prompt) into
+                words with timestamps relative to the window start
+            config: Application configuration
+        """
+        streaming_config = config.get("speech_recognition", {}).get("streaming", {})
+        self.transcribe = transcribe
+        self.prompt_chars = streaming_config.get("prompt_chars", 200)
+
+        # Preallocated window of uncommitted audio, so memory stays flat
+        self.window = np.zeros(int(streaming_config.get("window_s", 15.0) * SAMPLE_RATE), dtype=np.float32)
+        self.window_len = 0
+        self.window_start = 0.0  # Session time of window[0], in seconds
+        self.unprocessed = 0  # Samples appended since the last transcription pass
+
+        self.hypothesis = HypothesisBuffer(streaming_config.get("agreement", 2))
+        self.committed_text = ""  # Tail of the committed text, at most prompt_chars long
+        self.output: List[str] = []
+
+    def insert_audio(self, audio_data: np.ndarray):
+        """
+        Append audio to the window without running inference.
+
+        Inference only runs if the window fills up before anything stabilizes; the
+        window is then transcribed and committed as-is to make room.
+
+        Args:
+            audio_data: Audio samples (16 kHz mono float32)
+        """
+        offset = 0
+        while offset < len(audio_data):
+            if self.window_len == len(self.window):
+                self._make_room()
+
+            count = min(len(audio_data) - offset, len(self.window) - self.window_len)
+            self.window[self.window_len:self.window_len + count] = audio_data[offset:offset + count]
+            self.window_len += count
+            self.unprocessed += count
+            offset += count
+
+    def process_iter(self, words: Optional[List[Word]] = None) -> Optional[str]:
+        """
+        Run one transcription pass over the window and commit the stable prefix.
+
+        Args:
+            words: Transcription of window_input(), if it was already decoded
+                elsewhere, e.g. batched with other sessions
+
+        Returns:
+            Newly committed text, or None if nothing was committed
+        """
+        if self.unprocessed:
+            self._transcribe_window(words)
+            self._commit(self.hypothesis.flush())
+        return self._take_output()
+
+    def process_audio(self, audio_data: np.ndarray) -> Optional[str]:
+        """
+        Append audio and run one transcription pass.
+
+        Args:
+            audio_data: Audio samples (16 kHz mono float32)
+
+        Returns:
+            Newly committed text, or None if nothing was committed
+        """
+        self.insert_audio(audio_data)
+        return self.process_iter()
+
+    def finish(self, words: Optional[List[Word]] = None) -> Optional[str]:
+        """
+        Commit everything left in the window, e.g. at the end of an utterance.
+
+        Args:
+            words: Transcription of window_input(), as for process_iter()
+
+        Returns:
+            Remaining text, or None if there was nothing left
+        """
+        if self.unprocessed:
+            self._transcribe_window(words)
+        self._commit(self.hypothesis.commit_pending())
+
+        # Nothing in the window can be committed any more
+        self._trim(self.window_len)
+        self.hypothesis.history.clear()
+        return self._take_output()
+
+    def window_input(self) -> Optional[Tuple[np.ndarray, Optional[str]]]:
+        """
+        Return what the next pass would decode, so it can be decoded elsewhere.
+
+        Returns:
+            Tuple of (window audio, prompt), or None if no new audio needs a pass
+        """
+        if not self.unprocessed:
+            return None
+        return self.window[:self.window_len], self._prompt()
+
+    def pending_text(self) -> str:
+        """
+        Return the uncommitted tail of the latest hypothesis, for partial results.
+
+        Returns:
+            Uncommitted text
+        """
+        return join_words(self.hypothesis.pending())
+
+    def reset(self):
+        """Drop all audio and text to start a new session."""
+        self.window_len = 0
+        self.window_start = 0.0
+        self.unprocessed = 0
+        self.hypothesis.reset()
+        self.committed_text = ""
+        self.output = []
+
+    def drop_utterance(self):
+        """Drop the audio and hypotheses of the current utterance, keeping the committed text as context."""
+        self._trim(self.window_len)
+        self.hypothesis.history.clear()
+        self.output = []
+
+    def _prompt(self) -> Optional[str]:
+        """Return the trailing committed text used as decoding context."""
+        return self.committed_text or None
+
+    def _prompt_tail(self, text: str) -> str:
+        """Return the last prompt_chars of the text, without a word cut in half at the start."""
+        if len(text) <= self.prompt_chars:
+            return text
+        if self.prompt_chars <= 0:
+            return ""
+        tail = text[-self.prompt_chars:]
+        return tail if text[-self.prompt_chars - 1] == " " else tail.partition(" ")[2]
+
+    def _transcribe_window(self, words: Optional[List[Word]] = None):
+        """Transcribe the window, unless already done, and add the result as a new hypothesis."""
+        if words is None:
+            words = self.transcribe(self.window[:self.window_len], self._prompt())
+        self.unprocessed = 0
+        self.hypothesis.insert([
+            Word(word.start + self.window_start, word.end + self.window_start, word.text)
+            for word in words
+        ])
+
+    def _commit(self, words: List[Word]):
+        """Append committed words to the output and trim their audio from the window."""
+        if not words:
+            return
+
+        text = join_words(words)
+        if text:
+            self.output.append(text)
+            # Only the prompt is kept, so long sessions don't grow the text
+            self.committed_text = self._prompt_tail(f"{self.committed_text} {text}".strip())
+        self._trim(int(round((words[-1].end - self.window_start) * SAMPLE_RATE)))
+
+    def _trim(self, cut: int):
+        """Drop the first `cut` samples of the window."""
+        cut = max(0, min(cut, self.window_len))
+        if not cut:
+            return
+
+        remaining = self.window_len - cut
+        self.window[:remaining] = self.window[cut:self.window_len]
+        self.window_len = remaining
+        self.unprocessed = min(self.unprocessed, remaining)
+        self.window_start += cut / SAMPLE_RATE
+
+    def _make_room(self):
+        """Free window space when nothing has stabilized for a whole window."""
+        if self.unprocessed:
+            self._transcribe_window()
+        self._commit(self.hypothesis.commit_pending())
+
+        if self.window_len == len(self.window):
+            # Nothing recognizable in the window (e.g. noise); drop the oldest quarter
+            logger.warning("Streaming window full without a transcript, dropping oldest audio")
+            self._trim(len(self.window) // 4)
+
+    def _take_output(self) -> Optional[str]:
+        """Return and clear the text committed since the last call."""
+        if not self.output:
+            return None
+        text = " ".join(self.output)
+        self.output = []
+        return text
@@ -0,0 +1,368 @@
+"""
+Hardware-aware tuning for Kitten on Keys.
+Benchmarks engine, compute type, beam size and thread settings on a recorded
+clip and writes the fastest setup that keeps up into the configuration.
+"""
+
+import copy
+import importlib.util
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from k_on_k.audio_capture.dsp import PolyphaseResampler
+from k_on_k.audio_capture.sources import read_wav
+from k_on_k.config.settings import load_config, save_config
+from k_on_k.metrics import LatencyStats, rss_mb
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE, _normalize
+
+logger = logging.getLogger(__name__)
+
+# Engines by configuration name, and the module each one needs
+ENGINES = {"faster-whisper": "faster_whisper", "whisper": "whisper"}
+
+# CTranslate2 compute types worth trying per device, most precise first
+COMPUTE_TYPES = {
+    "cpu": ["float32", "int8_float32", "int8"],
+    "cuda": ["float16", "int8_float16", "int8"],
+}
+
+
+def candidates(
+    config: Dict[str, Any],
+    engines: List[str],
+    beam_sizes: List[int],
+    thread_counts: List[int],
+) -> List[Dict[str, Any]]:
+    """
+    List the setups to benchmark.
+
+    Args:
+        config: Application configuration
+        engines: Engine names to try, e.g. ["faster-whisper", "whisper"]
+        beam_sizes: Beam sizes to try; 1 decodes greedily
+        thread_counts: Inference thread counts to try
+
+    Returns:
+        Candidate setups as dicts of engine, compute_type, beam_size and threads
+    """
+    stt_config = config["speech_recognition"]
+    setups = []
+    for engine in engines:
+        if engine == "faster-whisper":
+            device = stt_config.get("faster_whisper", {}).get("device", "cpu")
+            compute_types = _supported_compute_types(device)
+        else:
+            compute_types = [None]  # openai-whisper picks the precision from the device
+        for compute_type in compute_types:
+            for beam_size in beam_sizes:
+                for threads in thread_counts:
+                    setups.append(
+                        {"engine": engine, "compute_type": compute_type, "beam_size": beam_size, "threads": threads}
+                    )
+    return setups
+
+
+def _supported_compute_types(device: str) -> List[str]:
+    """Return the compute types to try that CTranslate2 supports on this machine."""
+    wanted = COMPUTE_TYPES.get(device, COMPUTE_TYPES["cpu"])
+    try:
+        import ctranslate2
+
+        supported = ctranslate2.get_supported_compute_types(device)
+    except Exception as e:
+        logger.warning(f"Could not query CTranslate2 compute types, trying all: {str(e)}")
+        return wanted
+    return [compute_type for compute_type in wanted if compute_type in supported]
+
+
+def current_setup(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Describe the configured setup in the same form as candidates().
+
+    Args:
+        config: Application configuration
+
+    Returns:
+        The configured engine, compute_type, beam_size and threads
+    """
+    stt_config = config["speech_recognition"]
+    engine = stt_config.get("engine", "whisper").lower().replace("_", "-")
+    if engine == "faster-whisper":
+        fw_config = stt_config.get("faster_whisper", {})
+        return {
+            "engine": engine,
+            "compute_type": fw_config.get("compute_type", "default"),
+            "beam_size": fw_config.get("beam_size") or 5,
+            "threads": fw_config.get("cpu_threads", 0),
+        }
+    whisper_config = stt_config.get("whisper", {})
+    return {
+        "engine": "whisper",
+        "compute_type": None,
+        "beam_size": whisper_config.get("beam_size") or 1,
+        "threads": whisper_config.get("threads", 0),
+    }
+
+
+def apply_setup(config: Dict[str, Any], setup: Dict[str, Any]):
+    """
+    Write a setup into a configuration.
+
+    Args:
+        config: Configuration to update in place
+        setup: Setup as returned by candidates()
+    """
+    stt_config = config["speech_recognition"]
+    stt_config["engine"] = setup["engine"]
+    if setup["engine"] == "faster-whisper":
+        fw_config = stt_config.setdefault("faster_whisper", {})
+        fw_config["compute_type"] = setup["compute_type"]
+        fw_config["beam_size"] = setup["beam_size"]
+        fw_config["cpu_threads"] = setup["threads"]
+    else:
+        whisper_config = stt_config.setdefault("whisper", {})
+        # openai-whisper decodes greedily without a beam size
+        whisper_config["beam_size"] = setup["beam_size"] if setup["beam_size"] > 1 else None
+        whisper_config["threads"] = setup["threads"]
+
+
+def describe(setup: Dict[str, Any]) -> str:
+    """
+    Format a setup for a table row.
+
+    Args:
+        setup: Setup as returned by candidates()
+
+    Returns:
+        Short description
+    """
+    compute_type = f" {setup['compute_type']}" if setup["compute_type"] else ""
+    threads = setup["threads"] or "auto"
+    return f"{setup['engine']}{compute_type} beam {setup['beam_size']} threads {threads}"
+
+
+def load_clip(path: str) -> np.ndarray:
+    """
+    Read a WAV clip as recognizer input.
+
+    Args:
+        path: PCM WAV file of dictation
+
+    Returns:
+        16 kHz mono float32 samples
+    """
+    samples, rate = read_wav(path)
+    return PolyphaseResampler(rate, SAMPLE_RATE).process(samples.mean(axis=1))
+
+
+def measure(config: Dict[str, Any], audio: np.ndarray) -> Dict[str, Any]:
+    """
+    Load the configured engine and stream a clip through it like the recognizer.
+
+    Audio is inserted in blocks of scheduler.min_interval_s, with one pass per
+    block, and the rest is committed at the end. Meant to run in a fresh
+    process, so memory and thread settings of earlier setups don't carry over.
+
+    Args:
+        config: Configuration with the setup to measure applied
+        audio: 16 kHz mono clip
+
+    Returns:
+        Dict with load_s, rtf, p50_ms, p95_ms, memory_mb and text, or with
+        error if the model didn't load
+    """
+    # Imported here to avoid a circular import with the service module
+    from k_on_k.speech_recognition.service import create_engine
+
+    rss_before = rss_mb()
+    start_time = time.monotonic()
+    try:
+        engine = create_engine(config)
+    except Exception as e:
+        return {"error": str(e)}
+    if not engine.is_available():
+        return {"error": "the model didn't load, see the log for details"}
+    load_s = time.monotonic() - start_time
+
+    block = int(config["speech_recognition"].get("scheduler", {}).get("min_interval_s", 0.5) * SAMPLE_RATE)
+    passes = LatencyStats("Pass")
+    text = []
+    for offset in range(0, len(audio), block):
+        engine.insert_audio(audio[offset:offset + block])
+        start_time = time.perf_counter()
+        committed = engine.process_iter()
+        passes.add(time.perf_counter() - start_time)
+        text.append(committed or "")
+    start_time = time.perf_counter()
+    text.append(engine.flush() or "")
+    passes.add(time.perf_counter() - start_time)
+
+    stats = passes.summary()
+    return {
+        "load_s": load_s,
+        "rtf": passes.total / max(len(audio) / SAMPLE_RATE, 1e-9),
+        "p50_ms": stats["p50_ms"],
+        "p95_ms": stats["p95_ms"],
+        "memory_mb": rss_mb() - rss_before,
+        "text": " ".join(part for part in text if part),
+    }
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    Compute the word error rate of a transcript, ignoring case and punctuation.
+
+    Args:
+        reference: Expected text
+        hypothesis: Recognized text
+
+    Returns:
+        Word edits per reference word
+    """
+    ref = [word for word in map(_normalize, reference.split()) if word]
+    hyp = [word for word in map(_normalize, hypothesis.split()) if word]
+    if not ref:
+        return float(bool(hyp))
+
+    # Levenshtein distance over words, one row at a time
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def choose(results: List[Dict[str, Any]], target_rtf: float, max_wer: float) -> Optional[Dict[str, Any]]:
+    """
+    Pick the best measured setup.
+
+    Setups whose transcript is off by more than max_wer are out. Of the rest,
+    the one with the lowest p95 pass latency among those within the
+    scheduler's target real-time factor wins; if none keeps up, the one with
+    the lowest real-time factor does.
+
+    Args:
+        results: Measurements with setup and wer keys added
+        target_rtf: Pass time per second of audio the scheduler aims for
+        max_wer: Highest acceptable word error rate
+
+    Returns:
+        The chosen measurement, or None if no setup qualifies
+    """
+    accurate = [result for result in results if "error" not in result and result["wer"] <= max_wer]
+    fast = [result for result in accurate if result["rtf"] <= target_rtf]
+    if fast:
+        return min(fast, key=lambda result: (result["p95_ms"], result["memory_mb"]))
+    if accurate:
+        return min(accurate, key=lambda result: result["rtf"])
+    return None
+
+
+def run_cli(args, config: Dict[str, Any]) -> int:
+    """
+    Run `kitten-on-keys tune`.
+
+    Args:
+        args: Parsed arguments: clip, engines, beam_sizes, threads, reference,
+            max_wer, pin and dry_run
+        config: Application configuration
+
+    Returns:
+        Process exit code
+    """
+    # Imported here so the daemon's startup doesn't touch multiprocessing
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    try:
+        audio = load_clip(args.clip)
+    except (OSError, EOFError, ValueError) as e:
+        print(f"Could not read {args.clip}: {e}")
+        return 1
+    duration = len(audio) / SAMPLE_RATE
+    if duration < 1.0:
+        print(f"{args.clip} is too short to benchmark ({duration:.1f}s)")
+        return 1
+
+    engines = [engine.replace("_", "-") for engine in args.engines.split(",")] if args.engines else list(ENGINES)
+    engines = [engine for engine in engines if importlib.util.find_spec(ENGINES.get(engine, engine)) is not None]
+    if not engines:
+        print("None of the engines is installed")
+        return 1
+
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    stt_config = config["speech_recognition"]
+    if args.pin and len(cpus) > 1:
+        # Leave the first core to the audio callback and the event loop
+        cpus = cpus[1:]
+        stt_config["inference_cpus"] = cpus
+    if args.threads:
+        thread_counts = [int(count) for count in args.threads.split(",")]
+    else:
+        thread_counts = sorted({max(1, len(cpus) // 4), max(1, len(cpus) // 2), len(cpus)})
+    beam_sizes = [int(size) for size in args.beam_sizes.split(",")]
+
+    # The configured setup goes first: it is the baseline, and without a
+    # reference text its transcript is the reference
+    baseline = current_setup(config)
+    setups = [baseline] + [
+        setup for setup in candidates(config, engines, beam_sizes, thread_counts) if setup != baseline
+    ]
+    print(f"Benchmarking {len(setups)} setups on {duration:.1f}s of audio from {args.clip}")
+    reference = None
+    if args.reference:
+        with open(args.reference, "r") as f:
+            reference = f.read()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    print(f"{'setup':<48} {'load s':>7} {'RTF':>6} {'p50 ms':>8} {'p95 ms':>8} {'MB':>7} {'WER':>6}")
+    for setup in setups:
+        setup_config = copy.deepcopy(config)
+        apply_setup(setup_config, setup)
+        # A fresh process per setup, so every model loads cold and is measured alone
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                result = pool.submit(measure, setup_config, audio).result()
+            except Exception as e:
+                result = {"error": str(e)}
+        result["setup"] = setup
+        results.append(result)
+        if "error" in result:
+            print(f"{describe(setup):<48} failed: {result['error']}")
+            continue
+
+        if reference is None:
+            reference = result["text"]
+        result["wer"] = word_error_rate(reference, result["text"])
+        print(
+            f"{describe(setup):<48} {result['load_s']:>7.2f} {result['rtf']:>6.2f} {result['p50_ms']:>8.0f} "
+            f"{result['p95_ms']:>8.0f} {result['memory_mb']:>7.0f} {result['wer']:>6.1%}"
+        )
+
+    target_rtf = stt_config.get("scheduler", {}).get("target_rtf", 0.5)
+    best = choose(results, target_rtf, args.max_wer)
+    if best is None:
+        print(f"No setup transcribed the clip within {args.max_wer:.0%} word error rate")
+        return 1
+    print(f"Best: {describe(best['setup'])} (RTF {best['rtf']:.2f}, p95 {best['p95_ms']:.0f} ms)")
+    if best["rtf"] > target_rtf:
+        print(f"No setup reaches the scheduler's target RTF of {target_rtf}; consider a smaller model")
+
+    if args.dry_run:
+        return 0
+    # Only the tuned settings change; the saved file keeps everything else as it was
+    saved = load_config(args.config)
+    apply_setup(saved, best["setup"])
+    if args.pin:
+        saved["speech_recognition"]["inference_cpus"] = stt_config.get("inference_cpus")
+    if not save_config(saved, args.config):
+        return 1
+    print("Saved to the configuration")
+    return 0
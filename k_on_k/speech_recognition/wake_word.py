@@ -0,0 +1,509 @@
+"""
+Wake-word spotting for Kitten on Keys.
+Listens for the wake word while dictation is off, without running Whisper:
+log-mel features of the live audio are matched against enrolled recordings
+of the wake word with streaming dynamic time warping.
+"""
+
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from k_on_k.audio_capture.dsp import AudioFrontEnd, PolyphaseResampler
+from k_on_k.audio_capture.ring_buffer import AudioRingBuffer
+from k_on_k.audio_capture.sources import read_wav
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Feature frames: 25 ms windows every 10 ms
+FRAME_LENGTH = 400
+HOP_LENGTH = 160
+N_FFT = 512
+N_MELS = 32
+FRAMES_PER_SECOND = SAMPLE_RATE // HOP_LENGTH
+
+# Range kept below each frame's loudest band, in natural-log units (about 35 dB)
+DYNAMIC_RANGE = 8.0
+
+# Shortest and longest usable template, in frames
+MIN_TEMPLATE_FRAMES = 20
+MAX_TEMPLATE_FRAMES = 300
+
+# Frame distance charged for silent input, so silence can't complete a match
+SILENCE_COST = 0.6
+
+
+def mel_filterbank(n_mels: int = N_MELS, n_fft: int = N_FFT, sample_rate: int = SAMPLE_RATE,
+                   fmin: float = 60.0, fmax: float = 7600.0) -> np.ndarray:
+    """
+    Build triangular mel filters.
+
+    Returns:
+        Filter matrix of shape (n_mels, n_fft // 2 + 1)
+    """
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    mels = np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2)
+    bins = np.floor((n_fft + 1) * 700.0 * (10 ** (mels / 2595.0) - 1.0) / sample_rate).astype(int)
+
+    filters = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(n_mels):
+        left, center, right = bins[m], max(bins[m + 1], bins[m] + 1), max(bins[m + 2], bins[m] + 2)
+        filters[m, left:center] = (np.arange(left, center) - left) / (center - left)
+        filters[m, center:right] = (right - np.arange(center, right)) / (right - center)
+    return filters
+
+
+class LogMelFeatures:
+    """Streaming log-mel feature extractor for 16 kHz audio."""
+
+    def __init__(self, silence_rms: float = 0.01):
+        """
+        Initialize the extractor.
+
+        Args:
+            silence_rms: Frames quieter than this RMS level count as silence
+        """
+        self.silence_rms = silence_rms
+        self.window = np.hanning(FRAME_LENGTH).astype(np.float32)
+        self.filterbank = mel_filterbank().T
+        self.reset()
+
+    def reset(self):
+        """Forget audio carried over between blocks."""
+        self.tail = np.zeros(0, dtype=np.float32)
+
+    def process(self, audio_data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute the features of all frames completed by a block of audio.
+
+        Each frame is mean-normalized across bands and scaled to unit length,
+        so frames compare by cosine similarity regardless of input level.
+
+        Args:
+            audio_data: 16 kHz mono samples
+
+        Returns:
+            Tuple of (features of shape (frames, N_MELS), voiced flag per frame)
+        """
+        audio = np.concatenate((self.tail, audio_data.astype(np.float32, copy=False)))
+        n_frames = max(0, (len(audio) - FRAME_LENGTH) // HOP_LENGTH + 1)
+        self.tail = audio[n_frames * HOP_LENGTH:]
+        if not n_frames:
+            return np.zeros((0, N_MELS), dtype=np.float32), np.zeros(0, dtype=bool)
+
+        frames = np.lib.stride_tricks.sliding_window_view(audio, FRAME_LENGTH)[::HOP_LENGTH][:n_frames]
+        voiced = np.sqrt(np.mean(frames ** 2, axis=1)) >= self.silence_rms
+        power = np.abs(np.fft.rfft(frames * self.window, N_FFT)) ** 2
+        features = np.log(power @ self.filterbank + 1e-8)
+        # Limit the dynamic range so the noise floor doesn't dominate the shape
+        np.maximum(features, features.max(axis=1, keepdims=True) - DYNAMIC_RANGE, out=features)
+        features -= features.mean(axis=1, keepdims=True)
+        features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-8
+        return features.astype(np.float32), voiced
+
+
+def extract_template(audio_data: np.ndarray, silence_rms: float = 0.01) -> np.ndarray:
+    """
+    Turn a recording of the wake word into a template.
+
+    Args:
+        audio_data: 16 kHz mono recording
+        silence_rms: Silence level used to trim the recording
+
+    Returns:
+        Features of the spoken part, shape (frames, N_MELS)
+
+    Raises:
+        ValueError: If the recording holds too little or too much speech
+    """
+    features, voiced = LogMelFeatures(silence_rms).process(audio_data)
+    indices = np.flatnonzero(voiced)
+    if len(indices) == 0 or indices[-1] - indices[0] + 1 < MIN_TEMPLATE_FRAMES:
+        raise ValueError("recording holds too little speech above the silence level")
+    if indices[-1] - indices[0] + 1 > MAX_TEMPLATE_FRAMES:
+        raise ValueError(f"speech lasts longer than {MAX_TEMPLATE_FRAMES / FRAMES_PER_SECOND:.0f}s; record the wake word alone")
+    return features[indices[0]:indices[-1] + 1]
+
+
+def record_template(path: str, silence_rms: float = 0.01) -> np.ndarray:
+    """
+    Turn a WAV recording of a keyword into a template.
+
+    Args:
+        path: PCM WAV file holding one take of the keyword
+        silence_rms: Silence level used to trim the recording
+
+    Returns:
+        Template features
+
+    Raises:
+        OSError, EOFError: If the file can't be read
+        ValueError: If the recording holds too little or too much speech
+    """
+    samples, rate = read_wav(path)
+    audio = PolyphaseResampler(rate, SAMPLE_RATE).process(samples.mean(axis=1))
+    return extract_template(audio, silence_rms)
+
+
+def load_templates(directory: Path) -> List[np.ndarray]:
+    """
+    Load the templates saved in a directory.
+
+    Args:
+        directory: Directory of .npy templates
+
+    Returns:
+        Templates in file name order
+    """
+    templates = []
+    for path in sorted(Path(directory).glob("*.npy")):
+        try:
+            templates.append(np.load(path))
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading template {path}: {str(e)}")
+    return templates
+
+
+def save_template(directory: Path, template: np.ndarray) -> Path:
+    """
+    Save a template next to the ones already in a directory.
+
+    Args:
+        directory: Template directory, created if missing
+        template: Template features
+
+    Returns:
+        Path of the saved template
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    number = len(list(directory.glob("*.npy"))) + 1
+    target = directory / f"template_{number:03d}.npy"
+    while target.exists():
+        number += 1
+        target = directory / f"template_{number:03d}.npy"
+    np.save(target, template)
+    return target
+
+
+class TemplateMatcher:
+    """
+    Dynamic time warping of a feature stream against many templates at once.
+
+    The templates are stacked into one array, so extending every alignment by
+    an input frame is a handful of vectorized operations whatever their number.
+    A path may stay on a template frame (slower speech), move to the next one,
+    or skip one (faster speech).
+    """
+
+    def __init__(self, templates: List[np.ndarray]):
+        """
+        Initialize the matcher.
+
+        Args:
+            templates: Template features, each of shape (frames, N_MELS)
+        """
+        self.templates = [template.astype(np.float32) for template in templates]
+        lengths = np.array([len(template) for template in self.templates], dtype=int)
+        self.ends = np.cumsum(lengths) - 1
+        self.starts = self.ends - lengths + 1
+        self.stacked = np.concatenate(self.templates) if self.templates else np.zeros((0, N_MELS), np.float32)
+        # Longest alignment for each template position: the word spoken at half speed
+        self.max_length = np.repeat(2 * lengths, lengths)
+        self.positions = np.arange(len(self.stacked))
+        self.reset()
+
+    def reset(self):
+        """Drop all alignments."""
+        self.cost = np.full(len(self.stacked), np.inf, dtype=np.float32)  # Accumulated distance per template position
+        self.length = np.zeros(len(self.stacked), dtype=np.int32)  # Frames on the best path to each position
+
+    def advance(self, frame: np.ndarray, is_voiced: bool, start: bool) -> np.ndarray:
+        """
+        Extend all alignments by one input frame.
+
+        Args:
+            frame: Input features
+            is_voiced: Whether the frame is above the silence level
+            start: Whether an alignment may start at this frame
+
+        Returns:
+            Mean frame distance of the best alignment ending at each template's last frame
+        """
+        distance = 1.0 - self.stacked @ frame if is_voiced else np.full(len(self.cost), SILENCE_COST, np.float32)
+
+        step = np.empty_like(self.cost)
+        step[1:] = self.cost[:-1]
+        step[self.starts] = 0.0 if start else np.inf
+        step_length = np.empty_like(self.length)
+        step_length[1:] = self.length[:-1]
+        step_length[self.starts] = 0
+
+        skip = np.full_like(self.cost, np.inf)
+        skip[2:] = self.cost[:-2]
+        skip[self.starts] = np.inf
+        skip[np.minimum(self.starts + 1, len(skip) - 1)] = np.inf
+        skip_length = np.zeros_like(self.length)
+        skip_length[2:] = self.length[:-2]
+
+        candidates = np.stack((self.cost, step, skip))
+        choice = np.argmin(candidates, axis=0)
+        self.cost = candidates[choice, self.positions] + distance
+        self.length = np.stack((self.length, step_length, skip_length))[choice, self.positions] + 1
+        self.cost[self.length > self.max_length] = np.inf
+
+        return self.cost[self.ends] / self.length[self.ends]
+
+
+def keyword_slug(phrase: str) -> str:
+    """Return the directory name for a keyword's templates."""
+    return re.sub(r"\W+", "_", phrase.lower()).strip("_") or "keyword"
+
+
+def templates_dir(config: Dict[str, Any]) -> Path:
+    """
+    Return the directory holding the templates of the configured wake word.
+
+    Args:
+        config: Application configuration
+
+    Returns:
+        Template directory
+    """
+    spotter_config = config["speech_recognition"].get("wake_word_spotter", {})
+    root = Path(spotter_config.get("templates_dir", "~/.kitten_on_keys/wake_word")).expanduser()
+    return root / keyword_slug(config["general"]["wake_word"])
+
+
+class WakeWordSpotter:
+    """
+    Always-on keyword spotter.
+
+    Every enrolled template is matched against the feature stream with
+    subsequence DTW, one frame at a time, so spotting costs a small, fixed
+    amount per 10 ms of audio. The audio callback only
+    copies samples into a ring buffer; features and matching run on the
+    spotter's own thread.
+    """
+
+    def __init__(self, config: Dict[str, Any], capture_rate: int = SAMPLE_RATE):
+        """
+        Initialize the spotter.
+
+        Args:
+            config: Application configuration
+            capture_rate: Sample rate of the audio passed to feed()
+        """
+        spotter_config = config["speech_recognition"].get("wake_word_spotter", {})
+        self.wake_word = config["general"]["wake_word"]
+        self.templates_dir = templates_dir(config)
+        self.threshold = spotter_config.get("threshold", 0.12)
+        self.refractory_frames = int(spotter_config.get("refractory_s", 2.0) * FRAMES_PER_SECOND)
+        silence_rms = spotter_config.get("silence_rms", 0.01)
+
+        self.features = LogMelFeatures(silence_rms)
+        # Same conversion to 16 kHz as the recognizer's input, on the spotter's own state
+        self.front_end = AudioFrontEnd(config, capture_rate, 1)
+        self.front_end.on_audio = self.process
+        self.ring_buffer = AudioRingBuffer(capture_rate * 2)
+
+        self.matcher = TemplateMatcher([])
+        self.holdoff = 0  # Frames left to ignore after a detection
+        self.is_running = False
+        self.thread: Optional[threading.Thread] = None
+        self.audio_ready = threading.Event()
+
+        # Called on the spotter thread when the wake word is heard
+        self.on_detect: Optional[Callable[[], None]] = None
+
+        # CPU time and audio processed, for the cost report
+        self.cpu_s = 0.0
+        self.audio_s = 0.0
+        self.detections = 0
+
+    def load_templates(self, directory: Optional[Path] = None) -> int:
+        """
+        Load enrolled templates.
+
+        Args:
+            directory: Template directory; defaults to the one for the configured wake word
+
+        Returns:
+            Number of templates loaded
+        """
+        templates = load_templates(directory or self.templates_dir)
+        self.set_templates(templates)
+        return len(templates)
+
+    def set_templates(self, templates: List[np.ndarray]):
+        """
+        Use the given templates and reset the matcher.
+
+        Args:
+            templates: Template features, each of shape (frames, N_MELS)
+        """
+        self.matcher = TemplateMatcher(templates)
+        self.reset()
+
+    def reset(self):
+        """Drop partial alignments and buffered audio."""
+        self.matcher.reset()
+        self.holdoff = 0
+        self.features.reset()
+        self.front_end.reset()
+
+    def start(self):
+        """Start spotting on a background thread."""
+        if self.is_running:
+            return
+        if not self.matcher.templates:
+            logger.warning(f"No wake-word templates for '{self.wake_word}'; run 'kitten-on-keys wake-word enroll'")
+            return
+        logger.info(f"Listening for the wake word '{self.wake_word}' ({len(self.matcher.templates)} templates)")
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, name="kok-wake-word", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop spotting and log its cost."""
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.audio_ready.set()
+        self.thread.join(timeout=2.0)
+        if self.audio_s:
+            logger.info(
+                f"Wake-word spotter used {self.cpu_s / self.audio_s:.2%} of a core over "
+                f"{self.audio_s:.0f}s of audio, {self.detections} detections"
+            )
+
+    def feed(self, audio_data: np.ndarray):
+        """
+        Queue capture-rate mono audio (audio callback).
+
+        Args:
+            audio_data: Mono samples at the capture rate
+        """
+        if not self.is_running:
+            return
+        self.ring_buffer.write(audio_data)
+        self.audio_ready.set()
+
+    def _run(self):
+        """Spotter thread: process queued audio until stopped."""
+        while self.is_running:
+            self.audio_ready.wait()
+            self.audio_ready.clear()
+
+            start = time.thread_time()
+            views = self.ring_buffer.read_views()
+            consumed = 0
+            for view in views:
+                try:
+                    self.front_end.process(view)
+                except Exception as e:
+                    logger.error(f"Error in wake-word spotter: {str(e)}")
+                consumed += len(view)
+            self.ring_buffer.advance(consumed)
+            self.cpu_s += time.thread_time() - start
+
+    def process(self, audio_data: np.ndarray) -> bool:
+        """
+        Match a block of 16 kHz audio against the templates.
+
+        Args:
+            audio_data: 16 kHz mono samples
+
+        Returns:
+            True if the wake word was detected in the block
+        """
+        self.audio_s += len(audio_data) / SAMPLE_RATE
+        if not self.matcher.templates:
+            return False
+
+        features, voiced = self.features.process(audio_data)
+        detected = False
+        for frame, is_voiced in zip(features, voiced):
+            if self.holdoff:
+                self.holdoff -= 1
+                continue
+            if self.matcher.advance(frame, is_voiced, start=True).min() < self.threshold:
+                detected = True
+                self.detections += 1
+                self.holdoff = self.refractory_frames
+                self.matcher.reset()
+                logger.info(f"Wake word '{self.wake_word}' detected")
+                if self.on_detect:
+                    self.on_detect()
+        return detected
+
+
+def enroll(directory: Path, paths: List[str], silence_rms: float = 0.01) -> int:
+    """
+    Save a template for each recording and report progress on stdout.
+
+    Args:
+        directory: Template directory
+        paths: WAV recordings, one take each
+        silence_rms: Silence level used to trim the recordings
+
+    Returns:
+        Number of recordings that couldn't be used
+    """
+    failures = 0
+    for path in paths:
+        try:
+            template = record_template(path, silence_rms)
+        except (OSError, EOFError, ValueError) as e:
+            print(f"{path}: {e}")
+            failures += 1
+            continue
+        target = save_template(directory, template)
+        print(f"{path}: saved {len(template) / FRAMES_PER_SECOND:.2f}s template to {target}")
+    return failures
+
+
+def print_templates(directory: Path, label: str):
+    """Print the templates in a directory, or a note if there are none."""
+    paths = sorted(directory.glob("*.npy"))
+    if not paths:
+        print(f"No templates for '{label}' in {directory}")
+    for path in paths:
+        print(f"{label:<20} {path.name:<20} {len(np.load(path)) / FRAMES_PER_SECOND:5.2f}s")
+
+
+def run_cli(args, config: Dict[str, Any]) -> int:
+    """
+    Run a `kitten-on-keys wake-word` subcommand.
+
+    Args:
+        args: Parsed arguments with `wake_word_command` and its options
+        config: Application configuration
+
+    Returns:
+        Process exit code
+    """
+    directory = templates_dir(config)
+
+    if args.wake_word_command == "list":
+        print_templates(directory, config["general"]["wake_word"])
+        return 0
+
+    if args.wake_word_command == "enroll":
+        silence_rms = config["speech_recognition"].get("wake_word_spotter", {}).get("silence_rms", 0.01)
+        return 1 if enroll(directory, args.paths, silence_rms) else 0
+
+    if args.wake_word_command == "clear":
+        for path in directory.glob("*.npy"):
+            path.unlink()
+        print(f"Removed the templates in {directory}")
+        return 0
+
+    return 1
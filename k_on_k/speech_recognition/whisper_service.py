@@ -6,12 +6,16 @@ Uses OpenAI's Whisper model for efficient and accurate speech recognition.
 import logging
 import os
 import time
+from pathlib import Path
 from typing import Dict, Any, List, Optional, Callable
 
 import numpy as np
 import torch
 import whisper
 
+from k_on_k.speech_recognition.model_store import BACKEND_WHISPER, ModelStore
+from k_on_k.speech_recognition.streaming import StreamingTranscriber, Word
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,104 +35,211 @@ class WhisperService:
         self.whisper_config = config["speech_recognition"]["whisper"]
         self.model_size = self.whisper_config["model_size"]
         self.device = self.whisper_config["device"]
+        self.beam_size = self.whisper_config.get("beam_size")  # None decodes greedily
+        self.threads = self.whisper_config.get("threads", 0)
+        self.fast_decode = False  # Greedy decoding while the recognizer is falling behind
+        self.local_files_only = config["speech_recognition"].get("model_store", {}).get("local_files_only", True)
         
         # State
         self.model = None
         self.is_loaded = False
+        self.load_time_s = 0.0
         self.language = config["general"]["language"]
-        self.audio_buffer = []
-        self.last_transcript = ""
+        
+        # Sliding-window streaming state
+        self.streamer = StreamingTranscriber(self.transcribe_words, config)
         
         # Load model at initialization
         self._load_model()
     
     def _load_model(self):
-        """Load the Whisper model."""
+        """Load the Whisper model, preferring the local model store."""
         try:
             logger.info(f"Loading Whisper model (size: {self.model_size}, device: {self.device})")
             start_time = time.time()
+            if self.threads:
+                torch.set_num_threads(self.threads)
             
-            self.model = whisper.load_model(
-                self.model_size, 
-                device=self.device
+            # Checkpoints on disk, in the store or the Whisper cache, are memory-mapped, so a
+            # reload after an idle unload mostly pages weights back in from the page cache
+            checkpoint = (
+                ModelStore.from_config(self.config).resolve(self.model_size, BACKEND_WHISPER)
+                or self._cached_checkpoint()
             )
+            if checkpoint:
+                self.model = self._load_checkpoint(checkpoint)
+            else:
+                if self.local_files_only:
+                    raise RuntimeError(
+                        f"{self.model_size} is not in the model store or the Whisper cache; "
+                        f"add it with `kitten-on-keys models prefetch`"
+                    )
+                self.model = whisper.load_model(
+                    self.model_size, 
+                    device=self.device
+                )
             
-            load_time = time.time() - start_time
-            logger.info(f"Whisper model loaded in {load_time:.2f} seconds")
+            self.load_time_s = time.time() - start_time
+            logger.info(f"Whisper model loaded in {self.load_time_s:.2f} seconds")
             self.is_loaded = True
             
         except Exception as e:
             logger.error(f"Error loading Whisper model: {str(e)}")
             self.is_loaded = False
     
+    def _load_checkpoint(self, path: Path):
+        """
+        Load a checkpoint from the model store or the cache with memory-mapped weights.
+        
+        Mirrors whisper.load_model, but the state dict is memory-mapped and assigned
+        to the model instead of copied, so on CPU weights are paged in from disk.
+        
+        Args:
+            path: openai-whisper .pt checkpoint
+            
+        Returns:
+            Loaded Whisper model on the configured device
+        """
+        try:
+            checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        except RuntimeError:
+            # Checkpoints saved in the legacy (non-zip) format can't be memory-mapped
+            checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+        
+        dims = whisper.model.ModelDimensions(**checkpoint["dims"])
+        model = whisper.model.Whisper(dims)
+        model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+        if self.device == "cpu":
+            # Assigned weights keep the checkpoint's dtype, and CPU decoding runs in fp32;
+            # this is a no-op for fp32 checkpoints, which stay memory-mapped
+            model.float()
+        
+        # Word timestamps need the per-model alignment heads that load_model would set
+        if self.model_size in whisper._ALIGNMENT_HEADS:
+            model.set_alignment_heads(whisper._ALIGNMENT_HEADS[self.model_size])
+        
+        return model.to(self.device)
+    
+    def _cached_checkpoint(self) -> Optional[Path]:
+        """Return the checkpoint whisper.load_model would load without downloading, if it exists."""
+        if self.model_size not in whisper._MODELS:
+            path = Path(self.model_size)
+        else:
+            default = os.path.join(os.path.expanduser("~"), ".cache")
+            download_root = os.path.join(os.getenv("XDG_CACHE_HOME", default), "whisper")
+            path = Path(download_root) / os.path.basename(whisper._MODELS[self.model_size])
+        return path if path.is_file() else None
+    
     def process_audio(self, audio_data: np.ndarray) -> Optional[str]:
         """
-        Process audio data and return transcription.
+        Process audio data and return newly committed transcription.
+        
+        Audio is appended to a bounded sliding window; only the prefix that
+        stays stable across successive passes is committed.
         
         Args:
             audio_data: Audio data as numpy array
             
         Returns:
-            Transcription text if successful, None otherwise
+            Newly committed text if any, None otherwise
         """
         if not self.is_loaded:
             logger.warning("Whisper model not loaded, cannot process audio")
             return None
         
         try:
-            # Add audio to buffer
-            self.audio_buffer.append(audio_data)
-            
-            # Convert buffer to audio data for Whisper
-            audio = np.concatenate(self.audio_buffer)
-            
-            # Transcribe audio
-            result = self.model.transcribe(
-                audio,
-                language=self.language[:2],  # Use first 2 chars (e.g., "en" from "en-US")
-                fp16=(self.device == "cuda"),
-            )
-            
-            transcript = result["text"].strip()
-            
-            # Only return new part of transcript
-            if transcript and transcript != self.last_transcript:
-                new_part = transcript[len(self.last_transcript):].strip()
-                self.last_transcript = transcript
-                return new_part
-            
+            return self.streamer.process_audio(audio_data)
+        except Exception as e:
+            logger.error(f"Error processing audio with Whisper: {str(e)}")
             return None
-            
+    
+    def insert_audio(self, audio_data: np.ndarray):
+        """
+        Append audio to the streaming window without running inference.
+        
+        Args:
+            audio_data: Audio data as numpy array
+        """
+        if not self.is_loaded:
+            return
+        
+        self.streamer.insert_audio(audio_data)
+    
+    def process_iter(self) -> Optional[str]:
+        """
+        Run one transcription pass over the audio inserted so far.
+        
+        Returns:
+            Newly committed text if any, None otherwise
+        """
+        if not self.is_loaded:
+            logger.warning("Whisper model not loaded, cannot process audio")
+            return None
+        
+        try:
+            return self.streamer.process_iter()
         except Exception as e:
             logger.error(f"Error processing audio with Whisper: {str(e)}")
             return None
     
-    def reset(self):
-        """Reset the transcription state."""
-        self.audio_buffer = []
-        self.last_transcript = ""
+    def flush(self) -> Optional[str]:
+        """
+        Commit whatever is left in the window, e.g. when dictation stops.
+        
+        Returns:
+            Remaining transcription text if any, None otherwise
+        """
+        if not self.is_loaded:
+            return None
+        
+        try:
+            return self.streamer.finish()
+        except Exception as e:
+            logger.error(f"Error flushing Whisper transcription: {str(e)}")
+            return None
     
-    def detect_commands(self, text: str, trigger_phrases: List[str]) -> Optional[str]:
+    def transcribe_words(self, audio: np.ndarray, prompt: Optional[str] = None) -> List[Word]:
         """
-        Detect if the text contains trigger commands.
+        Transcribe a window of audio into words with timestamps.
         
         Args:
-            text: Transcribed text
-            trigger_phrases: List of trigger phrases to detect
+            audio: Audio window (16 kHz mono float32)
+            prompt: Previously committed text used as decoding context
             
         Returns:
-            Detected command or None
+            Recognized words, timed relative to the window start
         """
-        if not text:
-            return None
-            
-        lower_text = text.lower()
+        result = self.model.transcribe(
+            audio,
+            language=self.language[:2],  # Use first 2 chars (e.g., "en" from "en-US")
+            fp16=(self.device == "cuda"),
+            beam_size=None if self.fast_decode else self.beam_size,
+            initial_prompt=prompt,
+            condition_on_previous_text=False,
+            word_timestamps=True,
+        )
+        return [
+            Word(word["start"], word["end"], word["word"])
+            for segment in result.get("segments", [])
+            for word in segment.get("words", [])
+        ]
+    
+    def reset(self):
+        """Reset the transcription state."""
+        self.streamer.reset()
+    
+    def drop_utterance(self):
+        """Drop the current utterance without decoding it, keeping the context."""
+        self.streamer.drop_utterance()
+    
+    def set_fast_decode(self, enabled: bool):
+        """
+        Switch between the configured beam size and greedy decoding.
         
-        for phrase in trigger_phrases:
-            if phrase.lower() in lower_text:
-                return phrase
-                
-        return None
+        Args:
+            enabled: True to decode greedily
+        """
+        self.fast_decode = enabled
     
     def is_available(self) -> bool:
         """
@@ -0,0 +1,347 @@
+"""
+Out-of-process inference worker for Kitten on Keys.
+Runs the speech-to-text model in its own process, so decoding doesn't compete with
+audio callbacks, the hotkey listener and text insertion for the GIL.
+"""
+
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from k_on_k.audio_capture.ring_buffer import AudioRingBuffer
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# The segment starts with the ring's [write, read] indices, followed by the samples
+INDEX_BYTES = 2 * np.dtype(np.int64).itemsize
+
+
+def _ring_from_buffer(buf, capacity: int) -> AudioRingBuffer:
+    """
+    Lay an audio ring buffer over a shared memory segment.
+
+    Args:
+        buf: Buffer of the segment, at least INDEX_BYTES + 4 * capacity bytes
+        capacity: Number of samples the ring holds
+
+    Returns:
+        AudioRingBuffer whose samples and indices live in the segment
+    """
+    indices = np.ndarray((2,), dtype=np.int64, buffer=buf)
+    samples = np.ndarray((capacity,), dtype=np.float32, buffer=buf, offset=INDEX_BYTES)
+    return AudioRingBuffer(capacity, buffer=samples, indices=indices)
+
+
+def _worker_main(config: Dict[str, Any], shm_name: str, capacity: int, conn):
+    """
+    Entry point of the worker process.
+
+    Loads the model, reports readiness, then serves commands until told to stop.
+    Audio is read from the shared ring; only commands and text go through the pipe.
+
+    Args:
+        config: Application configuration
+        shm_name: Name of the shared memory segment holding the audio ring
+        capacity: Number of samples in the ring
+        conn: Worker end of the command pipe
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    # The parent owns the segment; don't let this process unlink it on exit
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching always registers the segment. The worker
+        # shares the parent's resource tracker, which keeps one entry per name, so
+        # that is harmless; unregistering here would drop the parent's entry instead
+        shm = shared_memory.SharedMemory(name=shm_name)
+    ring = _ring_from_buffer(shm.buf, capacity)
+
+    try:
+        # Imported here to avoid a circular import; the engines are only needed in the worker
+        from k_on_k.speech_recognition.service import create_engine, warm_up
+
+        engine = create_engine(config)
+        if config["speech_recognition"].get("warmup", True) and engine.is_available():
+            warm_up(engine)
+    except Exception as e:
+        logger.error(f"Error loading model in inference worker: {str(e)}")
+        conn.send(("ready", False, str(e)))
+        return
+
+    conn.send(("ready", True, None))
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break  # The parent went away
+
+            command = message[0]
+            if command == "stop":
+                break
+            if command in ("reset", "drop"):
+                # Only drop audio written before the request; the parent may already
+                # have written the start of the next session or utterance behind it
+                ring.advance(message[1] - ring.read_index)
+                if command == "reset":
+                    engine.reset()
+                else:
+                    engine.drop_utterance()
+                continue
+
+            # Move everything the parent has written into the model's window
+            views = ring.read_views()
+            for view in views:
+                engine.insert_audio(view)
+            ring.advance(sum(len(view) for view in views))
+
+            text = engine.flush() if command == "flush" else engine.process_iter()
+            conn.send(("text", text))
+    finally:
+        del ring
+        shm.close()
+
+
+class InferenceWorkerClient:
+    """
+    Proxy for a speech-to-text engine running in a worker process.
+    Offers the same streaming interface as the in-process engines.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the worker client and its shared audio ring.
+
+        Args:
+            config: Application configuration
+        """
+        self.config = config
+        worker_config = config["speech_recognition"].get("worker", {})
+        self.max_restarts = worker_config.get("max_restarts", 3)
+        self.ready_timeout_s = worker_config.get("ready_timeout_s", 300.0)
+
+        # Room for everything the capture ring can hand over in one drain
+        self.capacity = int(config["audio"].get("ring_buffer_s", 30.0) * SAMPLE_RATE)
+        self.shm = shared_memory.SharedMemory(create=True, size=INDEX_BYTES + 4 * self.capacity)
+        self.ring = _ring_from_buffer(self.shm.buf, self.capacity)
+
+        # Spawn rather than fork: the parent runs audio, hotkey and X11 threads
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.conn = None
+        self.is_loaded = False
+        self.restarts = 0  # Consecutive crashes without a successful request in between
+        self.failed = False
+
+        # Text committed while making room in the ring, returned with the next pass
+        self.pending_text: List[str] = []
+
+    def start(self):
+        """Spawn the worker process; the model loads there in the background."""
+        self.ring.indices[:] = 0
+        self.is_loaded = False
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(self.config, self.shm.name, self.capacity, child_conn),
+            name="kok-inference",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        """
+        Block until the worker has loaded the model.
+
+        Args:
+            timeout: Maximum time to wait, in seconds; defaults to the configured timeout
+
+        Raises:
+            RuntimeError: If the model failed to load or the worker didn't start in time
+        """
+        if self.is_loaded:
+            return
+
+        if not self.conn.poll(self.ready_timeout_s if timeout is None else timeout):
+            raise RuntimeError("Inference worker did not become ready in time")
+
+        _, ok, error = self.conn.recv()
+        if not ok:
+            self.failed = True
+            raise RuntimeError(f"Inference worker failed to load the model: {error}")
+
+        self.is_loaded = True
+        logger.info(f"Inference worker ready (pid {self.process.pid})")
+
+    def stop(self):
+        """Stop the worker process and release the shared memory."""
+        if self.process is not None:
+            try:
+                self.conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=1.0)
+            self.conn.close()
+            self.process = None
+
+        if self.shm is not None:
+            del self.ring
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def insert_audio(self, audio_data: np.ndarray):
+        """
+        Write audio into the shared ring without running inference.
+
+        Args:
+            audio_data: Audio samples (16 kHz mono float32)
+        """
+        if self.failed:
+            return
+
+        if self.ring.free() < len(audio_data):
+            # Let the worker take in what it has before the ring overflows
+            text = self._request("process")
+            if text:
+                self.pending_text.append(text)
+
+        self.ring.write(audio_data)
+
+    def process_iter(self) -> Optional[str]:
+        """
+        Run one transcription pass in the worker.
+
+        Returns:
+            Newly committed text, or None if nothing was committed
+        """
+        return self._take_text(self._request("process"))
+
+    def process_audio(self, audio_data: np.ndarray) -> Optional[str]:
+        """
+        Append audio and run one transcription pass in the worker.
+
+        Args:
+            audio_data: Audio samples (16 kHz mono float32)
+
+        Returns:
+            Newly committed text, or None if nothing was committed
+        """
+        self.insert_audio(audio_data)
+        return self.process_iter()
+
+    def flush(self) -> Optional[str]:
+        """
+        Commit everything left in the worker's window.
+
+        Returns:
+            Remaining text, or None if there was nothing left
+        """
+        return self._take_text(self._request("flush"))
+
+    def reset(self):
+        """Drop all audio and text to start a new session."""
+        self._drop("reset")
+
+    def drop_utterance(self):
+        """Drop the current utterance without decoding it, keeping the context."""
+        self._drop("drop")
+
+    def _drop(self, command: str):
+        """Send a reset or drop request covering the audio written so far."""
+        self.pending_text = []
+        if self.process is None or self.failed:
+            return
+        try:
+            self.conn.send((command, self.ring.write_index))
+        except OSError as e:
+            logger.error(f"Inference worker failed: {str(e)}")
+            self._restart()
+
+    def is_available(self) -> bool:
+        """
+        Check if the worker has a model loaded.
+
+        Returns:
+            True if the worker is ready, False otherwise
+        """
+        return self.is_loaded and not self.failed
+
+    def _request(self, command: str) -> Optional[str]:
+        """
+        Send a command and wait for the worker's text reply.
+
+        The calling thread blocks on the pipe, which releases the GIL for the
+        rest of the process. A crashed worker is restarted and the request dropped.
+
+        Args:
+            command: "process" or "flush"
+
+        Returns:
+            Text from the worker, or None
+        """
+        if self.failed:
+            return None
+
+        try:
+            self.wait_ready()
+            self.conn.send((command,))
+            while not self.conn.poll(0.5):
+                if not self.process.is_alive():
+                    raise EOFError(f"worker exited with code {self.process.exitcode}")
+            _, text = self.conn.recv()
+        except (EOFError, OSError) as e:
+            logger.error(f"Inference worker failed: {str(e)}")
+            self._restart()
+            return None
+        except RuntimeError as e:
+            logger.error(str(e))
+            if not self.failed:
+                self._restart()
+            return None
+
+        self.restarts = 0
+        return text
+
+    def _restart(self):
+        """Replace a crashed worker, giving up after too many crashes in a row."""
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join(timeout=1.0)
+            self.conn.close()
+            self.process = None
+
+        self.restarts += 1
+        if self.restarts > self.max_restarts:
+            logger.error(f"Inference worker crashed {self.restarts - 1} times in a row, giving up")
+            self.failed = True
+            return
+
+        # Audio and uncommitted text held by the old worker are lost
+        logger.warning(f"Restarting inference worker (attempt {self.restarts})")
+        self.start()
+
+    def _take_text(self, text: Optional[str]) -> Optional[str]:
+        """Prepend text committed while making room in the ring."""
+        if text:
+            self.pending_text.append(text)
+        if not self.pending_text:
+            return None
+        text = " ".join(self.pending_text)
+        self.pending_text = []
+        return text
@@ -0,0 +1,97 @@
+"""
+Startup import profiling for Kitten on Keys.
+Reports what importing the application costs, using Python's -X importtime.
+"""
+
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+# Modules that belong to a speech-to-text engine and must not be imported at startup
+ENGINE_MODULES = ("torch", "whisper", "faster_whisper", "ctranslate2")
+
+START_MARKER = "kok-importtime-start"
+
+
+class ImportTiming(NamedTuple):
+    """Import cost of one module, in microseconds."""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # 0 for modules imported directly by the profiled import
+
+
+def profile_imports(module: str = "k_on_k.main", env: Optional[Dict[str, str]] = None) -> List[ImportTiming]:
+    """
+    Import a module in a fresh interpreter and record what every import cost.
+
+    Args:
+        module: Module to import
+        env: Environment for the interpreter; defaults to the current one
+
+    Returns:
+        Timings in import completion order
+
+    Raises:
+        RuntimeError: If the import fails
+    """
+    # The marker separates the interpreter's own startup imports from the profiled ones
+    code = f"import sys; sys.stderr.write('{START_MARKER}\\n'); import {module}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    lines = result.stderr.splitlines()
+    timings = []
+    for line in lines[lines.index(START_MARKER) + 1:]:
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us), int(cumulative_us), depth))
+    return timings
+
+
+def total_import_time(timings: List[ImportTiming]) -> float:
+    """
+    Return the total time spent importing, in seconds.
+
+    Args:
+        timings: Timings from profile_imports
+
+    Returns:
+        Sum of the cumulative times of the top-level imports
+    """
+    return sum(timing.cumulative_us for timing in timings if timing.depth == 0) / 1e6
+
+
+def format_report(timings: List[ImportTiming], limit: int = 25) -> str:
+    """
+    Format the most expensive imports as a table.
+
+    Args:
+        timings: Timings from profile_imports
+        limit: Number of modules to list
+
+    Returns:
+        Report text
+    """
+    slowest = sorted(timings, key=lambda timing: timing.cumulative_us, reverse=True)[:limit]
+    lines = [f"{'cumulative ms':>14} {'self ms':>9}  module"]
+    for timing in slowest:
+        lines.append(
+            f"{timing.cumulative_us / 1000:14.1f} {timing.self_us / 1000:9.1f}  {'  ' * timing.depth}{timing.module}"
+        )
+
+    lines.append(f"\nTotal import time: {total_import_time(timings) * 1000:.0f} ms across {len(timings)} modules")
+    loaded = sorted({timing.module.split(".")[0] for timing in timings} & set(ENGINE_MODULES))
+    if loaded:
+        lines.append(f"Engine modules imported at startup: {', '.join(loaded)}")
+    return "\n".join(lines)
+
@@ -0,0 +1,621 @@
+"""
+Text insertion backends for Kitten on Keys.
+Different ways of getting text into the focused window, and the per-window
+selection between them.
+"""
+
+import abc
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Backends tried in order when text_insertion.backend is "auto"
+AUTO_ORDER = ("xdotool", "uinput", "ydotool", "pynput")
+
+# Keys used by the text insertion service
+KEYS = ("backspace", "delete", "enter")
+
+# Timeout for helper tools, so a hung X server can't stall insertion for long
+TOOL_TIMEOUT_S = 5.0
+
+
+def _run_tool(args: List[str], input_text: Optional[str] = None) -> subprocess.CompletedProcess:
+    """Run a helper tool, raising RuntimeError if it fails."""
+    if input_text is None:
+        stdout, errors = subprocess.PIPE, None
+    else:
+        # Clipboard owners like xclip fork a child that keeps serving the selection and
+        # inherits the output streams; run() would wait on a pipe until that child exits
+        stdout, errors = subprocess.DEVNULL, tempfile.TemporaryFile("w+")
+    try:
+        result = subprocess.run(
+            args,
+            input=input_text,
+            text=True,
+            stdout=stdout,
+            stderr=errors or subprocess.PIPE,
+            timeout=TOOL_TIMEOUT_S,
+        )
+        if errors:
+            errors.seek(0)
+            result.stderr = errors.read()
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise RuntimeError(f"{args[0]} failed: {e}") from e
+    finally:
+        if errors:
+            errors.close()
+    if result.returncode != 0:
+        raise RuntimeError(f"{args[0]} failed: {(result.stderr or '').strip()}")
+    return result
+
+
+class InsertionBackend(abc.ABC):
+    """
+    Interface for text insertion backends.
+    Backends type text and tap the keys in KEYS into the focused window.
+    """
+
+    name = ""
+
+    def is_available(self) -> bool:
+        """
+        Check whether the backend can work in this session.
+
+        Returns:
+            True if the backend is usable
+        """
+        return True
+
+    @abc.abstractmethod
+    def type_text(self, text: str):
+        """
+        Type text into the focused window.
+
+        Args:
+            text: Text to type
+        """
+
+    @abc.abstractmethod
+    def tap_key(self, key: str, count: int = 1):
+        """
+        Press and release a key.
+
+        Args:
+            key: One of KEYS
+            count: Number of taps
+        """
+
+    def close(self):
+        """Release the backend's resources."""
+
+
+class PynputBackend(InsertionBackend):
+    """Synthetic key events through pynput, one event per character."""
+
+    name = "pynput"
+
+    def __init__(self):
+        """Initialize the pynput backend."""
+        self.keyboard = None
+        self.available: Optional[bool] = None
+
+    def is_available(self) -> bool:
+        if self.available is None:
+            self.available = self._probe()
+        return self.available
+
+    def _probe(self) -> bool:
+        """Check that pynput is installed and, on Linux, has an X display to send events to."""
+        if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+            return False
+        try:
+            import pynput.keyboard  # noqa: F401
+        except Exception as e:  # pynput raises more than ImportError when it can't find a backend
+            logger.debug(f"pynput is unavailable: {str(e)}")
+            return False
+        return True
+
+    def _open(self):
+        """Create the keyboard controller on first use."""
+        from pynput.keyboard import Controller as KeyboardController, Key
+
+        self.keyboard = KeyboardController()
+        self.Key = Key
+        self.keys = {"backspace": Key.backspace, "delete": Key.delete, "enter": Key.enter}
+
+    def type_text(self, text: str):
+        if self.keyboard is None:
+            self._open()
+        self.keyboard.type(text)
+
+    def tap_key(self, key: str, count: int = 1):
+        if self.keyboard is None:
+            self._open()
+        for _ in range(count):
+            self.keyboard.press(self.keys[key])
+            self.keyboard.release(self.keys[key])
+
+    def press_chord(self, chord: str):
+        """
+        Press a key combination such as "ctrl+shift+v".
+
+        Args:
+            chord: Key names joined by "+"; modifiers first
+        """
+        if self.keyboard is None:
+            self._open()
+        *modifiers, key = chord.lower().split("+")
+        modifiers = [getattr(self.Key, name) for name in modifiers]
+        key = getattr(self.Key, key) if len(key) > 1 else key
+
+        for modifier in modifiers:
+            self.keyboard.press(modifier)
+        try:
+            self.keyboard.press(key)
+            self.keyboard.release(key)
+        finally:
+            for modifier in reversed(modifiers):
+                self.keyboard.release(modifier)
+
+
+class BufferBackend(InsertionBackend):
+    """
+    Keeps typed text in memory instead of sending it to a window.
+
+    Used when replaying audio, so the transcript never lands in whatever
+    window happens to have focus.
+    """
+
+    name = "buffer"
+
+    def __init__(self):
+        """Initialize the buffer backend."""
+        self.text = ""
+
+    def type_text(self, text: str):
+        self.text += text
+
+    def tap_key(self, key: str, count: int = 1):
+        if key == "backspace":
+            self.text = self.text[:max(len(self.text) - count, 0)]
+        elif key == "enter":
+            self.text += "\n" * count
+
+
+class NullBackend(InsertionBackend):
+    """Drops text, with a warning; used when no other backend can type in this session."""
+
+    name = "none"
+
+    def is_available(self) -> bool:
+        return False
+
+    def type_text(self, text: str):
+        logger.warning(f"No insertion backend is available, dropping {len(text)} characters")
+
+    def tap_key(self, key: str, count: int = 1):
+        logger.warning(f"No insertion backend is available, dropping {count} {key} key presses")
+
+
+class XdotoolBackend(InsertionBackend):
+    """One xdotool invocation per insertion (X11)."""
+
+    name = "xdotool"
+    key_names = {"backspace": "BackSpace", "delete": "Delete", "enter": "Return"}
+
+    def __init__(self, delay_ms: int):
+        """
+        Initialize the xdotool backend.
+
+        Args:
+            delay_ms: Delay between keystrokes; 0 can make slow applications drop keys
+        """
+        self.delay_ms = delay_ms
+
+    def is_available(self) -> bool:
+        return (
+            shutil.which("xdotool") is not None
+            and bool(os.environ.get("DISPLAY"))
+            and os.environ.get("XDG_SESSION_TYPE") != "wayland"
+        )
+
+    def type_text(self, text: str):
+        _run_tool(["xdotool", "type", "--clearmodifiers", "--delay", str(self.delay_ms), "--", text])
+
+    def tap_key(self, key: str, count: int = 1):
+        _run_tool([
+            "xdotool", "key", "--clearmodifiers", "--delay", str(self.delay_ms),
+            "--repeat", str(count), self.key_names[key],
+        ])
+
+
+class YdotoolBackend(InsertionBackend):
+    """One ydotool invocation per insertion, through the ydotoold daemon (Wayland and X11)."""
+
+    name = "ydotool"
+    # Linux input event codes
+    key_codes = {"backspace": 14, "delete": 111, "enter": 28}
+
+    def __init__(self, delay_ms: int):
+        """
+        Initialize the ydotool backend.
+
+        Args:
+            delay_ms: Delay between keystrokes
+        """
+        self.delay_ms = delay_ms
+
+    def is_available(self) -> bool:
+        return shutil.which("ydotool") is not None
+
+    def type_text(self, text: str):
+        _run_tool(["ydotool", "type", "--key-delay", str(self.delay_ms), "--", text])
+
+    def tap_key(self, key: str, count: int = 1):
+        code = self.key_codes[key]
+        _run_tool(["ydotool", "key", "--key-delay", str(self.delay_ms)] + [f"{code}:1", f"{code}:0"] * count)
+
+
+class UinputBackend(InsertionBackend):
+    """
+    Virtual keyboard on /dev/uinput through python-evdev (Wayland and X11).
+
+    Key events go straight to the kernel, so there is no per-call process
+    start-up. Characters are mapped for a US layout; anything else is typed
+    through the fallback backend.
+    """
+
+    name = "uinput"
+
+    # Unshifted and shifted characters on each US-layout key
+    LAYOUT = {
+        "KEY_GRAVE": "`~", "KEY_1": "1!", "KEY_2": "2@", "KEY_3": "3#", "KEY_4": "4$", "KEY_5": "5%",
+        "KEY_6": "6^", "KEY_7": "7&", "KEY_8": "8*", "KEY_9": "9(", "KEY_0": "0)", "KEY_MINUS": "-_",
+        "KEY_EQUAL": "=+", "KEY_LEFTBRACE": "[{", "KEY_RIGHTBRACE": "]}", "KEY_BACKSLASH": "\\|",
+        "KEY_SEMICOLON": ";:", "KEY_APOSTROPHE": "'\"", "KEY_COMMA": ",<", "KEY_DOT": ".>",
+        "KEY_SLASH": "/?", "KEY_SPACE": "  ", "KEY_ENTER": "\n\n", "KEY_TAB": "\t\t",
+    }
+
+    def __init__(self, delay_ms: int, fallback: Callable[[], InsertionBackend]):
+        """
+        Initialize the uinput backend.
+
+        Args:
+            delay_ms: Delay between keystrokes
+            fallback: Returns the backend for characters the layout doesn't have;
+                only called once such a character comes up
+        """
+        self.delay_s = delay_ms / 1000
+        self.fallback = fallback
+        self.device = None
+        self.char_codes: Dict[str, tuple] = {}
+        self.key_codes: Dict[str, int] = {}
+
+    def is_available(self) -> bool:
+        try:
+            import evdev  # noqa: F401
+        except ImportError:
+            return False
+        return os.access("/dev/uinput", os.W_OK)
+
+    def _open(self):
+        """Create the virtual keyboard on first use."""
+        from evdev import UInput, ecodes
+
+        for name, chars in self.LAYOUT.items():
+            self.char_codes.setdefault(chars[0], (ecodes.ecodes[name], False))
+            self.char_codes.setdefault(chars[1], (ecodes.ecodes[name], True))
+        for letter in "abcdefghijklmnopqrstuvwxyz":
+            code = ecodes.ecodes[f"KEY_{letter.upper()}"]
+            self.char_codes[letter] = (code, False)
+            self.char_codes[letter.upper()] = (code, True)
+        self.key_codes = {"backspace": ecodes.KEY_BACKSPACE, "delete": ecodes.KEY_DELETE, "enter": ecodes.KEY_ENTER}
+        self.shift = ecodes.KEY_LEFTSHIFT
+        self.EV_KEY = ecodes.EV_KEY
+
+        codes = sorted({code for code, _ in self.char_codes.values()} | set(self.key_codes.values()) | {self.shift})
+        self.device = UInput({ecodes.EV_KEY: codes}, name="kitten-on-keys")
+        # The display server needs a moment to pick up a new input device
+        time.sleep(0.2)
+
+    def type_text(self, text: str):
+        if self.device is None:
+            self._open()
+
+        pending = []  # Run of characters the layout can't type
+        for char in text:
+            if char not in self.char_codes:
+                pending.append(char)
+                continue
+            if pending:
+                self.fallback().type_text("".join(pending))
+                pending = []
+            code, shifted = self.char_codes[char]
+            self._tap(code, shifted)
+        if pending:
+            self.fallback().type_text("".join(pending))
+
+    def tap_key(self, key: str, count: int = 1):
+        if self.device is None:
+            self._open()
+        for _ in range(count):
+            self._tap(self.key_codes[key], False)
+
+    def _tap(self, code: int, shifted: bool):
+        """Press and release one key, with shift held if needed."""
+        if shifted:
+            self.device.write(self.EV_KEY, self.shift, 1)
+        self.device.write(self.EV_KEY, code, 1)
+        self.device.write(self.EV_KEY, code, 0)
+        if shifted:
+            self.device.write(self.EV_KEY, self.shift, 0)
+        self.device.syn()
+        if self.delay_s:
+            time.sleep(self.delay_s)
+
+    def close(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+
+class ClipboardBackend(InsertionBackend):
+    """
+    Paste through the clipboard: the whole text arrives in one event.
+
+    The previous clipboard text is saved before the first paste and restored
+    shortly after the last one, once the application has read the pasted text.
+    Only text content is preserved. Keys are tapped through the key backend.
+    """
+
+    name = "clipboard"
+
+    def __init__(self, paste_keys: str, restore_delay_s: float, keys: PynputBackend):
+        """
+        Initialize the clipboard backend.
+
+        Args:
+            paste_keys: Paste shortcut of the target window, e.g. "ctrl+v"
+            restore_delay_s: Time to wait after a paste before restoring the clipboard
+            keys: Backend for the paste shortcut and other keys
+        """
+        self.paste_keys = paste_keys
+        self.restore_delay_s = restore_delay_s
+        self.keys = keys
+        self.saved: Optional[str] = None
+        self.restore_timer: Optional[threading.Timer] = None
+        self.lock = threading.Lock()
+
+        if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-copy"):
+            self.copy_cmd, self.paste_cmd = ["wl-copy"], ["wl-paste", "--no-newline"]
+        elif shutil.which("xclip"):
+            self.copy_cmd = ["xclip", "-selection", "clipboard", "-in"]
+            self.paste_cmd = ["xclip", "-selection", "clipboard", "-out"]
+        elif shutil.which("xsel"):
+            self.copy_cmd = ["xsel", "--clipboard", "--input"]
+            self.paste_cmd = ["xsel", "--clipboard", "--output"]
+        else:
+            self.copy_cmd = self.paste_cmd = None
+
+    def is_available(self) -> bool:
+        return self.copy_cmd is not None and self.keys.is_available()
+
+    def type_text(self, text: str):
+        with self.lock:
+            if self.restore_timer is not None:
+                # Still pasting; the clipboard holds our own text, not the user's
+                self.restore_timer.cancel()
+            else:
+                try:
+                    self.saved = _run_tool(self.paste_cmd).stdout
+                except RuntimeError:
+                    self.saved = None  # Empty, or not text
+
+            _run_tool(self.copy_cmd, input_text=text)
+            self.keys.press_chord(self.paste_keys)
+
+            self.restore_timer = threading.Timer(self.restore_delay_s, self._restore)
+            self.restore_timer.daemon = True
+            self.restore_timer.start()
+
+    def tap_key(self, key: str, count: int = 1):
+        self.keys.tap_key(key, count)
+
+    def _restore(self):
+        """Put the saved clipboard text back."""
+        with self.lock:
+            self.restore_timer = None
+            if self.saved is None:
+                return
+            try:
+                _run_tool(self.copy_cmd, input_text=self.saved)
+            except RuntimeError as e:
+                logger.warning(f"Could not restore the clipboard: {str(e)}")
+            self.saved = None
+
+    def close(self):
+        with self.lock:
+            timer = self.restore_timer
+        if timer is not None:
+            timer.cancel()
+            self._restore()
+
+
+def active_window_id() -> Optional[str]:
+    """
+    Return the X11 id of the focused window.
+
+    Returns:
+        Window id, or None if it can't be determined (e.g. on Wayland)
+    """
+    if not os.environ.get("DISPLAY") or not shutil.which("xprop"):
+        return None
+    try:
+        output = _run_tool(["xprop", "-root", "_NET_ACTIVE_WINDOW"]).stdout
+    except RuntimeError:
+        return None
+    # _NET_ACTIVE_WINDOW(WINDOW): window id # 0x3a00007
+    window_id = output.rsplit(" ", 1)[-1].strip()
+    return window_id if window_id.startswith("0x") and int(window_id, 16) else None
+
+
+def window_class(window_id: str) -> Optional[str]:
+    """
+    Return the lowercase WM_CLASS class name of a window.
+
+    Args:
+        window_id: X11 window id
+
+    Returns:
+        Class name, e.g. "gnome-terminal", or None
+    """
+    try:
+        output = _run_tool(["xprop", "-id", window_id, "WM_CLASS"]).stdout
+    except RuntimeError:
+        return None
+    # WM_CLASS(STRING) = "gnome-terminal-server", "Gnome-terminal"
+    names = [part.strip().strip('"') for part in output.partition("=")[2].split(",")]
+    return names[-1].lower() if names and names[-1] else None
+
+
+class BackendSelector:
+    """
+    Chooses the insertion backend for the focused window.
+
+    text_insertion.window_backends maps window classes to backends; other
+    windows get text_insertion.backend, where "auto" means the first available
+    backend in AUTO_ORDER, or a backend that drops text if none is. Backend
+    choices are made once per class. The focused window and its class are
+    looked up at most once per text_insertion.window_lookup_s, not for every
+    batch; only the current window's class is kept, since X reuses window ids.
+    """
+
+    def __init__(self, config: Dict[str, Any], backend: Optional[InsertionBackend] = None):
+        """
+        Initialize the selector.
+
+        Args:
+            config: Application configuration
+            backend: Backend to use for every window instead of selecting one
+        """
+        text_config = config["text_insertion"]
+        self.fixed = backend
+        self.default = text_config.get("backend", "auto")
+        self.window_backends = {
+            window.lower(): name for window, name in text_config.get("window_backends", {}).items()
+        }
+        self.delay_ms = text_config.get("type_delay_ms", 2)
+        clipboard_config = text_config.get("clipboard", {})
+        self.paste_keys = clipboard_config.get("paste_keys", "ctrl+v")
+        self.paste_keys_by_class = {
+            window.lower(): keys for window, keys in clipboard_config.get("paste_keys_by_class", {}).items()
+        }
+        self.restore_delay_s = clipboard_config.get("restore_delay_s", 0.3)
+        self.window_lookup_s = text_config.get("window_lookup_s", 0.5)
+
+        self.window_class: Optional[str] = None
+        self.window_checked = float("-inf")  # When window_class was looked up (time.monotonic)
+        self.backend_by_class: Dict[Optional[str], InsertionBackend] = {}
+        self.backends: Dict[str, InsertionBackend] = {}  # Shared instances, by name
+
+    def select(self) -> InsertionBackend:
+        """
+        Return the backend for the focused window.
+
+        Returns:
+            InsertionBackend instance
+        """
+        if self.fixed is not None:
+            return self.fixed
+
+        now = time.monotonic()
+        if now - self.window_checked >= self.window_lookup_s:
+            # xprop is a process start; batches in quick succession go to the same window
+            window_id = active_window_id()
+            self.window_class = window_class(window_id) if window_id is not None else None
+            self.window_checked = now
+        klass = self.window_class
+
+        backend = self.backend_by_class.get(klass)
+        if backend is None:
+            backend = self._create(self.window_backends.get(klass, self.default), klass)
+            logger.info(f"Typing into {klass or 'unknown windows'} with {backend.name}")
+            self.backend_by_class[klass] = backend
+        return backend
+
+    def create(self, name: str, klass: Optional[str] = None) -> Optional[InsertionBackend]:
+        """
+        Create a backend by name.
+
+        Args:
+            name: Backend name
+            klass: Window class the backend is for, which sets the paste shortcut
+
+        Returns:
+            Backend instance, or None if it is unknown or unavailable here
+        """
+        if name == "clipboard":
+            # One instance per paste shortcut; they share the key backend
+            paste_keys = self.paste_keys_by_class.get(klass, self.paste_keys)
+            name = f"clipboard:{paste_keys}"
+            if name not in self.backends:
+                self.backends[name] = ClipboardBackend(paste_keys, self.restore_delay_s, self._pynput())
+        elif name not in self.backends:
+            if name == "pynput":
+                self.backends[name] = self._pynput()
+            elif name == "xdotool":
+                self.backends[name] = XdotoolBackend(self.delay_ms)
+            elif name == "ydotool":
+                self.backends[name] = YdotoolBackend(self.delay_ms)
+            elif name == "uinput":
+                self.backends[name] = UinputBackend(self.delay_ms, self._fallback)
+            else:
+                return None
+
+        backend = self.backends[name]
+        return backend if backend.is_available() else None
+
+    def close(self):
+        """Close all backends."""
+        for backend in self.backends.values():
+            backend.close()
+
+    def _create(self, name: str, klass: Optional[str]) -> InsertionBackend:
+        """Create the named backend, falling back to the first available one in AUTO_ORDER."""
+        if name != "auto":
+            backend = self.create(name, klass)
+            if backend is not None:
+                return backend
+            logger.warning(f"Insertion backend {name} is unavailable, selecting one automatically")
+
+        for candidate in AUTO_ORDER:
+            backend = self.create(candidate, klass)
+            if backend is not None:
+                return backend
+        logger.error("No insertion backend is available; transcribed text won't be typed")
+        return self._null()
+
+    def _pynput(self) -> PynputBackend:
+        """Return the shared pynput backend."""
+        if "pynput" not in self.backends:
+            self.backends["pynput"] = PynputBackend()
+        return self.backends["pynput"]
+
+    def _fallback(self) -> InsertionBackend:
+        """Return the backend for characters the uinput layout can't type."""
+        pynput = self._pynput()
+        return pynput if pynput.is_available() else self._null()
+
+    def _null(self) -> NullBackend:
+        """Return the shared backend that drops text."""
+        if "none" not in self.backends:
+            self.backends["none"] = NullBackend()
+        return self.backends["none"]
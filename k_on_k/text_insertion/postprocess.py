@@ -0,0 +1,257 @@
+"""
+Text post-processing for Kitten on Keys.
+Turns recognized text into typed text in one pass: spoken punctuation, the
+user's replacement dictionary, spacing and capitalization.
+"""
+
+import logging
+import re
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Token kinds, which decide the spacing around a token
+WORD = 0  # Spaced on both sides
+OPEN = 1  # Opening bracket or quote: no space after
+CLOSE = 2  # Punctuation and closing brackets: no space before
+NEWLINE = 3  # No space on either side
+
+SENTENCE_END = frozenset(".!?")
+
+# Whitespace-separated chunk: leading openers, the word, trailing closers. Punctuation
+# inside a chunk (3.14, e.g, node.js, don't) stays part of the word.
+CHUNK = re.compile(r"\S+")
+PEEL = re.compile(r"([(\[{\"“‘]*)(.*?)([.,!?:;)\]}\"”’…%]*)", re.S)
+# Dotted abbreviation (e.g, i.e, U.S) whose final period belongs to the word
+ABBREVIATION = re.compile(r"(?:[^\W\d_]\.)+[^\W\d_]")
+
+# Key of the trie node that holds a phrase's replacement
+_END = ""
+
+
+class PhraseTrie:
+    """
+    Word-level trie of phrases with leftmost-longest matching.
+
+    Matching walks the trie from each word, so its cost depends on the input
+    length and the longest phrase, never on the number of phrases.
+    """
+
+    def __init__(self):
+        """Initialize an empty trie."""
+        self.root: Dict[str, Any] = {}
+        self.size = 0
+        self.max_words = 0
+
+    def add(self, words: List[str], value: Any):
+        """
+        Add a phrase; a later value for the same phrase replaces the earlier one.
+
+        Args:
+            words: Lowercase words of the phrase
+            value: Value returned for matches of the phrase
+        """
+        if not words:
+            return
+        node = self.root
+        for word in words:
+            node = node.setdefault(word, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = value
+        self.max_words = max(self.max_words, len(words))
+
+    def match(self, words: List[str], start: int) -> Tuple[int, Any]:
+        """
+        Find the longest phrase starting at a word.
+
+        Args:
+            words: Lowercase words
+            start: Index of the first word
+
+        Returns:
+            Tuple of (number of words matched, value); (0, None) if no phrase matches
+        """
+        node = self.root
+        length, value = 0, None
+        for i in range(start, len(words)):
+            node = node.get(words[i])
+            if node is None:
+                break
+            if _END in node:
+                length, value = i - start + 1, node[_END]
+        return length, value
+
+
+def _tokenize(text: str) -> List[list]:
+    """
+    Split text into tokens.
+
+    Returns:
+        List of [text, kind, verbatim, spaced] tokens; spaced tokens had
+        whitespace before them in the text
+    """
+    tokens = []
+    for chunk in CHUNK.finditer(text):
+        openers, word, closers = PEEL.fullmatch(chunk.group()).groups()
+        if closers.startswith(".") and ABBREVIATION.fullmatch(word):
+            word, closers = word + ".", closers[1:]
+        first = len(tokens)
+        tokens.extend([char, OPEN, False, False] for char in openers)
+        if word:
+            tokens.append([word, WORD, False, False])
+        tokens.extend([char, CLOSE, False, False] for char in closers)
+        tokens[first][3] = True
+    return tokens
+
+
+def load_replacements(path: Path) -> Dict[str, str]:
+    """
+    Read a replacement dictionary file.
+
+    Each line holds a spoken phrase and its written form separated by a tab;
+    empty lines and lines starting with # are skipped.
+
+    Args:
+        path: Dictionary file
+
+    Returns:
+        Dict mapping spoken phrases to written forms
+    """
+    replacements = {}
+    with open(Path(path).expanduser(), "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            spoken, tab, written = line.partition("\t")
+            if not tab:
+                logger.warning(f"{path}:{number}: expected 'spoken<TAB>written', skipping")
+                continue
+            replacements[spoken.strip()] = written.strip()
+    return replacements
+
+
+class TextPostProcessor:
+    """
+    Compiled post-processor for recognized text.
+
+    Spoken punctuation ("comma", "new line") and dictionary phrases share one
+    trie, so a fragment is tokenized, matched and re-spaced in a single pass.
+    Dictionary replacements are typed verbatim, keeping their own casing.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize the post-processor.
+
+        Args:
+            config: Application configuration
+        """
+        text_config = config["text_insertion"]
+        self.capitalize_sentences = text_config.get("capitalize_sentences", True)
+        self.auto_spacing = text_config.get("auto_spacing", True)
+
+        replacements = dict(text_config.get("replacements", {}))
+        if text_config.get("replacements_path"):
+            try:
+                replacements.update(load_replacements(text_config["replacements_path"]))
+            except OSError as e:
+                logger.error(f"Error loading replacements: {str(e)}")
+
+        self.trie = PhraseTrie()
+        for spoken, written in replacements.items():
+            self.trie.add(self._phrase_words(spoken), [written, WORD, True, True])
+
+        # Spoken punctuation; later entries win, so it takes precedence over the dictionary
+        punctuation = config.get("speech_recognition", {}).get("punctuation_commands", {})
+        for spoken, symbol in punctuation.items():
+            kind = self._symbol_kind(spoken, symbol)
+            self.trie.add(self._phrase_words(spoken), [symbol, kind, True, kind in (WORD, OPEN)])
+
+        logger.debug(f"Post-processor compiled {self.trie.size} phrases")
+
+    @staticmethod
+    def _phrase_words(phrase: str) -> List[str]:
+        """Return the lowercase words a phrase is matched on."""
+        return [token[0].lower() for token in _tokenize(phrase) if token[1] == WORD]
+
+    @staticmethod
+    def _symbol_kind(spoken: str, symbol: str) -> int:
+        """Classify the symbol of a punctuation command for spacing."""
+        if symbol == "\n":
+            return NEWLINE
+        if spoken.startswith("open") or symbol in "([{":
+            return OPEN
+        if spoken.startswith("close") or symbol in ".,!?:;)]}":
+            return CLOSE
+        return WORD
+
+    def process(self, text: str, after_space: bool = True, sentence_start: bool = True) -> str:
+        """
+        Process a fragment of recognized text for typing.
+
+        Args:
+            text: Recognized text
+            after_space: Whether the text typed so far ends with whitespace
+            sentence_start: Whether the fragment starts a new sentence
+
+        Returns:
+            Text to type
+        """
+        tokens = _tokenize(text)
+        words = [token[0].lower() if token[1] == WORD else None for token in tokens]
+
+        # Substitute phrases, then drop the model's own punctuation around spoken
+        # punctuation ("Hello, comma." -> "Hello,")
+        output: List[list] = []
+        i = 0
+        after_command = False
+        while i < len(tokens):
+            length, value = self.trie.match(words, i) if words[i] is not None else (0, None)
+            if not length:
+                token = tokens[i]
+                if not (after_command and token[1] == CLOSE):
+                    output.append(token)
+                    after_command = False
+                i += 1
+                continue
+
+            if value[1] != WORD:
+                while output and output[-1][1] == CLOSE and not output[-1][2]:
+                    output.pop()
+                after_command = True
+            else:
+                after_command = False
+            output.append(value)
+            i += length
+
+        return self._render(output, after_space, sentence_start)
+
+    def _render(self, tokens: List[list], after_space: bool, sentence_start: bool) -> str:
+        """Join tokens with spacing and sentence capitalization."""
+        parts = []
+        previous = WORD if not after_space else NEWLINE
+        capitalize = self.capitalize_sentences and sentence_start
+
+        for text, kind, verbatim, spaced in tokens:
+            if self.auto_spacing:
+                if previous not in (OPEN, NEWLINE) and kind not in (CLOSE, NEWLINE):
+                    parts.append(" ")
+            elif parts and spaced:
+                # Keep the recognizer's own spacing
+                parts.append(" ")
+
+            if capitalize and kind == WORD:
+                if not verbatim:
+                    text = text[:1].upper() + text[1:]
+                capitalize = False
+            parts.append(text)
+
+            if kind == CLOSE and text in SENTENCE_END:
+                capitalize = self.capitalize_sentences
+            previous = kind
+
+        return "".join(parts)
+
@@ -4,27 +4,48 @@ Handles sending text to the currently active application.
 """
 
 import logging
-import re
+import os
+import queue
+import threading
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
-from pynput.keyboard import Controller as KeyboardController, Key
+from k_on_k.metrics import LatencyStats
+from k_on_k.text_insertion.backends import BackendSelector, InsertionBackend
+from k_on_k.text_insertion.postprocess import SENTENCE_END, TextPostProcessor
 
 logger = logging.getLogger(__name__)
 
+# Operations queued for the insertion worker
+OP_INSERT = "insert"
+OP_REVISE = "revise"
+OP_COMMIT = "commit"
+OP_COMMAND = "command"
+
 
 class TextInsertionService:
     """
     Service for inserting text into the active application.
-    Uses keyboard simulation to type text into the currently focused window.
+    Uses keyboard simulation to type text into the currently focused window,
+    through the insertion backend selected for that window.
+    
+    Text of the current utterance can be revised until it is committed: each
+    revision is applied as the minimal edit from what is already on screen,
+    i.e. backspaces to the common prefix, then the new tail.
+    
+    Callers only enqueue operations; a worker thread types them in order, so
+    slow keyboard simulation never holds up recognition. The worker takes all
+    queued operations at once and merges their keystrokes, so adjacent
+    fragments go out as one insertion and superseded partial text is never typed.
     """
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], backend: Optional[InsertionBackend] = None):
         """
         Initialize the text insertion service.
         
         Args:
             config: Application configuration
+            backend: Backend to use for every window instead of selecting one per window
         """
         self.config = config
         self.text_config = config["text_insertion"]
@@ -33,14 +54,35 @@ class TextInsertionService:
         self.capitalize_sentences = self.text_config["capitalize_sentences"]
         self.add_punctuation = self.text_config["add_punctuation"]
         self.auto_spacing = self.text_config["auto_spacing"]
+        self.post_processor = TextPostProcessor(config)
         
         # State
         self.is_running = False
         self.last_text_ends_with_space = True
         self.current_sentence_has_capital = False
         
-        # Keyboard controller for typing
-        self.keyboard = KeyboardController()
+        # Revisable utterance: text typed for it so far, and the spacing and
+        # capitalization state from before it (None when no utterance is open)
+        self.utterance_typed = ""
+        self.utterance_state: Optional[Tuple[bool, bool]] = None
+        self.keys_typed = 0
+        self.keys_deleted = 0
+        
+        # Backends for typing, chosen per focused window
+        self.backends = BackendSelector(config, backend)
+        
+        # Operations waiting for the worker, as (enqueue time, OP_*, argument).
+        # The queue itself is unbounded so enqueueing never blocks; the capacity
+        # only decides when revisions start being dropped.
+        self.queue: queue.Queue = queue.Queue()
+        self.queue_capacity = self.text_config.get("queue_capacity", 64)
+        self.worker: Optional[threading.Thread] = None
+        self.max_queue_depth = 0
+        self.dropped_revisions = 0
+        self.latency_stats = LatencyStats("Insertion latency")
+        
+        # Keystrokes planned for the current batch: ["type", text] and ["key", name, count]
+        self.plan: List[list] = []
     
     def start(self):
         """Start the text insertion service."""
@@ -49,14 +91,29 @@ class TextInsertionService:
             
         logger.info("Starting text insertion service")
         self.is_running = True
+        self.worker = threading.Thread(target=self._run_worker, name="kok-insertion", daemon=True)
+        self.worker.start()
     
-    def stop(self):
-        """Stop the text insertion service."""
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop the text insertion service after typing what is still queued.
+        
+        Args:
+            timeout: Maximum time to wait for the queue to drain, in seconds
+        """
         if not self.is_running:
             return
             
         logger.info("Stopping text insertion service")
         self.is_running = False
+        self.queue.put((time.perf_counter(), None, None))
+        self.worker.join(timeout)
+        self.worker = None
+        self.backends.close()
+        logger.info(
+            f"{self.latency_stats.format()}; queue depth max {self.max_queue_depth}, "
+            f"{self.dropped_revisions} superseded revisions dropped"
+        )
     
     def insert_text(self, text: str):
         """
@@ -65,63 +122,31 @@ class TextInsertionService:
         Args:
             text: Text to insert
         """
-        if not self.is_running or not text:
-            return
-        
-        logger.debug(f"Inserting text: {text}")
-        
-        # Process text before insertion
-        processed_text = self._process_text(text)
-        
-        if processed_text:
-            try:
-                # Type text using the keyboard controller
-                self.keyboard.type(processed_text)
-                
-                # Update state for next insertion
-                self.last_text_ends_with_space = processed_text.endswith(" ")
-                self.current_sentence_has_capital = not any(processed_text.endswith(x) for x in [".", "!", "?"])
-                
-            except Exception as e:
-                logger.error(f"Error inserting text: {str(e)}")
+        if text:
+            self._enqueue(OP_INSERT, text)
     
-    def _process_text(self, text: str) -> str:
+    def revise_text(self, text: str):
         """
-        Process text before insertion.
-        Applies capitalization, punctuation, and spacing rules.
+        Show a revised hypothesis of the current utterance.
+        
+        The first call opens the utterance; later calls replace its text with
+        the minimal edit. An empty hypothesis removes the utterance's text.
         
         Args:
-            text: Raw text to process
-            
-        Returns:
-            Processed text ready for insertion
+            text: Full text of the utterance so far
         """
-        if not text:
-            return ""
+        self._enqueue(OP_REVISE, text)
+    
+    def commit_text(self, text: str):
+        """
+        Replace the current utterance's hypothesis with its final text and close it.
         
-        # Add space before text if needed
-        if self.auto_spacing and not self.last_text_ends_with_space and not text.startswith((" ", ",", ".", "!", "?", ":", ";", ")", "]", "}")):
-            text = " " + text
-        
-        # Capitalize first letter of sentences
-        if self.capitalize_sentences and not self.current_sentence_has_capital:
-            # If this is the start of a new sentence
-            if self.last_text_ends_with_space or not self.auto_spacing:
-                text = text[0].upper() + text[1:] if text else ""
-                self.current_sentence_has_capital = True
-        
-        # Fix common spacing issues
-        if self.auto_spacing:
-            # Add space after punctuation if missing
-            text = re.sub(r'([.!?:;,])([^\s\d])', r'\1 \2', text)
-            
-            # Remove space before punctuation
-            text = re.sub(r'\s+([.!?:;,])', r'\1', text)
-            
-            # Ensure only one space between words
-            text = re.sub(r'\s{2,}', ' ', text)
+        Without an open utterance this types the text like insert_text.
         
-        return text
+        Args:
+            text: Final text of the utterance
+        """
+        self._enqueue(OP_COMMIT, text)
     
     def type_command(self, command: str):
         """
@@ -130,19 +155,215 @@ class TextInsertionService:
         Args:
             command: Command to execute
         """
+        self._enqueue(OP_COMMAND, command)
+    
+    def queue_depth(self) -> int:
+        """
+        Return the number of operations waiting for the worker.
+        
+        Returns:
+            Queue depth
+        """
+        return self.queue.qsize()
+    
+    def wait_idle(self):
+        """Block until every queued operation has been typed."""
+        self.queue.join()
+    
+    def _enqueue(self, op: str, argument: str):
+        """
+        Queue an operation for the worker.
+        
+        Never blocks the caller. When the queue is at capacity, a revision is
+        dropped: the next revision or commit carries the whole utterance anyway.
+        Everything else is queued past capacity, to keep the text intact.
+        """
         if not self.is_running:
             return
+        
+        depth = self.queue.qsize()
+        if depth >= self.queue_capacity:
+            if op == OP_REVISE:
+                self.dropped_revisions += 1
+                return
+            if depth == self.queue_capacity:
+                logger.warning("Text insertion is falling behind, queueing past capacity")
+        self.queue.put_nowait((time.perf_counter(), op, argument))
+        self.max_queue_depth = max(self.max_queue_depth, depth + 1)
+    
+    def _run_worker(self):
+        """Type queued operations in order, one merged batch at a time (worker thread)."""
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
             
+            for _, op, argument in batch:
+                if op is None:
+                    stopping = True
+                else:
+                    self._apply(op, argument)
+            self._flush_plan()
+            
+            done = time.perf_counter()
+            for enqueued, op, _ in batch:
+                if op is not None:
+                    self.latency_stats.add(done - enqueued)
+                self.queue.task_done()
+    
+    def _apply(self, op: str, argument: str):
+        """Plan the keystrokes of one operation (worker thread)."""
+        try:
+            if op == OP_INSERT:
+                self._insert(argument)
+            elif op == OP_REVISE:
+                self._revise(argument)
+            elif op == OP_COMMIT:
+                logger.debug(f"Committing text: {argument}")
+                self._revise(argument)
+                self._close_utterance()
+            elif op == OP_COMMAND:
+                self._command(argument)
+        except Exception as e:
+            logger.error(f"Error inserting text: {str(e)}")
+    
+    def _insert(self, text: str):
+        """Append text after whatever is on screen."""
+        logger.debug(f"Inserting text: {text}")
+        
+        # Whatever is on screen for an open utterance stays as it is
+        self._close_utterance()
+        
+        # Process text before insertion
+        processed_text = self._process_text(text)
+        
+        if processed_text:
+            self._plan_type(processed_text)
+            self._update_state(processed_text)
+    
+    def _revise(self, text: str):
+        """Replace the open utterance's text, opening one if needed."""
+        if self.utterance_state is None:
+            self.utterance_state = (self.last_text_ends_with_space, self.current_sentence_has_capital)
+        
+        # Every revision is processed from the state before the utterance, so
+        # spacing and capitalization don't depend on earlier revisions
+        self.last_text_ends_with_space, self.current_sentence_has_capital = self.utterance_state
+        processed_text = self._process_text(text) if text else ""
+        
+        self._apply_edit(processed_text)
+        self._update_state(self.utterance_typed)
+    
+    def _apply_edit(self, new_text: str):
+        """
+        Turn the utterance's typed text into new_text with as few keystrokes as possible.
+        
+        Args:
+            new_text: Processed text that should be on screen
+        """
+        old_text = self.utterance_typed
+        common = len(os.path.commonprefix([old_text, new_text]))
+        
+        if len(old_text) > common:
+            self._plan_key("backspace", len(old_text) - common)
+        if new_text[common:]:
+            self._plan_type(new_text[common:])
+        self.utterance_typed = new_text
+    
+    def _command(self, command: str):
+        """Plan a typing command."""
         logger.debug(f"Executing typing command: {command}")
+        self._close_utterance()
         
         # Handle various commands
         if command == "backspace":
-            self.keyboard.press(Key.backspace)
-            self.keyboard.release(Key.backspace)
+            self._plan_key("backspace", 1)
         elif command == "delete":
-            self.keyboard.press(Key.delete)
-            self.keyboard.release(Key.delete)
+            self._plan_key("delete", 1)
         elif command == "new_line":
-            self.keyboard.press(Key.enter)
-            self.keyboard.release(Key.enter)
-        # Add more commands as needed 
\ No newline at end of file
+            self._plan_key("enter", 1)
+        # Add more commands as needed
+    
+    def _plan_type(self, text: str):
+        """Add text to the keystroke plan, merged with text typed just before."""
+        if self.plan and self.plan[-1][0] == "type":
+            self.plan[-1][1] += text
+        else:
+            self.plan.append(["type", text])
+    
+    def _plan_key(self, key: str, count: int):
+        """Add key taps to the keystroke plan; backspaces cancel planned text first."""
+        if key == "backspace" and self.plan and self.plan[-1][0] == "type":
+            unsent = self.plan[-1][1]
+            cancelled = min(count, len(unsent))
+            self.plan[-1][1] = unsent[:len(unsent) - cancelled]
+            if not self.plan[-1][1]:
+                self.plan.pop()
+            count -= cancelled
+        if not count:
+            return
+        
+        if self.plan and self.plan[-1][0] == "key" and self.plan[-1][1] == key:
+            self.plan[-1][2] += count
+        else:
+            self.plan.append(["key", key, count])
+    
+    def _flush_plan(self):
+        """Send the planned keystrokes through the backend for the focused window."""
+        plan, self.plan = self.plan, []
+        if not plan:
+            return
+        
+        try:
+            backend = self.backends.select()
+            for action in plan:
+                if action[0] == "type":
+                    backend.type_text(action[1])
+                    self.keys_typed += len(action[1])
+                else:
+                    backend.tap_key(action[1], action[2])
+                    if action[1] == "backspace":
+                        self.keys_deleted += action[2]
+        except Exception as e:
+            logger.error(f"Error inserting text: {str(e)}")
+    
+    def _update_state(self, processed_text: str):
+        """Update spacing and capitalization state after processed_text was typed."""
+        if not processed_text:
+            # Nothing on screen for the utterance; as if it never started
+            if self.utterance_state is not None:
+                self.last_text_ends_with_space, self.current_sentence_has_capital = self.utterance_state
+            return
+        self.last_text_ends_with_space = processed_text[-1].isspace()
+        self.current_sentence_has_capital = processed_text.rstrip()[-1:] not in SENTENCE_END
+    
+    def _close_utterance(self):
+        """Stop tracking the open utterance; its text can no longer be revised."""
+        if self.utterance_state is not None:
+            logger.debug(f"Utterance closed ({self.keys_typed} keys typed, {self.keys_deleted} deleted in total)")
+        self.utterance_typed = ""
+        self.utterance_state = None
+    
+    def _process_text(self, text: str) -> str:
+        """
+        Process text before insertion.
+        Applies spoken punctuation, replacements, capitalization and spacing rules.
+        
+        Args:
+            text: Raw text to process
+            
+        Returns:
+            Processed text ready for insertion
+        """
+        if not text:
+            return ""
+        
+        return self.post_processor.process(
+            text,
+            after_space=self.last_text_ends_with_space,
+            sentence_start=not self.current_sentence_has_capital,
+        )
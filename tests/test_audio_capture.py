@@ -0,0 +1,276 @@
+"""Tests for the audio capture package."""
+
+import time
+import wave
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from k_on_k.audio_capture.dsp import HighPassFilter, PolyphaseResampler
+from k_on_k.audio_capture.ring_buffer import AudioRingBuffer, PreRollBuffer
+from k_on_k.audio_capture import sources
+from k_on_k.audio_capture.sources import StdinSource, WavFileSource, create_audio_source, read_wav
+from k_on_k.audio_capture.vad import VoiceActivityDetector
+from k_on_k.config.settings import get_default_config
+
+
+def ramp(start, count):
+    """Samples whose values are their stream positions."""
+    return np.arange(start, start + count, dtype=np.float32)
+
+
+def test_ring_buffer_wraps_around():
+    ring = AudioRingBuffer(8)
+    assert ring.write(ramp(0, 6)) == 6
+    ring.advance(5)
+    assert ring.write(ramp(6, 5)) == 5  # Ends past the end of the storage
+
+    views = ring.read_views()
+    assert len(views) == 2
+    assert np.concatenate(views).tolist() == ramp(5, 6).tolist()
+    assert ring.available() == 6 and ring.free() == 2
+    assert np.concatenate(ring.read_views(4)).tolist() == ramp(5, 4).tolist()
+
+    ring.advance(6)
+    assert ring.read_views() == []
+    assert ring.write_index == ring.read_index == 11
+
+
+def test_ring_buffer_counts_dropped_samples():
+    ring = AudioRingBuffer(8)
+    ring.write(ramp(0, 6))
+    assert ring.write(ramp(6, 5)) == 2  # The rest is dropped, not overwritten
+    assert ring.overruns == 3
+    assert np.concatenate(ring.read_views()).tolist() == ramp(0, 8).tolist()
+
+    ring.advance(100)  # Never past the written samples
+    assert ring.available() == 0
+    assert ring.write(ramp(8, 3)) == 3 and ring.overruns == 3
+
+
+def test_ring_buffer_in_shared_memory():
+    capacity = 16
+    shm = shared_memory.SharedMemory(create=True, size=16 + 4 * capacity)
+    try:
+        # A producer and a consumer over the same segment, as in two processes
+        rings = [
+            AudioRingBuffer(
+                capacity,
+                buffer=np.ndarray((capacity,), dtype=np.float32, buffer=shm.buf, offset=16),
+                indices=np.ndarray((2,), dtype=np.int64, buffer=shm.buf),
+            )
+            for _ in range(2)
+        ]
+        producer, consumer = rings
+        producer.write(ramp(0, 10))
+        assert consumer.available() == 10
+        assert consumer.read_views()[0].tolist() == ramp(0, 10).tolist()
+
+        consumer.advance(10)
+        assert producer.free() == capacity
+        del rings, producer, consumer
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_pre_roll_keeps_latest_audio():
+    pre_roll = PreRollBuffer(4)
+    pre_roll.write(ramp(0, 3))
+    pre_roll.write(ramp(3, 3))
+    ring = AudioRingBuffer(8)
+    pre_roll.drain_into(ring)
+    assert np.concatenate(ring.read_views()).tolist() == ramp(2, 4).tolist()
+    assert pre_roll.count == 0
+
+
+def tone(freq, rate, seconds=1.0):
+    """Sine tone at half scale."""
+    return (0.5 * np.sin(2 * np.pi * freq * np.arange(int(rate * seconds)) / rate)).astype(np.float32)
+
+
+def rms(audio):
+    """Root mean square level."""
+    return float(np.sqrt(np.mean(np.square(audio, dtype=np.float64))))
+
+
+def test_resampler_blocks_match_one_pass():
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, 44100).astype(np.float32)
+    expected = PolyphaseResampler(44100, 16000).process(audio)
+
+    resampler = PolyphaseResampler(44100, 16000)
+    blocks = [resampler.process(audio[offset:offset + 1023]) for offset in range(0, len(audio), 1023)]
+    assert np.allclose(np.concatenate(blocks), expected, atol=1e-6)
+    assert abs(len(expected) - 16000) <= 1
+
+
+def test_resampler_rejects_aliases():
+    resampler = PolyphaseResampler(48000, 16000)
+    passed = resampler.process(tone(1000, 48000))
+    resampler.reset()
+    # 12 kHz can't be represented at 16 kHz and would fold back to 4 kHz
+    aliased = resampler.process(tone(12000, 48000))
+    assert rms(passed[1000:]) == pytest.approx(rms(tone(1000, 16000)), rel=0.02)
+    assert rms(aliased[1000:]) < 1e-3 * rms(passed[1000:])
+
+
+def test_high_pass_removes_dc():
+    audio = tone(1000, 16000) + 0.3
+    expected = HighPassFilter(16000, 80.0).process(audio)
+
+    highpass = HighPassFilter(16000, 80.0)
+    blocks = [highpass.process(audio[offset:offset + 700]) for offset in range(0, len(audio), 700)]
+    assert np.allclose(np.concatenate(blocks), expected, atol=1e-6)
+
+    settled = expected[len(expected) // 2:]
+    assert abs(float(np.mean(settled))) < 1e-3
+    assert rms(settled) == pytest.approx(rms(tone(1000, 16000)), rel=0.02)
+
+
+FRAME = 480  # 30 ms VAD frames at 16 kHz
+
+
+def noise(frames, level=0.001, seed=0):
+    """White noise lasting the given number of VAD frames."""
+    return (level * np.random.default_rng(seed).standard_normal(frames * FRAME)).astype(np.float32)
+
+
+def run_vad(vad, audio, block=1000):
+    """Feed audio in blocks that don't line up with frames; return the events."""
+    events = []
+    vad.on_speech = lambda audio: events.append(audio.copy())
+    vad.on_utterance_end = lambda: events.append(None)
+    for offset in range(0, len(audio), block):
+        vad.process(audio[offset:offset + block])
+    return events
+
+
+def test_vad_pads_onset_and_ends_after_silence():
+    vad = VoiceActivityDetector(get_default_config())
+    speech = tone(300, 16000, 20 * FRAME / 16000) * 0.6
+    events = run_vad(vad, np.concatenate((noise(30), speech, noise(40, seed=1))))
+
+    assert events[-1] is None and sum(event is None for event in events) == 1
+    utterance = np.concatenate(events[:-1])
+    # Onset after 3 speech frames (min_speech_ms), with 200 ms of padding up to it
+    assert np.abs(utterance[:3 * FRAME]).max() < 0.01
+    assert np.allclose(utterance[3 * FRAME:23 * FRAME], speech)
+    # The utterance closes on the 23rd trailing non-speech frame (silence_ms)
+    assert len(utterance) == (6 + 17 + 23) * FRAME
+    assert vad.utterances == 1 and not vad.in_utterance
+
+
+def test_vad_ignores_short_blips():
+    vad = VoiceActivityDetector(get_default_config())
+    blip = tone(300, 16000, 2 * FRAME / 16000) * 0.6  # Shorter than min_speech_ms
+    events = run_vad(vad, np.concatenate((noise(30), blip, noise(30, seed=1))))
+    vad.flush()
+    assert events == []
+    assert vad.utterances == 0
+    assert vad.get_stats()["skipped_ratio"] > 0.9
+
+
+def write_wav(path, samples, rate, channels=1):
+    """Write int16 samples, interleaved for several channels, as a PCM WAV file."""
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.asarray(samples, dtype="<i2").tobytes())
+
+
+def replay(source, block_size, has_room=None):
+    """Run a threaded source to the end and return the blocks it delivered."""
+    blocks = []
+    source.open(lambda indata, frames, time_info, status: blocks.append(indata.copy()), block_size, has_room)
+    assert source.wait_finished(timeout=5.0)
+    source.close()
+    return blocks
+
+
+def test_wav_source_replays_in_real_time(tmp_path):
+    path = tmp_path / "speech.wav"
+    write_wav(path, np.arange(800) * 16, 4000)  # 0.2 s
+    start_time = time.monotonic()
+    blocks = replay(WavFileSource(path, realtime=True), 200)
+    # The last block is due 0.15 s after the first
+    assert time.monotonic() - start_time >= 0.14
+    assert [len(block) for block in blocks] == [200] * 4
+    assert np.concatenate(blocks)[:, 0].tolist() == (np.arange(800) * 16 / 32768).astype(np.float32).tolist()
+
+
+def test_wav_source_fast_replay_waits_for_room(tmp_path):
+    path = tmp_path / "stereo.wav"
+    write_wav(path, [1000, -1000] * 1000, 48000, channels=2)
+    checks = []
+
+    def has_room(frames):
+        checks.append(frames)
+        return len(checks) % 3 == 0  # The consumer is behind twice per block
+
+    start_time = time.monotonic()
+    blocks = replay(WavFileSource(path, realtime=False), 256, has_room)
+    assert time.monotonic() - start_time < 1.0
+    assert sum(len(block) for block in blocks) == 1000
+    assert len(checks) == 3 * len(blocks)
+    assert blocks[0].shape == (256, 2) and blocks[0][0].tolist() == [1000 / 32768, -1000 / 32768]
+
+
+def test_read_wav(tmp_path):
+    path = tmp_path / "speech.wav"
+    write_wav(path, [0, 16384, -32768], 16000)
+    samples, rate = read_wav(path)
+    assert rate == 16000
+    assert samples[:, 0].tolist() == [0.0, 0.5, -1.0]
+
+
+class TrickleStream:
+    """Pipe that returns at most `step` bytes per read, like a slow writer."""
+
+    def __init__(self, data, step):
+        self.data = data
+        self.step = step
+
+    def read(self, size):
+        chunk, self.data = self.data[:min(size, self.step)], self.data[min(size, self.step):]
+        return chunk
+
+
+def test_stdin_source_joins_frames_split_across_reads():
+    pcm = np.array([[0, 16384], [-16384, 32767], [-32768, 8192]], dtype="<i2").tobytes()
+    source = StdinSource(16000, 2, "s16le")
+    assert not source.realtime
+    # Three-byte reads split samples and frames; the trailing byte is an incomplete frame
+    source.stream = TrickleStream(pcm + b"\x01", 3)
+    blocks = replay(source, 2)
+    audio = np.concatenate(blocks)
+    assert audio.shape == (3, 2)
+    assert audio.tolist() == [[0.0, 0.5], [-0.5, 32767 / 32768], [-1.0, 0.25]]
+
+
+def test_audio_source_from_config(tmp_path, monkeypatch):
+    # Live capture needs PortAudio; only check that it is the one selected
+    monkeypatch.setattr(sources, "PortAudioSource", lambda *args, **kwargs: ("portaudio", args))
+    config = get_default_config()
+    assert create_audio_source(config)[0] == "portaudio"
+    config["audio"]["source"] = {"type": "no-such-source"}
+    assert create_audio_source(config)[0] == "portaudio"
+
+    path = tmp_path / "speech.wav"
+    write_wav(path, np.zeros(160), 16000)
+    config["audio"]["source"] = {"type": "file", "path": str(path), "realtime": False}
+    source = create_audio_source(config)
+    assert isinstance(source, WavFileSource) and not source.realtime and source.sample_rate == 16000
+
+    config["audio"]["source"] = {"type": "stdin", "sample_rate": 8000, "channels": 2, "format": "f32le"}
+    source = create_audio_source(config)
+    assert isinstance(source, StdinSource) and not source.realtime
+    assert (source.sample_rate, source.channels, source.dtype) == (8000, 2, np.dtype("<f4"))
+
+    # The default pacing: files replay in real time, stdin as fast as the writer delivers
+    config = get_default_config()
+    config["audio"]["source"].update(type="file", path=str(path))
+    assert create_audio_source(config).realtime
+    config["audio"]["source"]["type"] = "stdin"
+    assert not create_audio_source(config).realtime
@@ -0,0 +1,1005 @@
+"""Tests for the speech recognition package."""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import Connection
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from k_on_k.audio_capture.ring_buffer import AudioRingBuffer
+from k_on_k.config.settings import get_default_config
+from k_on_k.speech_recognition import service as service_module
+from k_on_k.speech_recognition.batch import _write_ready, read_records, split_utterances
+from k_on_k.speech_recognition.commands import EVENT_COMMAND, EVENT_TEXT, CommandMatch, CommandMatcher
+from k_on_k.speech_recognition.model_server import OP_PROCESS, ModelServer, ModelServerClient, _Request
+from k_on_k.speech_recognition.model_store import BACKEND_CTRANSLATE2, BACKEND_WHISPER, ModelStore
+from k_on_k.speech_recognition.scheduler import (
+    InferenceScheduler,
+    LEVEL_DROP_SILENCE,
+    LEVEL_FALLBACK_MODEL,
+    LEVEL_FAST_DECODE,
+    LEVEL_NORMAL,
+)
+from k_on_k.speech_recognition.service import RESULT_END, RESULT_FINAL, SpeechRecognitionService
+from k_on_k.speech_recognition.streaming import SAMPLE_RATE, HypothesisBuffer, StreamingTranscriber, Word
+from k_on_k.speech_recognition.fast_path import PunctuationFastPath
+from k_on_k.speech_recognition.tuner import apply_setup, choose, current_setup, word_error_rate
+from k_on_k.speech_recognition.wake_word import WakeWordSpotter, extract_template, keyword_slug, save_template
+from k_on_k.speech_recognition.worker import InferenceWorkerClient
+from k_on_k.text_insertion.service import TextInsertionService
+from tests.test_text_insertion import FakeBackend
+
+# The stand-in engine hears one word per half second; the word is encoded in the amplitude
+WORD_SAMPLES = SAMPLE_RATE // 2
+
+
+class FakeEngine:
+    """Stand-in for a Whisper engine that decodes synthetic audio without a model."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe_words(self, audio, prompt=None):
+        self.calls += 1
+        words = []
+        for i in range(len(audio) // WORD_SAMPLES):
+            level = float(audio[i * WORD_SAMPLES])
+            if level > 0:
+                words.append(Word(i * 0.5, (i + 1) * 0.5, f" word{round(level * 100)}"))
+        return words
+
+
+def speech(*word_ids):
+    """Synthesize audio that FakeEngine decodes as the given words."""
+    return np.repeat(np.asarray(word_ids, dtype=np.float32) / 100, WORD_SAMPLES)
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = get_default_config()
+    config["speech_recognition"]["server"]["socket_path"] = str(tmp_path / "stt.sock")
+    return config
+
+
+@pytest.fixture
+def server(config):
+    server = ModelServer(config, engine=FakeEngine())
+    server.start()
+    yield server
+    server.stop()
+
+
+def connect(config):
+    client = ModelServerClient(config)
+    client.connect()
+    return client
+
+
+def test_hypothesis_buffer_commits_agreed_prefix():
+    buffer = HypothesisBuffer(agreement=2)
+    buffer.insert([Word(0.0, 0.5, " hello"), Word(0.5, 1.0, " word")])
+    assert buffer.flush() == []  # A single hypothesis never commits
+
+    buffer.insert([Word(0.0, 0.5, " Hello,"), Word(0.5, 1.0, " world")])
+    assert buffer.flush() == [Word(0.0, 0.5, " Hello,")]  # Case and punctuation don't matter
+    assert buffer.pending() == [Word(0.5, 1.0, " world")]
+
+    # The model repeating the committed word at the start of the window is stripped
+    buffer.insert([Word(0.45, 0.6, " hello"), Word(0.6, 1.0, " world")])
+    assert buffer.flush() == [Word(0.6, 1.0, " world")]
+    assert buffer.last_committed_end == 1.0
+
+    buffer.insert([Word(1.0, 1.5, " again")])
+    assert buffer.commit_pending() == [Word(1.0, 1.5, " again")]
+    assert buffer.pending() == []
+
+
+def test_streaming_window_is_trimmed_at_commits(config):
+    config["speech_recognition"]["streaming"]["prompt_chars"] = 10
+    streamer = StreamingTranscriber(FakeEngine().transcribe_words, config)
+    assert streamer.process_audio(speech(1, 2)) is None
+    assert streamer.process_audio(speech(3)) == "word1 word2"
+
+    # Only the audio after the last committed word stays in the window
+    assert streamer.window_len == WORD_SAMPLES and streamer.window_start == 1.0
+    assert streamer.finish() == "word3"
+    assert streamer.window_len == 0 and streamer.window_start == 1.5
+    assert streamer.committed_text == "word3"  # Just the prompt, from a word boundary
+    streamer.prompt_chars = 11
+    assert streamer._prompt_tail("word1 word2 word3") == "word2 word3"
+
+
+def test_streaming_window_drops_audio_without_words(config):
+    config["speech_recognition"]["streaming"]["window_s"] = 2.0
+    streamer = StreamingTranscriber(FakeEngine().transcribe_words, config)
+    streamer.insert_audio(np.zeros(int(2.5 * SAMPLE_RATE), dtype=np.float32))
+    assert streamer.window_len == len(streamer.window)
+    assert streamer.window_start == 0.5
+
+
+
+def test_dropped_utterance_keeps_the_committed_context(config):
+    streamer = StreamingTranscriber(FakeEngine().transcribe_words, config)
+    streamer.process_audio(speech(1))
+    assert streamer.finish() == "word1"
+    streamer.process_audio(speech(2, 3))
+    assert streamer.pending_text() == "word2 word3"
+
+    streamer.drop_utterance()
+    assert streamer.window_len == 0 and streamer.pending_text() == ""
+    assert streamer.committed_text == "word1"
+    assert streamer.process_iter() is None
+
+def test_server_warms_up_the_model(server):
+    assert server.engine.calls == 1
+
+
+def test_socket_is_private(server):
+    assert server.socket_path.stat().st_mode & 0o777 == 0o600
+
+
+def test_client_streams_and_flushes(server, config):
+    client = connect(config)
+
+    client.insert_audio(speech(1, 2, 3))
+    client.process_iter()  # First hypothesis; nothing agreed on yet
+    client.insert_audio(speech(4))
+    assert client.process_iter() == "word1 word2 word3"
+    assert client.flush() == "word4"
+    client.stop()
+
+
+def test_sessions_are_independent(server, config):
+    first = connect(config)
+    second = connect(config)
+
+    first.insert_audio(speech(1, 2))
+    second.insert_audio(speech(7, 8))
+    assert first.flush() == "word1 word2"
+    assert second.flush() == "word7 word8"
+    first.stop()
+    second.stop()
+
+
+def test_reset_drops_pending_audio(server, config):
+    client = connect(config)
+
+    client.insert_audio(speech(1, 2))
+    client.process_iter()
+    client.reset()
+    client.insert_audio(speech(5))
+    assert client.flush() == "word5"
+    client.stop()
+
+
+class FakeBatchEngine(FakeEngine):
+    """FakeEngine that also decodes several windows in one call."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+        self.batch_prompts = []
+        self.fail = False
+
+    def transcribe_batch(self, windows):
+        if self.fail:
+            raise RuntimeError("out of memory")
+        self.batch_sizes.append(len(windows))
+        self.batch_prompts.append([prompt for _, prompt in windows])
+        return [FakeEngine.transcribe_words(self, audio, prompt) for audio, prompt in windows]
+
+
+def dictate_together(clients, audio):
+    """Flush `audio[index]` through every client at once; returns the texts by client index."""
+    results = {}
+
+    def dictate(index, client):
+        client.insert_audio(audio[index])
+        results[index] = client.flush()
+
+    threads = [threading.Thread(target=dictate, args=item) for item in enumerate(clients)]
+    # Connections register on their handler threads; a pass only waits for registered ones
+    for client in clients:
+        assert client.is_available()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5.0)
+    return results
+
+
+def test_server_batches_concurrent_sessions(config):
+    config["speech_recognition"]["server"]["batch_wait_ms"] = 500.0
+    server = ModelServer(config, engine=FakeBatchEngine())
+    server.start()
+    clients = [connect(config) for _ in range(3)]
+    try:
+        results = dictate_together(clients, [speech(index + 1, index + 4) for index in range(3)])
+    finally:
+        for client in clients:
+            client.stop()
+        server.stop()
+
+    assert results == {0: "word1 word4", 1: "word2 word5", 2: "word3 word6"}
+    assert server.engine.batch_sizes == [3]
+    assert (server.decoded_windows, server.decodes) == (3, 1)
+    assert server.slo_misses == 0
+
+
+def test_server_batches_sessions_with_different_committed_text(config):
+    config["speech_recognition"]["server"]["batch_wait_ms"] = 500.0
+    server = ModelServer(config, engine=FakeBatchEngine())
+    server.start()
+    clients = [connect(config) for _ in range(2)]
+    try:
+        dictate_together(clients, [speech(1), speech(2)])
+        # Each session now prompts with its own committed text
+        results = dictate_together(clients, [speech(3), speech(4)])
+    finally:
+        for client in clients:
+            client.stop()
+        server.stop()
+
+    assert results == {0: "word3", 1: "word4"}
+    assert server.engine.batch_sizes == [2, 2]
+    assert sorted(server.engine.batch_prompts[1]) == ["word1", "word2"]
+    assert (server.decoded_windows, server.decodes) == (4, 2)
+
+
+def test_server_counts_the_decodes_of_a_failed_batch(config):
+    config["speech_recognition"]["server"]["batch_wait_ms"] = 500.0
+    server = ModelServer(config, engine=FakeBatchEngine())
+    server.engine.fail = True
+    server.start()
+    clients = [connect(config) for _ in range(2)]
+    try:
+        results = dictate_together(clients, [speech(1), speech(2)])
+    finally:
+        for client in clients:
+            client.stop()
+        server.stop()
+
+    assert results == {0: "word1", 1: "word2"}
+    # Every session decoded its own window after the batch failed
+    assert (server.decoded_windows, server.decodes) == (2, 2)
+
+
+def test_batches_shrink_near_the_latency_slo(config):
+    config["speech_recognition"]["server"].update(batch_wait_ms=500.0, latency_slo_ms=500.0)
+    server = ModelServer(config, engine=FakeBatchEngine())
+    server.window_decode_s = 0.1
+    server.connections = set(range(4))
+
+    def fill(age, queued=3):
+        """Fill a batch whose request is `age` seconds old, with `queued` other sessions waiting."""
+        batch = [_Request(object(), OP_PROCESS, speech(1))]
+        batch[0].queued_at -= age
+        for _ in range(queued):
+            server.requests.put(_Request(object(), OP_PROCESS, speech(1)))
+        server._fill_batch(batch)
+        while not server.requests.empty():
+            server.requests.get()
+        server.backlog.clear()
+        return batch
+
+    # The oldest request can still be answered in time with two windows, not three
+    assert len(fill(age=0.2)) == 2
+
+    # Without other requests, the wait ends early enough to decode in time
+    start_time = time.perf_counter()
+    assert len(fill(age=0.2, queued=0)) == 1
+    assert time.perf_counter() - start_time < 0.25
+
+    # A request that is late anyway doesn't keep the others from batching
+    assert len(fill(age=1.0)) == 4
+
+
+class FakeWhisperModel:
+    """Stand-in for faster-whisper's WhisperModel that records its batched calls."""
+
+    max_length = 448
+
+    def __init__(self):
+        self.feature_extractor = lambda audio: np.zeros((80, len(audio) // 160 + 1), dtype=np.float32)
+        self.feature_extractor.chunk_length = 30
+        self.encoded = []
+        self.prompts = []
+        self.model = SimpleNamespace(generate=self.generate, is_multilingual=False)
+
+    def encode(self, features):
+        self.encoded.append(features.shape)
+        return "encoder output"
+
+    def get_prompt(self, tokenizer, previous_tokens, without_timestamps=False):
+        return [tokenizer.sot_prev] + previous_tokens + [tokenizer.sot] if previous_tokens else [tokenizer.sot]
+
+    def generate(self, encoder_output, prompts, **kwargs):
+        self.prompts.append(prompts)
+        # Each item "hears" the last word of its prompt again
+        return [SimpleNamespace(sequences_ids=[prompt[-2:-1] or [0]]) for prompt in prompts]
+
+    def add_word_timestamps(self, segments, tokenizer, encoder_output, num_frames, *args):
+        for segment, frames in zip(segments, num_frames):
+            segment[0]["words"] = [
+                {"word": f" word{token}", "start": 0.0, "end": frames / 100} for token in segment[0]["tokens"]
+            ]
+
+
+@pytest.fixture
+def batch_service():
+    """FasterWhisperService over FakeWhisperModel, with a tokenizer of word numbers."""
+    faster_whisper_service = pytest.importorskip("k_on_k.speech_recognition.faster_whisper_service")
+    service = faster_whisper_service.FasterWhisperService.__new__(faster_whisper_service.FasterWhisperService)
+    service.model, service.fast_decode, service.beam_size, service.decoder_calls = FakeWhisperModel(), False, 1, 0
+    service.tokenizer = SimpleNamespace(
+        encode=lambda text: [int(word[4:]) for word in text.split()],
+        sot=1000, sot_prev=1001, sot_lm=1002, transcribe=1003, translate=1004, no_speech=1005, non_speech_tokens=[],
+    )
+    service.singles = []  # Prompts of windows decoded on their own
+    service.transcribe_words = lambda audio, prompt=None: service.singles.append(prompt) or []
+    return service
+
+
+def test_windows_with_different_prompts_share_one_decode(batch_service):
+    # Two sessions past their first commit, each prompting with its own committed text
+    windows = [(speech(3, 4), "word1 word2"), (speech(5), "word7"), (speech(6), None)]
+
+    words = batch_service.transcribe_batch(windows)
+    assert batch_service.decoder_calls == 1
+    assert batch_service.model.encoded == [(3, 80, 3000)]  # Every window padded to 30 s
+    assert batch_service.model.prompts == [[[1001, 1, 2, 1000], [1001, 7, 1000], [1000]]]
+    # Words come back per window, timed within it
+    assert words == [[Word(0.0, 1.0, " word2")], [Word(0.0, 0.5, " word7")], [Word(0.0, 0.5, " word0")]]
+
+
+def test_windows_longer_than_a_batch_item_decode_alone(batch_service):
+    long_window = np.zeros(31 * SAMPLE_RATE, dtype=np.float32)
+    batch_service.transcribe_batch([(long_window, "word1"), (speech(2), "word2"), (speech(3), "word3")])
+    assert batch_service.singles == ["word1"]
+    assert batch_service.decoder_calls == 1 and batch_service.model.encoded == [(2, 80, 3000)]
+
+
+def test_client_reconnects_after_server_restart(config):
+    server = ModelServer(config, engine=FakeEngine())
+    server.start()
+    client = connect(config)
+    assert client.is_available()
+
+    server.stop()
+    server = ModelServer(config, engine=FakeEngine())
+    server.start()
+    try:
+        client.insert_audio(speech(3))
+        assert client.flush() == "word3"
+    finally:
+        client.stop()
+        server.stop()
+
+
+def test_client_without_server(config):
+    client = ModelServerClient(config)
+    assert not client.is_available()
+    client.insert_audio(speech(1))
+    assert client.flush() is None
+
+
+def test_stale_socket_is_replaced(config, tmp_path):
+    (tmp_path / "stt.sock").write_bytes(b"")
+    server = ModelServer(config, engine=FakeEngine())
+    server.start()
+    try:
+        assert connect(config).is_available()
+    finally:
+        server.stop()
+
+
+def test_second_server_refuses_to_start(server, config):
+    with pytest.raises(RuntimeError):
+        ModelServer(config, engine=FakeEngine()).start()
+
+
+def test_model_store_prefetches_and_verifies(tmp_path):
+    source = tmp_path / "whisper-tiny-ct2"
+    source.mkdir()
+    for name in ("model.bin", "config.json", "tokenizer.json"):
+        (source / name).write_bytes(name.encode() * 100)
+    checkpoint = tmp_path / "tiny.pt"
+    checkpoint.write_bytes(b"weights")
+
+    store = ModelStore(tmp_path / "models")
+    store.prefetch("openai/whisper-tiny", source)
+    store.prefetch("tiny", checkpoint)
+    model_dir = store.resolve("openai/whisper-tiny", BACKEND_CTRANSLATE2)
+    assert (model_dir / "model.bin").read_bytes() == (source / "model.bin").read_bytes()
+    assert store.resolve("tiny", BACKEND_WHISPER).read_bytes() == b"weights"
+    assert store.resolve("tiny", BACKEND_CTRANSLATE2) is None
+    assert store.verify() == {"ctranslate2/openai/whisper-tiny": [], "openai-whisper/tiny": []}
+
+    # Corruption of the same size is only caught by the checksums
+    (model_dir / "config.json").write_bytes(b"x" * 1100)
+    assert store.resolve("openai/whisper-tiny", BACKEND_CTRANSLATE2) == model_dir
+    assert store.verify("openai/whisper-tiny") == {
+        "ctranslate2/openai/whisper-tiny": ["config.json has the wrong checksum"],
+    }
+    (model_dir / "model.bin").unlink()
+    assert store.resolve("openai/whisper-tiny", BACKEND_CTRANSLATE2) is None
+
+
+def test_model_store_rejects_incomplete_models(tmp_path):
+    source = tmp_path / "converted"
+    source.mkdir()
+    (source / "model.bin").write_bytes(b"weights")
+    store = ModelStore(tmp_path / "models")
+    with pytest.raises(ValueError):
+        store.prefetch("partial", source)
+    with pytest.raises(ValueError):
+        store.prefetch("missing", tmp_path / "missing.pt", BACKEND_WHISPER)
+    assert store.entries() == []
+
+
+def test_model_store_rejects_names_outside_the_store(tmp_path):
+    checkpoint = tmp_path / "tiny.pt"
+    checkpoint.write_bytes(b"weights")
+    store = ModelStore(tmp_path / "models")
+    store.prefetch("tiny", checkpoint)
+    for name in ("..", ".", "", "/etc", "../../home", "tiny/../.."):
+        with pytest.raises(ValueError):
+            store.prefetch(name, checkpoint)
+    # Nothing stored was touched
+    assert store.verify() == {f"{BACKEND_WHISPER}/tiny": []}
+
+
+def test_scheduler_coalesces_audio(config):
+    scheduler = InferenceScheduler(config)
+    scheduler.add_audio(SAMPLE_RATE // 10, capture_time=0.0)
+    assert not scheduler.should_run()
+    scheduler.add_audio(SAMPLE_RATE, capture_time=0.1)
+    assert scheduler.should_run()
+
+
+def test_scheduler_waits_longer_for_slow_passes(config):
+    scheduler = InferenceScheduler(config)
+    for _ in range(10):
+        scheduler.add_audio(SAMPLE_RATE, capture_time=0.0)
+        scheduler.record_pass(1.5, now=1.0)
+    assert scheduler.interval_s == pytest.approx(scheduler.max_interval_s)
+
+
+def test_scheduler_backpressure_rises_and_recovers(config):
+    scheduler = InferenceScheduler(config)
+    now = 0.0
+    for _ in range(4):
+        scheduler.add_audio(SAMPLE_RATE, capture_time=now)
+        now += 5.0
+        scheduler.record_pass(2.0, now)
+    assert scheduler.level == LEVEL_FAST_DECODE  # No fallback model configured
+
+    for expected in (LEVEL_DROP_SILENCE, LEVEL_NORMAL):
+        scheduler.add_audio(SAMPLE_RATE, capture_time=now)
+        now += 0.2
+        scheduler.record_pass(0.1, now)
+        assert scheduler.level == expected
+
+
+def test_command_matcher_spans_fragments(config):
+    matcher = CommandMatcher(config)
+    assert matcher.feed("Let's write K.O.K.,") == [(EVENT_TEXT, "Let's write")]  # Held back
+    assert matcher.feed("stop. Thanks") == [
+        (EVENT_COMMAND, CommandMatch("k.o.k. stop", 2, 4)),
+        (EVENT_TEXT, "Thanks"),
+    ]
+
+
+def test_command_matcher_releases_failed_matches(config):
+    matcher = CommandMatcher(config)
+    assert matcher.feed("K. O. K. is") == [(EVENT_TEXT, "K. O. K. is")]
+    assert matcher.feed("kay oh kay") == []
+    assert matcher.flush() == [(EVENT_TEXT, "kay oh kay")]
+    assert matcher.feed("Kok pause") == [(EVENT_COMMAND, CommandMatch("k.o.k. pause", 7, 9))]
+
+
+def _tone_word(freqs, rate=1.0):
+    """Synthetic 'word': a sequence of harmonic tones, spoken at `rate` times normal speed."""
+    segments = []
+    for freq in freqs:
+        t = np.arange(int(0.15 * SAMPLE_RATE / rate)) / SAMPLE_RATE
+        segments.append(0.2 * sum(np.sin(2 * np.pi * freq * h * t) / h for h in (1, 2, 3)))
+    return np.concatenate(segments).astype(np.float32)
+
+
+def test_wake_word_spotter_matches_template(config):
+    rng = np.random.default_rng(0)
+
+    def noise(seconds):
+        return (0.003 * rng.standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+
+    wake = [300, 500, 800, 400, 650]
+
+    spotter = WakeWordSpotter(config)
+    spotter.set_templates([extract_template(np.concatenate([noise(0.3), _tone_word(wake), noise(0.3)]))])
+    other = np.concatenate([noise(1.0), _tone_word([700, 350, 450, 900, 300]), noise(1.0), _tone_word(wake[:3])])
+    assert not spotter.process(np.concatenate([other, noise(1.0)]))
+    assert spotter.process(np.concatenate([_tone_word(wake, rate=1.15), noise(0.5)]))
+    assert spotter.detections == 1
+
+
+def test_fast_path_classifies_short_commands(config, tmp_path):
+    config["speech_recognition"]["punctuation_fast_path"] = {"templates_dir": str(tmp_path)}
+    takes = {"comma": [300, 500, 800, 400], "new line": [700, 350, 900, 450]}
+    for spoken, freqs in takes.items():
+        save_template(tmp_path / keyword_slug(spoken), extract_template(_tone_word(freqs)))
+    fast_path = PunctuationFastPath(config)
+
+    fast_path.add_audio(_tone_word(takes["new line"], rate=0.9))
+    assert fast_path.classify() == "new line"
+    fast_path.add_audio(_tone_word([250, 600, 300, 850]))
+    assert fast_path.classify() is None  # Not a command: left to the model
+    fast_path.add_audio(np.concatenate([_tone_word(takes["comma"])] * 2))
+    assert fast_path.classify() is None  # Too long for the fast path
+
+
+def test_tuner_picks_fastest_accurate_setup(config):
+    assert word_error_rate("Hello, world.", "hello world") == 0.0
+    assert word_error_rate("one two three four", "one too three") == 0.5
+
+    def result(rtf, p95_ms, wer):
+        return {"rtf": rtf, "p95_ms": p95_ms, "memory_mb": 100.0, "wer": wer}
+
+    fast_but_wrong, slow, good = result(0.1, 50, 0.3), result(0.4, 400, 0.0), result(0.3, 200, 0.05)
+    assert choose([fast_but_wrong, slow, good, {"error": "no model"}], target_rtf=0.5, max_wer=0.1) is good
+    # Nothing keeps up: the least behind wins
+    assert choose([result(2.0, 900, 0.0), result(1.5, 950, 0.0)], 0.5, 0.1)["rtf"] == 1.5
+
+    setup = {"engine": "faster-whisper", "compute_type": "int8", "beam_size": 1, "threads": 4}
+    apply_setup(config, setup)
+    assert current_setup(config) == setup
+    config["speech_recognition"]["faster_whisper"]["compute_type"] = "float32"
+    apply_setup(config, {"engine": "whisper", "compute_type": None, "beam_size": 1, "threads": 2})
+    assert config["speech_recognition"]["whisper"]["beam_size"] is None  # greedy
+    assert config["speech_recognition"]["faster_whisper"]["compute_type"] == "float32"
+
+
+def test_batch_splits_recordings_and_resumes(config, tmp_path):
+    rng = np.random.default_rng(0)
+
+    def noise(seconds):
+        return (0.003 * rng.standard_normal(int(seconds * 48000))).astype(np.float32)
+
+    def tone(seconds):
+        t = np.arange(int(seconds * 48000)) / 48000
+        return (0.2 * np.sin(2 * np.pi * 300 * t)).astype(np.float32)
+
+    # Stereo at 48 kHz goes through the front end to 16 kHz mono, as captured audio would
+    recording = np.concatenate([noise(1.0), tone(1.0), noise(1.5), tone(0.5), noise(1.5)])
+    utterances = split_utterances(config, np.stack([recording, recording], axis=1), 48000)
+    assert len(utterances) == 2
+    (start1, end1, audio1), (start2, _, _) = utterances
+    assert 0.7 < start1 < 1.0 and 3.2 < start2 < 3.5 and end1 < start2
+    assert len(audio1) == round((end1 - start1) * SAMPLE_RATE)
+
+    output = tmp_path / "out.jsonl"
+    output.write_text(
+        '{"file": "a.wav", "start": 0.9, "end": 2.0, "text": "Hello."}\n{"file": "a.wav", "start": 2.5, "en'
+    )
+    # The record cut off by the interrupted run is dropped, so it is decoded again
+    assert read_records(str(output)) == {("a.wav", 0.9): "Hello."}
+    assert output.read_text().endswith("Hello.\"}\n")
+    assert read_records(str(tmp_path / "missing.jsonl")) == {}
+
+
+def test_batch_keeps_writing_after_a_failed_utterance(capsys):
+    written = []
+
+    class Writer:
+        def write(self, file, start, end, text, recorded=False):
+            written.append((file, start, text))
+
+    futures = [Future(), Future()]
+    futures[0].set_exception(RuntimeError("decoder crashed"))
+    futures[1].set_result("World.")
+    window = deque([("a.wav", 0.5, 1.0, futures[0]), ("a.wav", 2.0, 3.0, futures[1]), ("b.wav", 0.0, 1.0, "Hi.")])
+
+    assert _write_ready(window, Writer(), 0) == 1
+    assert not window
+    assert written == [("a.wav", 2.0, "World."), ("b.wav", 0.0, "Hi.")]
+    assert "a.wav at 0.50s: decoder crashed" in capsys.readouterr().err
+
+
+class FakeStreamingEngine(FakeEngine):
+    """FakeEngine behind the streaming interface of the in-process engines."""
+
+    def __init__(self, config):
+        super().__init__()
+        self.streamer = StreamingTranscriber(self.transcribe_words, config)
+
+    def insert_audio(self, audio_data):
+        self.streamer.insert_audio(audio_data)
+
+    def process_iter(self):
+        return self.streamer.process_iter()
+
+    def flush(self):
+        return self.streamer.finish()
+
+    def reset(self):
+        self.streamer.reset()
+
+    def drop_utterance(self):
+        self.streamer.drop_utterance()
+
+    def set_fast_decode(self, enabled):
+        pass
+
+    def is_available(self):
+        return True
+
+
+def test_service_transcribes_on_the_event_loop(config, monkeypatch):
+    monkeypatch.setattr(service_module, "create_engine", lambda config: FakeStreamingEngine(config))
+    ring = AudioRingBuffer(SAMPLE_RATE * 10)
+    transcripts = []
+
+    async def dictate():
+        service = SpeechRecognitionService(config)
+        service.attach_ring_buffer(ring)
+        service.on_transcription = transcripts.append
+        service.start()
+        service.start_listening()
+        ring.write(speech(1, 2))
+        service.notify_audio(time.perf_counter())
+        await asyncio.sleep(0.2)
+        ring.write(speech(3))
+        service.notify_audio(time.perf_counter())
+        service.stop_listening()
+        # The stop is answered once the recognizer has flushed the session
+        assert await service.wait_until_flushed(5.0)
+        service.stop()
+        await service.wait_stopped()
+
+    asyncio.run(dictate())
+    assert " ".join(transcripts) == "word1 word2 word3"
+    assert ring.available() == 0
+
+
+def test_idle_model_is_unloaded_and_reloaded(config, monkeypatch):
+    engines = []
+
+    def create_engine(config):
+        engines.append(FakeStreamingEngine(config))
+        return engines[-1]
+
+    monkeypatch.setattr(service_module, "create_engine", create_engine)
+    config["speech_recognition"]["idle_unload"] = {"enabled": True, "timeout_s": 0.05}
+    ring = AudioRingBuffer(SAMPLE_RATE * 10)
+    transcripts = []
+
+    async def dictate():
+        service = SpeechRecognitionService(config)
+        service.attach_ring_buffer(ring)
+        service.on_transcription = transcripts.append
+        service.start()
+        await asyncio.sleep(0.3)
+        assert service.unloaded and service.active_model is None
+
+        # Audio captured while the model reloads waits in the ring buffer
+        service.start_listening()
+        ring.write(speech(11, 12, 13))
+        service.notify_audio(time.perf_counter())
+        service.stop_listening()
+        assert await service.wait_until_flushed(5.0)
+        service.stop()
+        await service.wait_stopped()
+
+    asyncio.run(dictate())
+    assert len(engines) == 2
+    assert engines[0].calls == 1  # Warm-up only
+    assert " ".join(transcripts).split() == ["word11", "word12", "word13"]
+
+
+def test_failed_reload_drops_the_dictation(config, monkeypatch):
+    engines = []
+
+    def create_engine(config):
+        if engines:
+            raise RuntimeError("out of memory")
+        engines.append(FakeStreamingEngine(config))
+        return engines[-1]
+
+    monkeypatch.setattr(service_module, "create_engine", create_engine)
+    config["speech_recognition"]["idle_unload"] = {"enabled": True, "timeout_s": 0.05}
+    ring = AudioRingBuffer(SAMPLE_RATE * 10)
+
+    async def dictate():
+        service = SpeechRecognitionService(config)
+        service.attach_ring_buffer(ring)
+        service.start()
+        await asyncio.sleep(0.3)
+        assert service.unloaded
+
+        service.start_listening()
+        ring.write(speech(11))
+        service.notify_audio(time.perf_counter())
+        service.stop_listening()
+        # The stop is answered although nothing could transcribe the audio
+        assert await service.wait_until_flushed(5.0)
+        assert not service.requests and ring.available() == 0
+        assert service.unloaded and service.active_model is None
+        service.stop()
+        await service.wait_stopped()
+
+    asyncio.run(dictate())
+
+
+def test_long_utterances_are_cut_at_the_window_length(config):
+    config["speech_recognition"]["cascade"] = {"enabled": True}
+    config["speech_recognition"]["streaming"]["window_s"] = 1.0
+    service = SpeechRecognitionService(config)
+    service.active_model, service.draft_model = FakeStreamingEngine(config), FakeStreamingEngine(config)
+    service.is_running = service.draining = True
+
+    # Without a pause to end the utterance, e.g. with the VAD disabled
+    for word in (11, 12, 13):
+        service.process_audio(speech(word))
+    assert service.drain_results == [(RESULT_FINAL, "word11 word12"), (RESULT_END, None)]
+    assert service.utterance_samples == WORD_SAMPLES and len(service.utterance_audio) == 1
+
+
+def test_utterance_ends_at_the_vad_boundary(config, monkeypatch):
+    monkeypatch.setattr(service_module, "create_engine", lambda config: FakeStreamingEngine(config))
+    ring = AudioRingBuffer(SAMPLE_RATE * 10)
+    transcripts = []
+
+    async def dictate():
+        service = SpeechRecognitionService(config)
+
+        def vad(audio):
+            # Stand-in for the VAD: a silent word ends the utterance in the middle of a block
+            for offset in range(0, len(audio), WORD_SAMPLES):
+                word = audio[offset:offset + WORD_SAMPLES]
+                if word.any():
+                    service.process_audio(word)
+                else:
+                    service.end_utterance()
+
+        service.audio_filter = vad
+        service.attach_ring_buffer(ring)
+        service.on_transcription = transcripts.append
+        service.start()
+        service.start_listening()
+        # Both utterances arrive before the recognizer wakes, so one drain sees them
+        ring.write(speech(11, 12, 0, 13, 14))
+        service.notify_audio(time.perf_counter())
+        service.stop_listening()
+        assert await service.wait_until_flushed(5.0)
+        service.stop()
+        await service.wait_stopped()
+
+    asyncio.run(dictate())
+    assert transcripts == ["word11 word12", "word13 word14"]
+
+
+def test_requests_split_audio_between_sessions(config, monkeypatch):
+    monkeypatch.setattr(service_module, "create_engine", lambda config: FakeStreamingEngine(config))
+    ring = AudioRingBuffer(SAMPLE_RATE * 10)
+    transcripts = []
+
+    async def dictate():
+        service = SpeechRecognitionService(config)
+        service.attach_ring_buffer(ring)
+        service.on_transcription = transcripts.append
+        service.start()
+        # Everything is queued before the recognizer gets to it, as when it lags
+        service.start_listening()
+        ring.write(speech(11, 12))
+        service.end_utterance()
+        ring.write(speech(13))
+        service.stop_listening()
+        # A quick restart writes the new session's audio before the stop is handled
+        service.start_listening()
+        ring.write(speech(14))
+        service.notify_audio(time.perf_counter())
+        service.stop_listening()
+        assert await service.wait_until_flushed(5.0)
+        service.stop()
+        await service.wait_stopped()
+
+    asyncio.run(dictate())
+    assert transcripts == ["word11 word12", "word13", "word14"]
+
+
+class DraftEngine(FakeStreamingEngine):
+    """Smaller model that gets every word wrong."""
+
+    def transcribe_words(self, audio, prompt=None):
+        return [word._replace(text=word.text.replace("word", "ward")) for word in super().transcribe_words(audio)]
+
+
+def test_cascade_final_pass_replaces_the_draft(config, monkeypatch):
+    config["speech_recognition"]["cascade"] = {"enabled": True}
+    draft_config = service_module.engine_config(config, "base")
+    drafts = []
+
+    def create_engine(config):
+        if config != draft_config:
+            return FakeStreamingEngine(config)
+        drafts.append(DraftEngine(config))
+        return drafts[-1]
+
+    monkeypatch.setattr(service_module, "create_engine", create_engine)
+    ring = AudioRingBuffer(SAMPLE_RATE * 10)
+    text_service = TextInsertionService(get_default_config(), backend=FakeBackend())
+    events = []
+
+    async def dictate():
+        service = SpeechRecognitionService(config)
+
+        def vad(audio):
+            for offset in range(0, len(audio), WORD_SAMPLES):
+                word = audio[offset:offset + WORD_SAMPLES]
+                if word.any():
+                    service.process_audio(word)
+                else:
+                    service.end_utterance()
+
+        def on_partial(text):
+            events.append(("partial", text))
+            text_service.revise_text(text)
+
+        def on_transcription(text):
+            events.append(("final", text))
+            text_service.commit_text(text)
+
+        service.audio_filter = vad
+        service.attach_ring_buffer(ring)
+        service.on_partial, service.on_transcription = on_partial, on_transcription
+        service.start()
+        service.start_listening()
+        for audio in (speech(11, 12), speech(13, 0), speech(0, 0)):
+            await asyncio.sleep(0.2)
+            ring.write(audio)
+            service.notify_audio(time.perf_counter())
+        await asyncio.sleep(0.2)
+        service.stop_listening()
+        assert await service.wait_until_flushed(5.0)
+        service.stop()
+        await service.wait_stopped()
+
+    text_service.start()
+    try:
+        asyncio.run(dictate())
+        text_service.wait_idle()
+    finally:
+        text_service.stop()
+
+    assert events == [("partial", "ward11 ward12"), ("final", "word11 word12 word13")]
+    assert text_service.backends.fixed.screen == "Word11 word12 word13"
+    # Warm-up and the pass before the utterance ended; the finished utterance isn't drafted again
+    assert drafts[0].calls == 2 and drafts[0].streamer.window_len == 0
+
+
+def test_fallback_replaces_the_draft_model(config):
+    config["speech_recognition"]["cascade"] = {"enabled": True}
+    service = SpeechRecognitionService(config)
+    draft, final, fallback = (FakeStreamingEngine(config) for _ in range(3))
+    service.active_model, service.draft_model, service.fallback_model = final, draft, fallback
+    service.utterance_audio = [speech(11, 12)]
+    service.scheduler.level = LEVEL_FALLBACK_MODEL
+
+    # Drafts cause the lag; the final pass keeps the configured model
+    assert service._apply_backpressure() == []
+    assert service.draft_model is fallback and service.active_model is final
+    assert fallback.flush() == "word11 word12"  # The fallback caught up on the utterance
+
+    # Nothing is swapped in while the models are unloaded
+    service.draft_model, service.unloaded = draft, True
+    service._apply_backpressure()
+    assert service.draft_model is draft
+
+
+class ThreadProcess:
+    """Stand-in for a worker process that runs the worker loop on a thread."""
+
+    def __init__(self, target, args, name=None, daemon=None):
+        # The parent closes its copy of the worker's pipe end after starting it
+        conn = Connection(os.dup(args[-1].fileno()))
+        self.thread = threading.Thread(target=self._run, args=(target, args[:-1] + (conn,)), daemon=True)
+        self.exitcode = None
+        self.pid = threading.get_native_id()
+
+    def _run(self, target, args):
+        try:
+            target(*args)
+            self.exitcode = 0
+        except Exception:
+            self.exitcode = 1
+
+    def start(self):
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def terminate(self):
+        pass
+
+
+class ThreadContext:
+    """Multiprocessing context whose processes are ThreadProcess instances."""
+
+    Process = ThreadProcess
+    Pipe = staticmethod(multiprocessing.Pipe)
+
+
+class CrashingEngine(FakeStreamingEngine):
+    """Engine whose process dies on the first transcription pass."""
+
+    def process_iter(self):
+        raise RuntimeError("segmentation fault")
+
+
+@pytest.fixture
+def worker_client(config, monkeypatch):
+    """Worker client on threads; its first `crashes` workers get a crashing engine."""
+    engines = []
+
+    def create_engine(config):
+        engine_class = CrashingEngine if len(engines) < client.crashes else FakeStreamingEngine
+        engines.append(engine_class(config))
+        return engines[-1]
+
+    monkeypatch.setattr(service_module, "create_engine", create_engine)
+    config["speech_recognition"]["warmup"] = False
+    config["speech_recognition"]["worker"] = {"max_restarts": 2}
+    client = InferenceWorkerClient(config)
+    client.context = ThreadContext()
+    client.engines = engines
+    client.crashes = 0
+    yield client
+    client.stop()
+
+
+def test_worker_restarts_after_a_crash(worker_client):
+    worker_client.crashes = 1
+    worker_client.start()
+    worker_client.insert_audio(speech(1, 2))
+    assert worker_client.process_iter() is None  # The crashed worker's audio is lost
+    # The replacement starts over with an empty segment
+    assert worker_client.restarts == 1 and worker_client.ring.write_index == 0
+
+    worker_client.insert_audio(speech(3, 4))
+    assert worker_client.flush() == "word3 word4"
+    assert worker_client.restarts == 0 and len(worker_client.engines) == 2
+
+
+def test_worker_gives_up_after_max_restarts(worker_client):
+    worker_client.crashes = 10
+    worker_client.start()
+    for _ in range(3):
+        worker_client.insert_audio(speech(1))
+        assert worker_client.process_iter() is None
+    assert worker_client.failed and not worker_client.is_available()
+    assert len(worker_client.engines) == 3  # The first worker and two restarts
+
+    worker_client.insert_audio(speech(1))
+    assert worker_client.flush() is None
+    assert len(worker_client.engines) == 3
+
+
+def test_worker_reset_keeps_audio_of_the_new_session(worker_client):
+    worker_client.start()
+    worker_client.insert_audio(speech(1, 2))
+    worker_client.reset()
+    # Written before the worker gets to the reset, like a quick stop and start
+    worker_client.insert_audio(speech(3))
+    assert worker_client.flush() == "word3"
+    assert worker_client.ring.available() == 0
@@ -0,0 +1,34 @@
+"""Startup-time guards for Kitten on Keys."""
+
+import os
+
+import pytest
+
+from k_on_k.startup import ENGINE_MODULES, profile_imports, total_import_time
+
+# Importing the application must stay well below the time it takes to load a model
+STARTUP_IMPORT_BUDGET_S = 1.0
+
+
+@pytest.fixture(scope="module")
+def startup_timings(tmp_path_factory):
+    # Keep anything the import writes out of the real home directory
+    home = tmp_path_factory.mktemp("home")
+    return profile_imports("k_on_k.main", env=dict(os.environ, HOME=str(home)))
+
+
+def test_startup_does_not_import_engines(startup_timings):
+    imported = {timing.module.split(".")[0] for timing in startup_timings}
+    assert not imported & set(ENGINE_MODULES)
+
+
+def test_startup_import_budget(startup_timings):
+    assert total_import_time(startup_timings) < STARTUP_IMPORT_BUDGET_S
+
+
+def test_engine_is_imported_on_first_use():
+    import k_on_k.speech_recognition as speech_recognition
+
+    assert "FasterWhisperService" in speech_recognition.__all__
+    with pytest.raises(AttributeError):
+        speech_recognition.NoSuchEngine
@@ -0,0 +1,217 @@
+"""Tests for the text insertion service."""
+
+import threading
+import time
+
+import pytest
+
+from k_on_k.config.settings import get_default_config
+from k_on_k.text_insertion import backends
+from k_on_k.text_insertion.backends import (
+    BackendSelector,
+    BufferBackend,
+    InsertionBackend,
+    NullBackend,
+    PynputBackend,
+    UinputBackend,
+    XdotoolBackend,
+    YdotoolBackend,
+    _run_tool,
+)
+from k_on_k.text_insertion.postprocess import TextPostProcessor
+from k_on_k.text_insertion.service import TextInsertionService
+
+
+class FakeBackend(InsertionBackend):
+    """Stand-in insertion backend that keeps what is on screen."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.screen = ""
+        self.keystrokes = 0
+        self.calls = 0
+        self.gate = threading.Event()  # Cleared to hold the insertion worker
+        self.gate.set()
+        self.typing = threading.Event()
+
+    def type_text(self, text):
+        self.typing.set()
+        self.gate.wait()
+        self.screen += text
+        self.keystrokes += len(text)
+        self.calls += 1
+
+    def tap_key(self, key, count=1):
+        if key == "backspace":
+            self.screen = self.screen[:-count]
+        self.keystrokes += count
+
+
+@pytest.fixture
+def service():
+    service = TextInsertionService(get_default_config(), backend=FakeBackend())
+    service.start()
+    yield service
+    service.stop()
+
+
+@pytest.fixture
+def screen(service):
+    return service.backends.fixed
+
+
+def test_revision_keeps_common_prefix(service, screen):
+    service.revise_text("the cat sat")
+    service.wait_idle()
+    typed = screen.keystrokes
+    service.revise_text("the cat sang")
+    service.wait_idle()
+    assert screen.screen == "The cat sang"
+    assert screen.keystrokes - typed == 3  # One backspace, then "ng"
+
+
+def test_commit_replaces_hypothesis(service, screen):
+    service.revise_text("hello word")
+    service.commit_text("hello world")
+    service.revise_text("next one")
+    service.wait_idle()
+    assert screen.screen == "Hello world next one"
+
+
+def test_empty_revision_retracts_utterance(service, screen):
+    service.insert_text("first")
+    service.revise_text("draft")
+    service.revise_text("")
+    service.commit_text("second")
+    service.wait_idle()
+    assert screen.screen == "First second"
+
+
+def test_insert_text_closes_open_utterance(service, screen):
+    service.revise_text("kept as is")
+    service.insert_text("appended")
+    service.wait_idle()
+    assert screen.screen == "Kept as is appended"
+
+
+def test_buffer_backend_keeps_revised_text():
+    service = TextInsertionService(get_default_config(), backend=BufferBackend())
+    service.start()
+    service.revise_text("replayed dictation")
+    service.commit_text("replayed dictation works")
+    service.type_command("new_line")
+    service.stop()
+    assert service.backends.fixed.text == "Replayed dictation works\n"
+
+
+def only_available(monkeypatch, *names):
+    """Make only the named backends report themselves available, whatever the host has."""
+    for backend_class in (PynputBackend, XdotoolBackend, YdotoolBackend, UinputBackend):
+        available = backend_class.name in names
+        monkeypatch.setattr(backend_class, "is_available", lambda self, available=available: available)
+    monkeypatch.setattr(backends, "active_window_id", lambda: None)
+
+
+def test_selector_falls_back_to_an_available_backend(monkeypatch):
+    only_available(monkeypatch, "ydotool", "pynput")
+    config = get_default_config()
+    config["text_insertion"]["backend"] = "no-such-backend"
+    selector = BackendSelector(config)
+    backend = selector.select()
+    assert backend.name == "ydotool"  # The first available one in AUTO_ORDER
+    assert selector.select() is backend  # Cached for the window class
+
+
+def test_selector_drops_text_without_an_available_backend(monkeypatch):
+    only_available(monkeypatch)
+    selector = BackendSelector(get_default_config())
+    backend = selector.select()
+    assert isinstance(backend, NullBackend)
+    backend.type_text("lost")
+    assert "pynput" in selector.backends and selector.backends["pynput"].keyboard is None
+
+
+def test_uinput_backend_creates_its_fallback_on_first_use():
+    selector = BackendSelector(get_default_config())
+    selector.create("uinput")
+    assert "pynput" not in selector.backends  # pynput needs X, and uinput doesn't
+
+
+def test_selector_remembers_the_focused_window_briefly(monkeypatch):
+    lookups = []
+    classes = ["code", "xterm"]
+    monkeypatch.setattr(backends, "active_window_id", lambda: lookups.append(1) or "0x1")
+    monkeypatch.setattr(backends, "window_class", lambda window_id: classes[len(lookups) - 1])
+    selector = BackendSelector(get_default_config())
+    monkeypatch.setattr(selector, "_create", lambda name, klass: FakeBackend())
+    backend = selector.select()
+    assert selector.select() is backend and len(lookups) == 1
+
+    # X reuses the id of a closed window; the class is looked up again
+    selector.window_checked -= selector.window_lookup_s
+    assert selector.select() is not backend
+    assert len(lookups) == 2 and selector.window_class == "xterm"
+
+
+def test_clipboard_tool_returns_while_its_owner_keeps_running(tmp_path):
+    # Like xclip: read the text, then leave a child behind to serve the selection
+    tool = tmp_path / "clip"
+    tool.write_text("#!/bin/sh\ncat > /dev/null\nsleep 3 &\nexit 0\n")
+    tool.chmod(0o755)
+    start_time = time.monotonic()
+    _run_tool([str(tool)], input_text="hello")
+    assert time.monotonic() - start_time < 1.0
+
+
+def test_queued_fragments_are_coalesced(service, screen):
+    screen.gate.clear()
+    service.insert_text("held")
+    screen.typing.wait()  # The worker is now blocked typing "held"
+
+    service.revise_text("one")
+    service.revise_text("one two")
+    service.commit_text("one two three")
+    service.commit_text("period")
+    service.type_command("new_line")
+    screen.gate.set()
+    service.wait_idle()
+
+    assert screen.screen == "Held one two three."
+    assert screen.calls == 2  # "held", then everything queued behind it at once
+
+
+
+def test_full_queue_drops_revisions_without_blocking(service, screen):
+    service.queue_capacity = 2
+    screen.gate.clear()
+    service.insert_text("held")
+    screen.typing.wait()
+
+    service.revise_text("one")
+    service.commit_text("one")
+    service.revise_text("two")  # Dropped: the queue is at capacity
+    service.insert_text("two")  # Queued past capacity instead of waiting
+    assert service.queue_depth() == 3 and service.dropped_revisions == 1
+    screen.gate.set()
+    service.wait_idle()
+
+    assert screen.screen == "Held one two"
+
+def test_spoken_punctuation_inside_utterance(service, screen):
+    service.commit_text("hello comma world period")
+    service.commit_text("next sentence")
+    service.wait_idle()
+    assert screen.screen == "Hello, world. Next sentence"
+
+
+def test_longest_replacement_wins_and_is_verbatim():
+    config = get_default_config()
+    config["text_insertion"]["replacements"] = {"kitten": "cat", "kitten on keys": "kitten-on-keys"}
+    processor = TextPostProcessor(config)
+    assert processor.process("kitten on keys, not a kitten") == "kitten-on-keys, not a cat"
+
+
+def test_numbers_and_abbreviations_are_kept():
+    processor = TextPostProcessor(get_default_config())
+    assert processor.process("pi is 3.14, e.g. roughly. yes") == "Pi is 3.14, e.g. roughly. Yes"